@@ -2,30 +2,75 @@ from flask_bootstrap import Bootstrap
 from flask_mail import Mail
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from config import config
 from flask_login import LoginManager
 from flask import Flask
+import click
+from .cache import user_cache
+from .replicas import RoutingSession
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 
 # 工厂函数，通过 config 传参，可根据不同场景创建不同 app
-def create_app():
+def create_app(config_name='default'):
     app = Flask(__name__)
-    app.config.from_object(config['development'])
-    config['development'].init_app(app)
+    app.config.from_object(config[config_name])
+    config[config_name].init_app(app)
+
+    # 反向代理之后，按代理的层数信任 X-Forwarded-For 等请求头
+    if app.config.get('FLASKY_PROXY_FIX'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['FLASKY_PROXY_FIX']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    # 会话内容保存在服务器端，cookie 中只有会话 ID
+    if app.config.get('FLASKY_SERVER_SESSIONS'):
+        from .sessions import ServerSessionInterface
+        app.session_interface = ServerSessionInterface(app)
 
     bootstrap.init_app(app)
     mail.init_app(app)
     moment.init_app(app)
     db.init_app(app)
+    from .database import configure_engines
+    configure_engines(app)
     login_manager.init_app(app)
-    migrate = Migrate(app, db)
+    from .hotpaths import skip_user_loading
+    app.before_request(skip_user_loading)
+    user_cache.init_app(app)
+
+    from .email import dispatcher
+    dispatcher.init_app(app)
+
+    from .passwords import hasher
+    hasher.init_app(app)
+
+    from .ratelimit import limiter
+    limiter.init_app(app)
+
+    from .tokens import tokens
+    tokens.init_app(app)
+
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    from .pagecache import page_cache
+    page_cache.init_app(app)
+
+    from .fragments import fragment_cache
+    fragment_cache.init_app(app)
+
+    # Flask-Migrate（及其依赖的 alembic）只有 flask db 等命令行命令需要，
+    # 开启 FLASKY_LAZY_MIGRATE 时，不在命令行中运行（如 gunicorn 的 worker）就不导入
+    if not app.config.get('FLASKY_LAZY_MIGRATE') or \
+            click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -33,4 +78,16 @@ def create_app():
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
 
+    # 使用异步版本的注册、重发确认邮件、重置密码请求和修改邮箱视图
+    if app.config.get('FLASKY_ASYNC_VIEWS'):
+        from .auth.async_views import ASYNC_VIEWS
+        app.view_functions.update(ASYNC_VIEWS)
+
+    page_cache.prerender_errors(app)
+
+    # worker 启动时预热，命令行命令不需要
+    if app.config.get('FLASKY_WARMUP') and click.get_current_context(silent=True) is None:
+        from .warmup import warm_up
+        warm_up(app)
+
     return app
\ No newline at end of file
@@ -0,0 +1,153 @@
+import os
+import re
+import uuid
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+
+# 需要检查执行计划的语句类型
+_AUDITED = ('SELECT', 'UPDATE', 'DELETE')
+# 语句中的表别名（"FROM users AS users_1"）和限定列名（"users.role_id"）
+_ALIAS = re.compile(r'\b(\w+)\s+AS\s+(\w+)\b', re.I)
+_COLUMN = re.compile(r'\b(\w+)\.(\w+)\b')
+_WHERE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)', re.I | re.S)
+_JOIN_ON = re.compile(r'\bON\b(.*?)(?:\bLEFT\b|\bJOIN\b|\bWHERE\b|\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)',
+                      re.I | re.S)
+
+
+# 记录所有引擎执行过的语句（按语句文本去重），保留第一次执行时的参数用于 EXPLAIN
+class QueryRecorder:
+    def __init__(self):
+        self.queries = OrderedDict()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(_AUDITED):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        entry = self.queries.get(statement)
+        if entry is None:
+            self.queries[statement] = [parameters, 1]
+        else:
+            entry[1] += 1
+
+    def start(self):
+        event.listen(Engine, 'before_cursor_execute', self._record)
+
+    def stop(self):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# 执行计划中的每一行；SQLite 使用 EXPLAIN QUERY PLAN，其他数据库使用 EXPLAIN
+def explain(conn, statement, parameters):
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        return [row[-1] for row in rows]
+    rows = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).fetchall()
+    return [' '.join(str(v) for v in row) for row in rows]
+
+
+# 执行计划中全表扫描的表（或别名）：SQLite 的 "SCAN t"（不含使用索引的扫描），
+# PostgreSQL 的 "Seq Scan on t"，MySQL 的 type 为 ALL
+def full_scans(plan):
+    tables = []
+    for line in plan:
+        m = re.match(r'SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)', line)
+        if m and 'USING' not in m.group(3) and not line.startswith('SCAN CONSTANT ROW'):
+            tables.append(m.group(2) or m.group(1))
+            continue
+        m = re.search(r'Seq Scan on (\w+)', line)
+        if m:
+            tables.append(m.group(1))
+            continue
+        parts = line.split()
+        if len(parts) > 4 and parts[4] == 'ALL':
+            tables.append(parts[2])
+    return tables
+
+
+# 语句中 WHERE 和 JOIN ... ON 条件使用的、属于指定表（或其别名）的列
+def filter_columns(statement, table):
+    aliases = {alias: name for name, alias in _ALIAS.findall(statement)}
+    name = aliases.get(table, table)
+    conditions = ' '.join(_WHERE.findall(statement) + _JOIN_ON.findall(statement))
+    columns = []
+    for t, column in _COLUMN.findall(conditions):
+        if aliases.get(t, t) == name and column not in columns:
+            columns.append(column)
+    return aliases.get(table, table), columns
+
+
+# 表中已经作为索引第一列（或主键）的列
+def indexed_columns(engine, table):
+    insp = inspect(engine)
+    columns = set(insp.get_pk_constraint(table).get('constrained_columns') or [])
+    for index in insp.get_indexes(table):
+        if index['column_names']:
+            columns.add(index['column_names'][0])
+    for unique in insp.get_unique_constraints(table):
+        if unique['column_names']:
+            columns.add(unique['column_names'][0])
+    return columns
+
+
+# 检查记录的语句：返回每条语句的执行计划和全表扫描，以及建议添加的索引 [(表, 列), ...]
+# 没有过滤条件的全表扫描（如读取全部角色）无法用索引优化，只报告不建议
+def audit(engine, queries):
+    findings = []
+    proposals = []
+    with engine.connect() as conn:
+        for statement, (parameters, count) in queries.items():
+            try:
+                plan = explain(conn, statement, parameters)
+            except Exception:
+                # 审计数据库中不存在的表等，跳过
+                conn.rollback()
+                continue
+            scans = full_scans(plan)
+            finding = {'statement': statement, 'count': count, 'plan': plan,
+                       'scans': scans, 'proposals': []}
+            for scanned in scans:
+                table, columns = filter_columns(statement, scanned)
+                if not columns or not inspect(engine).has_table(table):
+                    continue
+                indexed = indexed_columns(engine, table)
+                for column in columns:
+                    if column not in indexed:
+                        finding['proposals'].append((table, column))
+                        if (table, column) not in proposals:
+                            proposals.append((table, column))
+            findings.append(finding)
+    return findings, proposals
+
+
+def index_name(table, column):
+    return 'ix_%s_%s' % (table, column)
+
+
+# 生成 Alembic 迁移脚本 upgrade() 和 downgrade() 中的语句
+def migration_ops(proposals):
+    upgrades = ['op.create_index(%r, %r, [%r], unique=False, if_not_exists=True)'
+                % (index_name(table, column), table, column) for table, column in proposals]
+    downgrades = ['op.drop_index(%r, table_name=%r, if_exists=True)'
+                  % (index_name(table, column), table) for table, column in reversed(proposals)]
+    return '\n    '.join(upgrades), '\n    '.join(downgrades)
+
+
+# 在 Flask-Migrate 的迁移目录中生成添加索引的迁移脚本，返回脚本路径
+# 索引使用 IF NOT EXISTS 创建，由 db.create_all() 建立、已有索引的数据库也能升级
+def write_migration(config, proposals, message='add missing indexes'):
+    from alembic.script import ScriptDirectory
+    script = ScriptDirectory.from_config(config)
+    os.makedirs(os.path.join(script.dir, 'versions'), exist_ok=True)
+    upgrades, downgrades = migration_ops(proposals)
+    revision = script.generate_revision(uuid.uuid4().hex[:12], message, head='head',
+                                        upgrades=upgrades, downgrades=downgrades)
+    return revision.path
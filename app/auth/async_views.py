@@ -0,0 +1,92 @@
+from flask import render_template, redirect, url_for, flash, abort
+from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+from .. import db
+from ..models import User
+from ..email import send_email_async
+from ..passwords import PasswordHasherBusy, hasher
+from ..ratelimit import rate_limit, form_email, session_user
+from .forms import RegistrationForm, PasswordResetRequestForm, ChangeEmailForm
+
+
+# views.py 中部分视图的异步版本：密码哈希放到线程池中计算，邮件入队不阻塞事件循环
+# 配置 FLASKY_ASYNC_VIEWS 后由 create_app 替换对应端点的视图函数（需要安装 asgiref）
+async def register():
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        try:
+            password_hash = await hasher.hash_async(form.password.data)
+        except PasswordHasherBusy:
+            abort(503)
+        user = User(email=form.email.data, username=form.username.data)
+        user.password_hash = password_hash
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            form.add_integrity_errors(e)
+            return render_template('auth/register.html', form=form)
+        token = user.generate_confirmation_token()
+        await send_email_async(user.email, 'Confirm Your Account',
+                               'auth/email/confirm', user=user, token=token)
+        flash(
+            'A confirmation email has been sent to you by email, please check your email to confirm your account.')
+        return redirect(url_for('auth.login'))
+    return render_template('auth/register.html', form=form)
+
+
+@rate_limit('confirm', account=session_user)
+@login_required
+async def resend_confirmation():
+    token = current_user.generate_confirmation_token()
+    await send_email_async(current_user.email, 'Confirm Your Account',
+                           'auth/email/confirm', user=current_user, token=token)
+    flash('A new confirmation email has been sent to you by email.')
+    return redirect(url_for('main.index'))
+
+
+@rate_limit('reset', account=form_email, methods=['POST'])
+async def password_reset_request():
+    if not current_user.is_anonymous:
+        return redirect(url_for('main.index'))
+    form = PasswordResetRequestForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data).first()
+        if user:
+            token = user.generate_reset_token()
+            await send_email_async(user.email, 'Reset Your Password',
+                                   'auth/email/reset_password',
+                                   user=user, token=token)
+        flash('An email with instructions to reset your password has been sent to you.')
+        return redirect(url_for('auth.login'))
+    return render_template('auth/reset_password.html', form=form)
+
+
+@login_required
+async def change_email_request():
+    form = ChangeEmailForm()
+    if form.validate_on_submit():
+        try:
+            verified = await hasher.verify_async(current_user.password_hash, form.password.data)
+        except PasswordHasherBusy:
+            abort(503)
+        if verified:
+            new_email = form.email.data
+            token = current_user.generate_email_change_token(new_email)
+            await send_email_async(new_email, 'Confirm your email address',
+                                   'auth/email/change_email',
+                                   user=current_user, token=token)
+            flash('An email with instructions to confirm your new email address has been sent to you.')
+            return redirect(url_for('main.index'))
+        else:
+            flash('Invalid email or password.')
+    return render_template('auth/change_email.html', form=form)
+
+
+ASYNC_VIEWS = {
+    'auth.register': register,
+    'auth.resend_confirmation': resend_confirmation,
+    'auth.password_reset_request': password_reset_request,
+    'auth.change_email_request': change_email_request,
+}
@@ -2,6 +2,7 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, Length, Email, Regexp, EqualTo
 from wtforms import ValidationError
+from .. import db
 from ..models import User
 
 class LoginForm(FlaskForm):
@@ -27,17 +28,29 @@ class RegistrationForm(FlaskForm):
     # 注册按钮
     submit = SubmitField('Register')
 
-    # 验证邮箱是否已注册
-    def validate_email(self, field):
-        if User.query.filter_by(email=field.data).first():
-            raise ValidationError('Email already registered.')
+    # 其他验证都通过后，用一次查询同时检查邮箱和用户名是否已被注册
+    def validate(self, extra_validators=None):
+        if not super(RegistrationForm, self).validate(extra_validators):
+            return False
+        rows = db.session.query(User.email, User.username).filter(
+            db.or_(User.email == self.email.data, User.username == self.username.data)).all()
+        for email, username in rows:
+            if email == self.email.data:
+                self.email.errors.append('Email already registered.')
+            if username == self.username.data:
+                self.username.errors.append('Username already in use.')
+        return not (self.email.errors or self.username.errors)
 
-    # 验证用户名是否已注册
-    def validate_username(self, field):
-        if User.query.filter_by(username=field.data).first():
-            raise ValidationError('Username already in use.')
+    # 并发注册时检查可能都通过，由数据库唯一索引兜底，把 IntegrityError 转换为字段错误
+    def add_integrity_errors(self, error):
+        message = str(error.orig).lower()
+        if 'username' in message:
+            self.username.errors.append('Username already in use.')
+        else:
+            self.email.errors.append('Email already registered.')
         
 
+
 class ChangePasswordForm(FlaskForm):
     old_password = PasswordField('Old password', validators=[DataRequired()])
     password = PasswordField(
@@ -1,9 +1,13 @@
-from flask import render_template, redirect, request, url_for, flash
+from flask import render_template, redirect, request, url_for, flash, abort
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from . import auth
 from .. import db
 from ..models import User
 from ..email import send_email
+from ..hotpaths import PAGE, request_class
+from ..passwords import PasswordHasherBusy
+from ..ratelimit import rate_limit, record_failure, form_email, session_user
 from .forms import LoginForm, RegistrationForm, ChangePasswordForm, \
     PasswordResetRequestForm, PasswordResetForm, ChangeEmailForm
 
@@ -12,13 +16,13 @@ from .forms import LoginForm, RegistrationForm, ChangePasswordForm, \
 # 允许未确认的用户登录，但只显示一个页面，并提示用户确认账户
 @auth.before_app_request
 def before_request():
-    # 未确认的用户重定向到确认页面，用户已登录，但未确认账户，请求不是来自 auth 蓝图，请求不是静态文件
-    if current_user.is_authenticated \
-                and not current_user.confirmed \
-                and request.endpoint \
-                and request.blueprint != 'auth' \
-                and request.endpoint != 'static':
-            return redirect(url_for('auth.unconfirmed'))
+    # 未确认的用户重定向到确认页面：只检查普通页面且不是 auth 蓝图的请求，
+    # 先做这些不需要数据库的判断，最后才读取 current_user
+    if request_class() == PAGE \
+            and request.blueprint != 'auth' \
+            and current_user.is_authenticated \
+            and not current_user.confirmed:
+        return redirect(url_for('auth.unconfirmed'))
 
 
 @auth.route('/unconfirmed')
@@ -29,12 +33,20 @@ def unconfirmed():
 
 
 @auth.route('/login', methods=['GET', 'POST'])
+@rate_limit('login', account=form_email, methods=['POST'], failures_only=True)
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        # 验证用户存在且密码正确
-        if user is not None and user.verify_password(form.password.data):
+        # 验证用户存在且密码正确，哈希任务排队过多时直接返回 503
+        try:
+            verified = user is not None and user.verify_password(form.password.data)
+        except PasswordHasherBusy:
+            abort(503)
+        if verified:
+            # 密码哈希参数过时会在验证时重新计算，需要保存
+            if user in db.session.dirty:
+                db.session.commit()
             # 登入用户
             login_user(user, form.remember_me.data)  # form.remember_me.data为 False，则下次需要重新登录，为 True 则通过 cookie 保存登录信息
             # 原 URL 保存在查询字符串的 next 参数中，可从 request.args 字典中读取
@@ -44,6 +56,7 @@ def login():
                 next = url_for('main.index')
             # next 参数正常则重定向到目标URL
             return redirect(next)
+        record_failure('login', form_email())
         flash('Invalid email or password.')
     return render_template('auth/login.html', form=form)
 
@@ -60,11 +73,20 @@ def logout():
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
-        user = User(email=form.email.data,
-                    username=form.username.data,
-                    password=form.password.data)
+        # 哈希任务排队过多时直接返回 503（与 login 相同）
+        try:
+            user = User(email=form.email.data,
+                        username=form.username.data,
+                        password=form.password.data)
+        except PasswordHasherBusy:
+            abort(503)
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            form.add_integrity_errors(e)
+            return render_template('auth/register.html', form=form)
         # 生成确认令牌
         token = user.generate_confirmation_token()
         # 发送确认邮件, 邮件地址，邮件主题，邮件模板，模板参数
@@ -77,6 +99,7 @@ def register():
 
 
 @auth.route('/confirm/<token>')
+@rate_limit('confirm', account=session_user)
 @login_required
 def confirm(token):
     # 检查已登录用户是否已确认账户，直接重定向到主页
@@ -92,6 +115,7 @@ def confirm(token):
 
 
 @auth.route('/confirm')
+@rate_limit('confirm', account=session_user)
 @login_required
 def resend_confirmation():
     token = current_user.generate_confirmation_token()
@@ -107,8 +131,13 @@ def change_password():
     form = ChangePasswordForm()
     if form.validate_on_submit():
         # 验证旧密码是否正确
-        if current_user.verify_password(form.old_password.data):
-            current_user.password = form.password.data
+        try:
+            verified = current_user.verify_password(form.old_password.data)
+            if verified:
+                current_user.password = form.password.data
+        except PasswordHasherBusy:
+            abort(503)
+        if verified:
             db.session.add(current_user)
             db.session.commit()
             flash('Your password has been updated.')
@@ -119,6 +148,7 @@ def change_password():
 
 
 @auth.route('/reset', methods=['GET', 'POST'])
+@rate_limit('reset', account=form_email, methods=['POST'])
 def password_reset_request():
     # is_anonymous 用于判断用户是否未登录
     if not current_user.is_anonymous:
@@ -138,12 +168,17 @@ def password_reset_request():
 
 
 @auth.route('/reset/<token>', methods=['GET', 'POST'])
+@rate_limit('reset', methods=['POST'])
 def password_reset(token):
     if not current_user.is_anonymous:
         return redirect(url_for('main.index'))
     form = PasswordResetForm()
     if form.validate_on_submit():
-        if User.reset_password(token, form.password.data):
+        try:
+            reset = User.reset_password(token, form.password.data)
+        except PasswordHasherBusy:
+            abort(503)
+        if reset:
             db.session.commit()
             flash('Your password has been updated.')
             return redirect(url_for('auth.login'))
@@ -157,7 +192,11 @@ def password_reset(token):
 def change_email_request():
     form = ChangeEmailForm()
     if form.validate_on_submit():
-        if current_user.verify_password(form.password.data):
+        try:
+            verified = current_user.verify_password(form.password.data)
+        except PasswordHasherBusy:
+            abort(503)
+        if verified:
             new_email = form.email.data
             token = current_user.generate_email_change_token(new_email)
             send_email(new_email, 'Confirm your email address',
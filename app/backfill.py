@@ -0,0 +1,195 @@
+import math
+import time
+from contextlib import contextmanager
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+from . import db
+from .models import utcnow
+
+# 回填进度：每个回填任务一行，记录已处理到的主键，中断后从这里继续。
+# 与模型在同一个 MetaData 中，由 db.create_all() 或迁移 8e3f6a2d7c15 创建，
+# autogenerate 不会把它当作多余的表；更早创建的数据库在第一次运行回填时自动创建
+checkpoints = sa.Table(
+    'backfill_checkpoints', db.metadata,
+    sa.Column('name', sa.String(128), primary_key=True),
+    sa.Column('last_key', sa.Integer),
+    sa.Column('rows', sa.Integer, nullable=False, default=0),
+    sa.Column('done', sa.Boolean, nullable=False, default=False),
+    sa.Column('updated_at', sa.DateTime))
+
+# 名称到回填任务的映射，迁移脚本和 flask backfill 命令按名称运行
+BACKFILLS = {}
+
+
+def register(backfill):
+    BACKFILLS[backfill.name] = backfill
+    return backfill
+
+
+# 回填中断（例如 progress 回调要求停止）时抛出，已完成的批次和检查点都已提交
+class BackfillInterrupted(Exception):
+    pass
+
+
+def _config(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+
+# bind 可以是 Engine 或不在事务中的 Connection，每批使用一个新事务；
+# 迁移脚本中（见 run_in_migration）连接处于自动提交模式，每条语句单独提交
+@contextmanager
+def _transaction(bind):
+    if isinstance(bind, sa.engine.Engine):
+        with bind.begin() as conn:
+            yield conn
+    elif bind.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+        yield bind
+    else:
+        with bind.begin():
+            yield bind
+
+
+# 分批回填：按主键顺序每次处理 batch_size 行，每批一个短事务，只锁住这一批行，
+# 批次之间暂停 pause 秒，给正常请求让出数据库。
+# values 为 UPDATE 的 SET 部分（字典，或每次运行时调用、返回字典的函数），
+# where 为需要回填的行的条件，table 可以用 sa.table() 定义，只包含用到的列
+class Backfill:
+    def __init__(self, name, table, values, where=None, key='id', batch_size=None, pause=None):
+        self.name = name
+        self.table = table
+        self.values = values
+        self.where = where
+        self.key = table.c[key]
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def _options(self, batch_size, pause):
+        if batch_size is None:
+            batch_size = self.batch_size or _config('BACKFILL_BATCH_SIZE', 1000)
+        if pause is None:
+            pause = self.pause if self.pause is not None else _config('BACKFILL_PAUSE', 0.0)
+        return batch_size, pause
+
+    def _condition(self, after):
+        condition = sa.true() if self.where is None else self.where
+        if after is not None:
+            condition = sa.and_(self.key > after, condition)
+        return condition
+
+    def _next_keys(self, conn, after, batch_size):
+        return conn.execute(sa.select(self.key).where(self._condition(after))
+                            .order_by(self.key).limit(batch_size)).scalars().all()
+
+    # 更新一批行，条件中仍包含 where，期间被其他请求修改过的行不会被覆盖
+    def _update(self, conn, keys, values):
+        return conn.execute(sa.update(self.table).where(
+            self.key.between(keys[0], keys[-1]), self._condition(None)).values(values)).rowcount
+
+    def pending(self, conn, after=None):
+        return conn.execute(sa.select(sa.func.count()).select_from(self.table)
+                            .where(self._condition(after))).scalar()
+
+    def checkpoint(self, conn):
+        checkpoints.create(conn, checkfirst=True)
+        return conn.execute(sa.select(checkpoints).where(checkpoints.c.name == self.name)).first()
+
+    def _save(self, conn, **values):
+        values['updated_at'] = utcnow()
+        conn.execute(checkpoints.update().where(checkpoints.c.name == self.name).values(values))
+
+    # 运行回填，返回 {'rows', 'batches', 'seconds', 'resumed_from'}
+    # 已完成的回填直接返回，restart 为 True 时忽略检查点从头开始；
+    # progress(rows, batches) 在每批提交后调用，返回 False 时中断，下次运行从中断处继续
+    def run(self, bind, batch_size=None, pause=None, restart=False, progress=None):
+        batch_size, pause = self._options(batch_size, pause)
+        start = time.perf_counter()
+        with _transaction(bind) as conn:
+            state = self.checkpoint(conn)
+            if state is None:
+                conn.execute(checkpoints.insert().values(name=self.name, rows=0, done=False,
+                                                         updated_at=utcnow()))
+            elif restart:
+                self._save(conn, last_key=None, rows=0, done=False)
+                state = None
+        if state is not None and state.done:
+            return {'rows': 0, 'batches': 0, 'seconds': 0.0, 'resumed_from': state.last_key}
+        last_key = resumed_from = None if state is None else state.last_key
+        total = 0 if state is None else state.rows
+        values = self.values() if callable(self.values) else self.values
+        rows = batches = 0
+        while True:
+            with _transaction(bind) as conn:
+                keys = self._next_keys(conn, last_key, batch_size)
+                if not keys:
+                    self._save(conn, done=True)
+                    break
+                count = self._update(conn, keys, values)
+                last_key = keys[-1]
+                rows += count
+                total += count
+                batches += 1
+                # 检查点与这一批的更新在同一个事务中提交（自动提交模式下检查点在更新之后写入，
+                # 中断时最多重复更新一批，where 条件保证结果相同）
+                self._save(conn, last_key=last_key, rows=total)
+            if progress is not None and progress(rows, batches) is False:
+                raise BackfillInterrupted('%s interrupted after key %r' % (self.name, last_key))
+            if pause:
+                time.sleep(pause)
+        return {'rows': rows, 'batches': batches, 'seconds': time.perf_counter() - start,
+                'resumed_from': resumed_from}
+
+    # 预估回填耗时：统计剩余行数，在事务中实际执行一批后回滚，按这一批的耗时和暂停时间推算，
+    # 不修改任何数据。bind 必须是 Engine 或非自动提交的 Connection
+    def estimate(self, bind, batch_size=None, pause=None):
+        batch_size, pause = self._options(batch_size, pause)
+        conn = bind.connect() if isinstance(bind, sa.engine.Engine) else bind
+        try:
+            state = None
+            if sa.inspect(conn).has_table(checkpoints.name):
+                state = conn.execute(sa.select(checkpoints)
+                                     .where(checkpoints.c.name == self.name)).first()
+            if conn.in_transaction():
+                conn.rollback()
+            if state is not None and state.done:
+                return {'rows': 0, 'batches': 0, 'batch_seconds': 0.0, 'seconds': 0.0}
+            after = None if state is None else state.last_key
+            trans = conn.begin()
+            try:
+                rows = self.pending(conn, after)
+                t = time.perf_counter()
+                keys = self._next_keys(conn, after, batch_size)
+                if keys:
+                    values = self.values() if callable(self.values) else self.values
+                    self._update(conn, keys, values)
+                batch_seconds = time.perf_counter() - t
+            finally:
+                trans.rollback()
+        finally:
+            if conn is not bind:
+                conn.close()
+        batches = math.ceil(rows / batch_size)
+        return {'rows': rows, 'batches': batches, 'batch_seconds': batch_seconds,
+                'seconds': batches * batch_seconds + max(batches - 1, 0) * pause}
+
+
+# 在迁移脚本的 upgrade() 中运行回填。此前的结构变更先提交，回填的每一批单独提交，
+# 不会在迁移的事务中长时间锁表（需要 env.py 中的 transaction_per_migration）；
+# 生成 SQL 脚本（flask db upgrade --sql）时输出一条完整的 UPDATE
+def run_in_migration(name, **kwargs):
+    from alembic import op
+    backfill = BACKFILLS[name]
+    if op.get_context().as_sql:
+        values = backfill.values() if callable(backfill.values) else backfill.values
+        op.execute(sa.update(backfill.table).where(backfill._condition(None)).values(values))
+        return None
+    with op.get_context().autocommit_block():
+        return backfill.run(op.get_bind(), **kwargs)
+
+
+_users = sa.table('users', sa.column('id', sa.Integer), sa.column('member_since', sa.DateTime))
+
+# 添加 users.member_since 之前注册的用户没有注册时间，从回填时开始计算
+register(Backfill('users_member_since', _users, lambda: {'member_since': utcnow()},
+                  where=_users.c.member_since.is_(None)))
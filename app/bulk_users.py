@@ -0,0 +1,134 @@
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from flask import current_app
+from werkzeug.security import generate_password_hash
+from . import db
+from .models import User, Role, Permission
+
+EXPORT_FIELDS = ['email', 'username', 'role', 'confirmed']
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ['true', 'on', '1', 'yes']
+
+
+# 逐行读取 CSV 或 JSONL 文件，不会一次性把整个文件读入内存
+def read_rows(f, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# 进度报告：每处理完一批调用一次，输出累计行数和速率
+class Progress:
+    def __init__(self, report):
+        self.report = report
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def update(self, n):
+        self.rows += n
+        if self.report is not None:
+            self.report(self.rows, self.rate)
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.rows / elapsed if elapsed else 0.0
+
+
+# 批量导入用户：角色只查询一次，密码在多个进程中并行计算哈希，
+# 每批用一条 executemany 的 INSERT 写入并提交，内存占用与文件大小无关
+def import_users(f, fmt='csv', batch_size=1000, processes=None, report=None):
+    app = current_app._get_current_object()
+    roles = {r.name: r for r in Role.query.all()}
+    default_role = next((r for r in roles.values() if r.default), None)
+    admin_role = next((r for r in roles.values() if r.permissions & Permission.ADMIN), None)
+    hash_password = partial(generate_password_hash,
+                            method=app.config['PASSWORD_HASH_METHOD'],
+                            salt_length=app.config['PASSWORD_SALT_LENGTH'])
+    table = User.__table__
+    processes = processes or os.cpu_count() or 1
+    progress = Progress(report)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for chunk in chunked(read_rows(f, fmt), batch_size):
+            passwords = []
+            for i, row in enumerate(chunk):
+                if not row.get('password_hash'):
+                    if not row.get('password'):
+                        raise ValueError('row %d has neither password nor password_hash'
+                                         % (progress.rows + i + 1))
+                    passwords.append(row['password'])
+            hashes = iter(pool.map(hash_password, passwords,
+                                   chunksize=max(1, len(passwords) // (processes * 4))))
+            records = []
+            for row in chunk:
+                role = roles.get(row.get('role'))
+                if role is None and row.get('email') and row.get('email') == app.config['FLASKY_ADMIN']:
+                    role = admin_role
+                if role is None:
+                    role = default_role
+                records.append({
+                    'email': row.get('email'),
+                    'username': row.get('username'),
+                    'role_id': role.id if role is not None else None,
+                    'password_hash': row.get('password_hash') or next(hashes),
+                    'confirmed': _parse_bool(row.get('confirmed', False)),
+                })
+            db.session.execute(table.insert(), records)
+            db.session.commit()
+            progress.update(len(records))
+    return progress
+
+
+# 分批查询并逐行写出用户，角色名称预先加载，不逐行查询 roles 表
+def export_users(f, fmt='csv', batch_size=1000, with_hashes=False, report=None):
+    role_names = {r.id: r.name for r in Role.query.all()}
+    fields = EXPORT_FIELDS + (['password_hash'] if with_hashes else [])
+    columns = [User.id, User.email, User.username, User.role_id, User.confirmed]
+    if with_hashes:
+        columns.append(User.password_hash)
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(record):
+            f.write(json.dumps(record) + '\n')
+    progress = Progress(report)
+    last_id = 0
+    # 按主键分页，避免 OFFSET 越往后越慢
+    while True:
+        rows = db.session.execute(db.select(*columns).where(User.id > last_id)
+                                  .order_by(User.id).limit(batch_size)).all()
+        if not rows:
+            break
+        for row in rows:
+            record = {'email': row.email, 'username': row.username,
+                      'role': role_names.get(row.role_id), 'confirmed': bool(row.confirmed)}
+            if with_hashes:
+                record['password_hash'] = row.password_hash
+            write(record)
+        last_id = rows[-1].id
+        progress.update(len(rows))
+    return progress
@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+# 进程内缓存：按最近使用顺序淘汰（LRU），并为每个条目设置过期时间（TTL）
+class LocalCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# 缓存 load_user 加载的用户及其角色，避免每个请求都查询 users 和 roles 两张表
+# 缓存的值是只包含列数据的普通字典，因此可以换成多进程共享的后端（如 Redis），
+# 只要后端对象实现 get/set/delete/clear 四个方法即可，通过 USER_CACHE_BACKEND 配置
+class UserCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.enabled = False
+        self.version_ttl = 1.0
+        self._version = None
+        self._version_expires = 0.0
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('USER_CACHE_ENABLED', True)
+        backend = app.config.get('USER_CACHE_BACKEND')
+        # 配置项可以是后端实例，也可以是返回后端实例的工厂函数
+        if callable(backend):
+            backend = backend(app)
+        if backend is None:
+            backend = LocalCache(maxsize=app.config.get('USER_CACHE_SIZE', 1024),
+                                 ttl=app.config.get('USER_CACHE_TTL', 60))
+        self.backend = backend
+        self.version_ttl = app.config.get('USER_CACHE_VERSION_TTL', 1.0)
+        self._version = None
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+        app.extensions['user_cache'] = self
+
+    @staticmethod
+    def _key(user_id):
+        return 'user:%s' % user_id
+
+    def get(self, user_id):
+        if not self.enabled:
+            return None
+        value = self.backend.get(self._key(user_id))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, user_id, value):
+        if self.enabled:
+            self.backend.set(self._key(user_id), value)
+
+    # 用户数据发生变化时调用，删除对应的缓存条目
+    def invalidate(self, user_id):
+        if self.backend is not None and user_id is not None:
+            self.backend.delete(self._key(user_id))
+
+    # 初始化时和 insert_roles 之后清空
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    # 角色版本号：保存在数据库中（见 models.CacheVersion），角色或用户的角色变化时在同一个事务中加一，
+    # 所有进程都能看到。进程内最多缓存 USER_CACHE_VERSION_TTL 秒，缓存的用户、角色注册表和
+    # 会话中的权限掩码与当前版本号不一致时都视为过期
+    @property
+    def role_version(self):
+        now = time.monotonic()
+        if self._version is None or now >= self._version_expires:
+            from .models import CacheVersion
+            self._version = CacheVersion.get('roles')
+            self._version_expires = now + self.version_ttl
+        return self._version
+
+    # 版本号变化的事务提交后调用：本进程立即读取新的版本号，旧版本的缓存条目不再使用
+    def role_version_changed(self):
+        self._version = None
+
+    # 缓存命中率，没有任何访问时为 0
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hit_ratio}
+
+
+user_cache = UserCache()
@@ -0,0 +1,24 @@
+from sqlalchemy import event
+from . import db
+
+
+def _set_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        cursor.close()
+    return on_connect
+
+
+# 为应用的 SQLite 引擎注册连接事件，在每个新连接上执行 SQLITE_PRAGMAS
+# 内存数据库不支持 WAL，跳过
+def configure_engines(app):
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+                continue
+            event.listen(engine, 'connect', _set_pragmas(pragmas))
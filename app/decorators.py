@@ -1,15 +1,43 @@
 from functools import wraps  # 保留原函数的元信息
-from flask import abort  # 用于返回HTTP错误响应
+from flask import abort, current_app, session  # 用于返回HTTP错误响应
 from flask_login import current_user
+from .cache import user_cache
 from .models import Permission
 
 
+# 会话中保存 [用户 ID, 角色权限值, 角色版本号]，用户或版本号不一致时视为失效
+def session_permissions():
+    mask = session.get('_perms')
+    if mask is None or mask[0] != session.get('_user_id') \
+            or mask[2] != user_cache.role_version:
+        return None
+    return mask[1]
+
+
+def remember_permissions(user):
+    role = user.role
+    session['_perms'] = [str(user.id), 0 if role is None else role.permissions,
+                         user_cache.role_version]
+
+
+# 用户已被删除时 load_user 返回 None，current_user 为匿名用户，会话中的掩码不再使用；
+# load_user 有缓存，这次检查不需要查询数据库
+def user_can(permission):
+    if current_app.config.get('FLASKY_SESSION_PERMISSIONS') and current_user.is_authenticated:
+        mask = session_permissions()
+        if mask is not None:
+            return mask & permission == permission
+        # 掩码缺失或已失效，按原方式检查一次并把结果写入会话
+        remember_permissions(current_user)
+    return current_user.can(permission)
+
+
 def permission_required(permission):
     def decorator(f):  # 接收原函数作为参数
         @wraps(f)  # 保留原函数的元信息
         def decorated_function(*args, **kwargs):  # 接收任意参数
             # 如果当前用户没有权限访问，则返回HTTP 403 Forbidden响应
-            if not current_user.can(permission):
+            if not user_can(permission):
                 abort(403)
             return f(*args, **kwargs)
         return decorated_function  # 返回装饰后的函数
@@ -17,4 +45,4 @@ def permission_required(permission):
 
 
 def admin_required(f):
-    return permission_required(Permission.ADMIN)(f)
\ No newline at end of file
+    return permission_required(Permission.ADMIN)(f)
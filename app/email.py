@@ -1,21 +1,310 @@
-from threading import Thread
-from flask import current_app, render_template
+import asyncio
+import atexit
+import os
+import pickle
+import queue
+import smtplib
+import time
+import uuid
+from threading import Lock, Thread
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from flask import current_app, has_request_context, url_for
 from flask_mail import Message
 from . import mail
+from .metrics import metrics
 
 
-# 定义上下文供 mail 调用
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+# 邮件模板缓存：模板只编译一次，渲染时不经过 render_template，
+# 也不需要请求上下文，因此可以放到后台邮件线程中执行
+class EmailTemplates:
+    def __init__(self, app):
+        self.app = app
+        self._templates = {}
+        self._adapters = {}
 
+    def get(self, name):
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = self.app.jinja_env.get_template(name)
+        return template
 
-def send_email(to, subject, template, **kwargs):
+    # 根据站点根地址生成绝对 URL，邮件中的链接都是 _external 的
+    def url_for(self, base_url):
+        adapter = self._adapters.get(base_url)
+        if adapter is None:
+            parts = urlsplit(base_url)
+            adapter = self._adapters[base_url] = self.app.url_map.bind(
+                parts.netloc, script_name=parts.path or '/', url_scheme=parts.scheme)
+
+        def url_for(endpoint, _external=True, **values):
+            return adapter.build(endpoint, values, force_external=True)
+        return url_for
+
+    # 渲染 .txt 和 .html 两个版本，模板中的 url_for 由上下文变量覆盖
+    def render(self, template, base_url, **context):
+        context['url_for'] = self.url_for(base_url)
+        return (self.get(template + '.txt').render(context),
+                self.get(template + '.html').render(context))
+
+
+# 站点根地址：请求中由 url_for 生成（包含应用挂载的路径 script_root），
+# 否则使用 FLASKY_MAIL_BASE_URL 或 SERVER_NAME
+def mail_base_url(app):
+    if has_request_context():
+        return url_for('main.index', _external=True)
+    base_url = app.config.get('FLASKY_MAIL_BASE_URL')
+    if base_url:
+        return base_url
+    return '%s://%s/' % (app.config['PREFERRED_URL_SCHEME'],
+                         app.config.get('SERVER_NAME') or 'localhost')
+
+
+# 邮件模板中可以使用的模型属性。排队的邮件可能被写入磁盘（spill 策略），
+# 不能带上 password_hash 等其他列
+SNAPSHOT_ATTRS = ('id', 'username', 'email')
+
+
+# 把模板参数中的数据库模型对象转换为只含 SNAPSHOT_ATTRS 的简单对象，
+# 后台线程渲染时不会再访问请求线程的数据库会话
+def snapshot_context(context):
+    result = {}
+    for key, value in context.items():
+        mapper = getattr(type(value), '__mapper__', None)
+        if mapper is not None:
+            value = SimpleNamespace(**{attr: getattr(value, attr) for attr in SNAPSHOT_ATTRS
+                                       if attr in mapper.attrs})
+        result[key] = value
+    return result
+
+
+# 邮件分发器：固定数量的后台线程从有界队列中取出邮件发送，
+# 每个线程保持一条 SMTP 连接并复用它发送多封邮件，取代每封邮件一个线程、一次握手的做法
+class MailDispatcher:
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._workers = []
+        self._lock = Lock()
+        self._metrics_lock = Lock()
+        self.metrics = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.shutdown()
+        self.app = app
+        self.workers = app.config.get('MAIL_WORKERS', 2)
+        # 队列满时的处理策略：block 阻塞等待（背压），drop 丢弃，spill 写入磁盘目录稍后重新入队
+        self.policy = app.config.get('MAIL_QUEUE_POLICY', 'block')
+        self.put_timeout = app.config.get('MAIL_QUEUE_TIMEOUT', 1.0)
+        self.spill_dir = app.config.get('MAIL_SPILL_DIR')
+        self.max_retries = app.config.get('MAIL_MAX_RETRIES', 3)
+        self.backoff = app.config.get('MAIL_RETRY_BACKOFF', 0.5)
+        # 连接空闲超过该秒数后关闭，避免被 SMTP 服务器断开
+        self.idle_timeout = app.config.get('MAIL_IDLE_TIMEOUT', 30)
+        self._queue = queue.Queue(maxsize=app.config.get('MAIL_QUEUE_SIZE', 100))
+        self.metrics = dict(enqueued=0, sent=0, failed=0, dropped=0, spilled=0,
+                            retries=0, connections=0, latency_total=0.0, latency_max=0.0)
+        self.templates = EmailTemplates(app)
+        app.extensions['mail_dispatcher'] = self
+
+    # 首次发送时才启动后台线程，命令行命令等不发邮件的场景不会创建线程；本次调用启动了线程时返回 True
+    def _start(self):
+        with self._lock:
+            if self._workers:
+                return False
+            for i in range(self.workers):
+                thr = Thread(target=self._worker, name='mail-worker-%d' % i, daemon=True)
+                thr.start()
+                self._workers.append(thr)
+        return True
+
+    def _count(self, name, value=1):
+        with self._metrics_lock:
+            self.metrics[name] += value
+
+    def submit(self, msg):
+        # 启动时先把之前溢出到磁盘的邮件放回队列
+        if self._start():
+            self.requeue_spilled()
+        item = (msg, time.monotonic())
+        try:
+            if self.policy == 'block':
+                self._queue.put(item, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.policy == 'spill' and self.spill_dir:
+                self._spill(msg)
+                self._count('spilled')
+            else:
+                self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _spill(self, msg):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, uuid.uuid4().hex + '.msg')
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(msg, f)
+        os.replace(path + '.tmp', path)
+
+    # 把溢出到磁盘的邮件重新放回队列，返回重新入队的数量。队列再次满时停止，剩下的留到下次。
+    # 分发器启动时、flask mail-requeue 命令和定时任务 requeue_mail 都会调用；
+    # 多个进程共用溢出目录时，先把文件改名认领，同一封邮件只会被一个进程放回队列
+    def requeue_spilled(self):
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return 0
+        self._start()
+        count = 0
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith('.msg'):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            claimed = '%s.%d.claimed' % (path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, 'rb') as f:
+                msg = pickle.load(f)
+            try:
+                self._queue.put_nowait((msg, time.monotonic()))
+            except queue.Full:
+                os.rename(claimed, path)
+                break
+            os.remove(claimed)
+            self._count('enqueued')
+            count += 1
+        return count
+
+    def _worker(self):
+        with self.app.app_context():
+            conn = None
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    conn = self._close(conn)
+                    continue
+                if item is None:
+                    self._close(conn)
+                    self._queue.task_done()
+                    return
+                msg, queued_at = item
+                try:
+                    self._render(msg)
+                    conn = self._deliver(conn, msg)
+                    latency = time.monotonic() - queued_at
+                    with self._metrics_lock:
+                        self.metrics['sent'] += 1
+                        self.metrics['latency_total'] += latency
+                        self.metrics['latency_max'] = max(self.metrics['latency_max'], latency)
+                except Exception:
+                    conn = self._close(conn)
+                    self._count('failed')
+                    current_app.logger.exception('Failed to send email to %s', msg.recipients)
+                finally:
+                    self._queue.task_done()
+
+    # 尚未渲染的邮件在后台线程中渲染正文
+    def _render(self, msg):
+        pending = getattr(msg, 'pending_render', None)
+        if pending is not None:
+            template, base_url, context = pending
+            msg.body, msg.html = self.templates.render(template, base_url, **context)
+            msg.pending_render = None
+
+    # 发送失败时关闭连接并按指数退避重试
+    def _deliver(self, conn, msg):
+        attempt = 0
+        while True:
+            try:
+                if conn is None:
+                    conn = mail.connect().__enter__()
+                    self._count('connections')
+                conn.send(msg)
+                return conn
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                    smtplib.SMTPResponseException, OSError) as e:
+                conn = self._close(conn)
+                # 5xx 是永久性错误，重试没有意义
+                permanent = isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500
+                if permanent or attempt >= self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    @staticmethod
+    def _close(conn):
+        if conn is not None:
+            try:
+                conn.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
+
+    # 等待队列中的邮件全部处理完
+    def join(self):
+        if self._queue is not None:
+            self._queue.join()
+
+    def shutdown(self):
+        with self._lock:
+            for _ in self._workers:
+                self._queue.put(None)
+            for thr in self._workers:
+                thr.join()
+            self._workers = []
+
+    # 就绪检查：队列未满，且已启动的后台线程都在运行
+    def ready(self):
+        if self._queue is None or self._queue.full():
+            return False
+        return all(thr.is_alive() for thr in self._workers)
+
+    def stats(self):
+        with self._metrics_lock:
+            stats = dict(self.metrics)
+        stats['queue_depth'] = self._queue.qsize() if self._queue is not None else 0
+        stats['latency_avg'] = stats['latency_total'] / stats['sent'] if stats['sent'] else 0.0
+        return stats
+
+
+dispatcher = MailDispatcher()
+# 进程退出前把队列中剩余的邮件发送完
+atexit.register(dispatcher.shutdown)
+
+
+def build_message(to, subject, template, **kwargs):
     app = current_app._get_current_object()
     msg = Message(app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
                   sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
-    msg.body = render_template(template + '.txt', **kwargs)
-    msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
\ No newline at end of file
+    base_url = mail_base_url(app)
+    if app.config.get('MAIL_RENDER_IN_WORKER'):
+        msg.pending_render = (template, base_url, snapshot_context(kwargs))
+    else:
+        msg.body, msg.html = dispatcher.templates.render(template, base_url, **kwargs)
+    return msg
+
+
+def send_email(to, subject, template, **kwargs):
+    start = time.perf_counter()
+    queued = dispatcher.submit(build_message(to, subject, template, **kwargs))
+    metrics.observe_mail_enqueue(time.perf_counter() - start)
+    return queued
+
+
+# 异步视图使用：队列满时 block 策略会等待，放到线程中执行以免阻塞事件循环
+async def send_email_async(to, subject, template, **kwargs):
+    start = time.perf_counter()
+    msg = build_message(to, subject, template, **kwargs)
+    if dispatcher.policy == 'block':
+        queued = await asyncio.to_thread(dispatcher.submit, msg)
+    else:
+        queued = dispatcher.submit(msg)
+    metrics.observe_mail_enqueue(time.perf_counter() - start)
+    return queued
@@ -0,0 +1,89 @@
+from flask import current_app, has_request_context, request
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from .cache import LocalCache
+
+
+# 模板片段缓存：{% cache 'navbar', permission_class() %} ... {% endcache %}
+# 片段按名称和键缓存渲染结果（LRU + TTL），键中只能包含片段实际依赖的数据，
+# 例如导航栏只依赖登录状态、确认状态和权限，因此每类权限只渲染一次
+class FragmentCache:
+    def __init__(self, app=None):
+        self.cache = None
+        self.enabled = False
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', True)
+        self.cache = LocalCache(maxsize=app.config.get('FRAGMENT_CACHE_SIZE', 256),
+                                ttl=app.config.get('FRAGMENT_CACHE_TTL', 3600))
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.globals['permission_class'] = permission_class
+        app.extensions['fragment_cache'] = self
+
+    def render(self, name, key, caller):
+        if not self.enabled:
+            return caller()
+        # 同一应用挂载在不同路径下时，片段中 url_for 生成的链接不同
+        script_root = request.script_root if has_request_context() else ''
+        full_key = (name, self._generations.get(name, 0), script_root) + tuple(key)
+        value = self.cache.get(full_key)
+        if value is None:
+            self.misses += 1
+            value = caller()
+            self.cache.set(full_key, value)
+        else:
+            self.hits += 1
+        return value
+
+    # 使某个片段的全部缓存失效：旧条目不再被访问，之后按 LRU 淘汰
+    def invalidate(self, name):
+        self._generations[name] = self._generations.get(name, 0) + 1
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        key = []
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [name, nodes.List(key)]),
+                               [], [], body).set_lineno(lineno)
+
+    @staticmethod
+    def _render(name, key, caller):
+        return fragment_cache.render(name, key, caller)
+
+
+# 当前用户的权限类别：匿名用户，或 (是否已确认, 角色权限值)
+# 优先使用会话中保存的权限掩码，不需要访问角色
+def permission_class():
+    if not current_user.is_authenticated:
+        return ('anonymous',)
+    mask = None
+    if current_app.config.get('FLASKY_SESSION_PERMISSIONS'):
+        from .decorators import session_permissions
+        mask = session_permissions()
+    if mask is None:
+        role = current_user.role
+        mask = 0 if role is None else role.permissions
+    return (current_user.confirmed, mask)
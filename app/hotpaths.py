@@ -0,0 +1,33 @@
+from flask import current_app, g, request
+from . import login_manager
+
+# 请求类别
+STATIC = 'static'
+HEALTH = 'health'
+ERROR = 'error'
+PAGE = 'page'
+
+
+# 请求分类：路由失败（404/405）的请求、静态文件和健康检查不需要知道当前用户，
+# 只有普通页面才需要加载会话中的用户。结果保存在 g 中，每个请求只计算一次
+def request_class():
+    cls = g.get('_request_class')
+    if cls is None:
+        endpoint = request.endpoint
+        if request.routing_exception is not None or endpoint is None:
+            cls = ERROR
+        elif endpoint == 'static' or endpoint.endswith('.static'):
+            cls = STATIC
+        elif endpoint in current_app.config.get('FLASKY_HEALTH_ENDPOINTS', ()):
+            cls = HEALTH
+        else:
+            cls = PAGE
+        g._request_class = cls
+    return cls
+
+
+# 在其他 before_request 之前执行：非页面请求直接把当前用户设为匿名用户，
+# Flask-Login 不会再调用 load_user，错误页面也能使用预先渲染的匿名版本
+def skip_user_loading():
+    if request_class() != PAGE:
+        g._login_user = login_manager.anonymous_user()
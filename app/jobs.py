@@ -0,0 +1,334 @@
+import json
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .email import dispatcher
+from .metrics import metrics
+from .models import Job, User, invalidate_users_on_commit, utcnow
+
+# 支持 SELECT ... FOR UPDATE SKIP LOCKED 的数据库
+SKIP_LOCKED_DIALECTS = ('postgresql', 'mysql', 'mariadb', 'oracle')
+
+# 任务名称到处理函数的映射，处理函数在应用上下文中执行，参数为任务的 payload
+TASKS = {}
+
+
+def task(name):
+    def decorator(f):
+        TASKS[name] = f
+        return f
+    return decorator
+
+
+# 添加任务，key 已存在时（同一个定时任务已由其他 worker 添加）返回 None
+def enqueue(name, payload=None, run_at=None, key=None, max_attempts=None):
+    job = Job(name=name, payload=json.dumps(payload or {}), run_at=run_at or utcnow(), key=key,
+              max_attempts=max_attempts or current_app.config.get('JOBS_MAX_ATTEMPTS', 3))
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return job
+
+
+# 认领最多 batch_size 个到期任务，返回 [(id, name, payload, run_at, locked_by), ...]，
+# locked_by 为这次认领的标识，记录结果时用它确认任务没有被重新排队和认领
+# 服务器型数据库用 FOR UPDATE SKIP LOCKED，多个 worker 互不等待；
+# SQLite 不支持行锁，但写事务是串行的，用一条 UPDATE ... WHERE id IN (子查询) 原子地认领
+def claim(worker_id, batch_size):
+    now = utcnow()
+    due = select(Job.id).where(Job.status == 'queued', Job.run_at <= now) \
+        .order_by(Job.run_at, Job.id).limit(batch_size)
+    token = '%s:%s' % (worker_id, uuid.uuid4().hex[:8])
+    claimed = dict(status='running', locked_by=token, started_at=now, attempts=Job.attempts + 1)
+    if db.engine.dialect.name in SKIP_LOCKED_DIALECTS:
+        ids = db.session.scalars(due.with_for_update(skip_locked=True)).all()
+        if ids:
+            db.session.execute(update(Job).where(Job.id.in_(ids)).values(**claimed))
+    else:
+        db.session.execute(update(Job).where(Job.id.in_(due), Job.status == 'queued')
+                           .values(**claimed))
+    jobs = db.session.execute(select(Job.id, Job.name, Job.payload, Job.run_at, Job.locked_by)
+                              .where(Job.locked_by == token, Job.status == 'running')
+                              .order_by(Job.run_at, Job.id)).all()
+    db.session.commit()
+    return [tuple(job) for job in jobs]
+
+
+# worker 异常退出时认领的任务一直处于 running 状态，超过 JOBS_TIMEOUT 秒后重新排队，
+# 已用完重试次数的标记为失败；返回处理的任务数。
+# JOBS_TIMEOUT 应大于最长任务的执行时间：超时后仍在执行的任务会被再次认领，
+# 原来的 worker 的认领标识已失效，它的结果不会覆盖新的认领（见 finish）
+def requeue_stale(timeout):
+    now = utcnow()
+    stale = (Job.status == 'running') & (Job.started_at < now - timedelta(seconds=timeout))
+    failed = db.session.execute(update(Job).where(stale, Job.attempts >= Job.max_attempts).values(
+        status='failed', locked_by=None, finished_at=now,
+        error='TimeoutError: not finished after %d seconds' % timeout))
+    requeued = db.session.execute(update(Job).where(stale).values(status='queued', locked_by=None))
+    db.session.commit()
+    return failed.rowcount + requeued.rowcount
+
+
+# 在应用上下文中执行一个任务，返回 (任务 ID, 错误信息, 耗时)
+def execute(job_id, name, payload):
+    start = time.perf_counter()
+    error = None
+    try:
+        func = TASKS.get(name)
+        if func is None:
+            raise LookupError('unknown job %r' % name)
+        func(**json.loads(payload or '{}'))
+    except Exception as e:
+        db.session.rollback()
+        error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        db.session.remove()
+    return job_id, error, time.perf_counter() - start
+
+
+# 记录执行结果：成功标记为 done，失败且还有重试次数时按指数退避重新排队。
+# 只有认领标识仍为 token 时才更新（任务超时后可能已被重新排队或由其他 worker 认领），
+# 返回是否更新
+def finish(job_id, error, token):
+    job = db.session.execute(select(Job.attempts, Job.max_attempts)
+                             .where(Job.id == job_id, Job.locked_by == token)).first()
+    if job is None:
+        db.session.commit()
+        return False
+    now = utcnow()
+    values = dict(locked_by=None, finished_at=now, error=error)
+    if error is None:
+        values['status'] = 'done'
+    elif job.attempts < job.max_attempts:
+        backoff = current_app.config.get('JOBS_RETRY_BACKOFF', 30)
+        values.update(status='queued',
+                      run_at=now + timedelta(seconds=backoff * 2 ** (job.attempts - 1)))
+    else:
+        values['status'] = 'failed'
+    result = db.session.execute(update(Job).where(Job.id == job_id, Job.locked_by == token)
+                                .values(**values))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+# 进程池中每个子进程创建自己的应用实例（以及数据库连接）
+_process_app = None
+
+
+def _init_process(config_name):
+    global _process_app
+    from . import create_app
+    _process_app = create_app(config_name)
+
+
+def _execute_in_process(job_id, name, payload):
+    with _process_app.app_context():
+        return execute(job_id, name, payload)
+
+
+# 解析 5 个字段的 cron 表达式（分 时 日 月 星期），支持 *、*/n、a-b、a-b/n 和逗号分隔的列表，
+# 日和星期同时指定时需要同时满足
+def _cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-'))
+        else:
+            start = end = int(part)
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def cron_next(expr, after):
+    minutes, hours, days, months, weekdays = expr.split()
+    minutes = _cron_field(minutes, 0, 59)
+    hours = _cron_field(hours, 0, 23)
+    days = _cron_field(days, 1, 31)
+    months = _cron_field(months, 1, 12)
+    # cron 中 0 和 7 都表示星期日，datetime.weekday() 中星期一为 0
+    weekdays = {(d - 1) % 7 for d in _cron_field(weekdays, 0, 7)}
+    t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = t + timedelta(days=366 * 4)
+    while t < limit:
+        if t.month not in months:
+            t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+        elif t.day not in days or t.weekday() not in weekdays:
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+        elif t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+        elif t.minute not in minutes:
+            t += timedelta(minutes=1)
+        else:
+            return t
+    raise ValueError('cron expression %r never matches' % expr)
+
+
+# 后台任务 worker：定期添加到期的定时任务、认领一批任务交给进程池执行并记录结果。
+# processes 为 0 时在当前进程中执行（测试和 SQLite 内存数据库使用）
+class Worker:
+    def __init__(self, app, config_name, processes=2, batch_size=10, poll_interval=1.0,
+                 schedule=True, log_interval=60):
+        self.app = app
+        self.config_name = config_name
+        self.processes = processes
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.schedule = app.config.get('JOBS_SCHEDULE', {}) if schedule else {}
+        self.log_interval = log_interval
+        self.worker_id = '%s:%d' % (socket.gethostname(), os.getpid())
+        self._next_runs = {}
+        self.pool = None
+        self.executed = 0
+        self.failed = 0
+        self.job_time = 0.0
+
+    def schedule_due(self):
+        now = utcnow()
+        for name, spec in self.schedule.items():
+            next_run = self._next_runs.get(name)
+            if next_run is None:
+                next_run = self._next_runs[name] = cron_next(spec['cron'], now)
+            while next_run <= now:
+                # 同一时刻的定时任务只添加一次，多个 worker 同时运行时由 key 的唯一约束去重
+                enqueue(name, spec.get('args'), run_at=next_run,
+                        key='cron:%s:%s' % (name, next_run.isoformat()))
+                next_run = self._next_runs[name] = cron_next(spec['cron'], next_run)
+
+    def start_pool(self):
+        if self.processes:
+            self.pool = ProcessPoolExecutor(max_workers=self.processes,
+                                            initializer=_init_process,
+                                            initargs=(self.config_name,))
+
+    def stop_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # 子进程异常退出（如被 OOM killer 杀死）后进程池不可用：这一批任务都记为失败
+    # （还有重试次数的重新排队），换一个新的进程池继续运行
+    def _execute_batch(self, jobs):
+        if self.pool is None:
+            return [execute(job_id, name, payload) for job_id, name, payload, _, _ in jobs]
+        try:
+            return list(self.pool.map(_execute_in_process, *zip(*[job[:3] for job in jobs])))
+        except BrokenProcessPool as e:
+            self.app.logger.error('Worker process died, restarting the pool: %s', e)
+            self.pool.shutdown(wait=False)
+            self.start_pool()
+            error = 'BrokenProcessPool: %s' % e
+            return [(job[0], error, 0.0) for job in jobs]
+
+    def run_batch(self):
+        claimed_at = utcnow()
+        jobs = claim(self.worker_id, self.batch_size)
+        if not jobs:
+            return 0
+        results = self._execute_batch(jobs)
+        for (job_id, name, _, run_at, token), (_, error, seconds) in zip(jobs, results):
+            if not finish(job_id, error, token):
+                self.app.logger.warning('Job %d (%s) was requeued before it finished, '
+                                        'result discarded', job_id, name)
+            delay = max((claimed_at - run_at).total_seconds(), 0.0)
+            metrics.observe_job(name, seconds, delay, error is None)
+            self.executed += 1
+            self.job_time += seconds
+            if error is not None:
+                self.failed += 1
+                self.app.logger.warning('Job %d (%s) failed: %s', job_id, name, error)
+        return len(jobs)
+
+    # once 为 True 时执行完所有到期任务后退出
+    def run(self, once=False):
+        self.start_pool()
+        start = last_log = time.monotonic()
+        try:
+            with self.app.app_context():
+                timeout = self.app.config.get('JOBS_TIMEOUT', 600)
+                while True:
+                    self.schedule_due()
+                    requeue_stale(timeout)
+                    count = self.run_batch()
+                    if time.monotonic() - last_log >= self.log_interval:
+                        self.log_stats(time.monotonic() - start)
+                        last_log = time.monotonic()
+                    if count == 0:
+                        if once:
+                            break
+                        time.sleep(self.poll_interval)
+        finally:
+            self.stop_pool()
+        return self.stats(time.monotonic() - start)
+
+    def stats(self, elapsed):
+        return {'executed': self.executed, 'failed': self.failed,
+                'jobs_per_sec': self.executed / elapsed if elapsed else 0.0,
+                'avg_ms': self.job_time / self.executed * 1000 if self.executed else 0.0}
+
+    def log_stats(self, elapsed):
+        stats = self.stats(elapsed)
+        self.app.logger.info('%d jobs (%d failed), %.1f jobs/sec, %.1f ms avg',
+                             stats['executed'], stats['failed'], stats['jobs_per_sec'],
+                             stats['avg_ms'])
+
+
+# 分批删除满足条件的行，每批一个事务，不会长时间锁表；before_delete 接收每批的 ID
+def delete_in_chunks(model, condition, batch_size, before_delete=None):
+    total = 0
+    while True:
+        ids = db.session.scalars(select(model.id).where(condition)
+                                 .order_by(model.id).limit(batch_size)).all()
+        if not ids:
+            return total
+        if before_delete is not None:
+            before_delete(ids)
+        db.session.execute(delete(model).where(model.id.in_(ids))
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+        total += len(ids)
+
+
+# 清理注册后超过 JOBS_UNCONFIRMED_DAYS 天仍未确认的用户
+@task('purge_unconfirmed')
+def purge_unconfirmed(days=None, batch_size=None):
+    config = current_app.config
+    cutoff = utcnow() - timedelta(days=days or config.get('JOBS_UNCONFIRMED_DAYS', 7))
+
+    return delete_in_chunks(User, (User.confirmed == False) & (User.member_since < cutoff),  # noqa: E712
+                            batch_size or config.get('JOBS_DELETE_BATCH', 500),
+                            invalidate_users_on_commit)
+
+
+# 清理结束超过 JOBS_RETENTION_DAYS 天的任务记录
+@task('purge_jobs')
+def purge_jobs(days=None, batch_size=None):
+    config = current_app.config
+    cutoff = utcnow() - timedelta(days=days or config.get('JOBS_RETENTION_DAYS', 7))
+    return delete_in_chunks(Job, or_(Job.status == 'done', Job.status == 'failed')
+                            & (Job.finished_at < cutoff),
+                            batch_size or config.get('JOBS_DELETE_BATCH', 500))
+
+
+# 重新发送溢出到磁盘的邮件（MAIL_QUEUE_POLICY 为 spill 时），等待发送完成后返回
+@task('requeue_mail')
+def requeue_mail():
+    count = dispatcher.requeue_spilled()
+    dispatcher.join()
+    return count
@@ -1,26 +1,33 @@
-from flask import render_template
 from . import main
+from ..pagecache import page_cache
 
 
-# 404 页面处理视图函数
+# 404 页面处理视图函数，匿名用户直接使用启动时渲染好的页面
 @main.app_errorhandler(404)
 def page_not_found(e):
-    return render_template('404.html'), 404  # 返回的第二个参数是状态码
+    return page_cache.error_page(404), 404  # 返回的第二个参数是状态码
 
 
 # 400 页面处理视图函数
 @main.app_errorhandler(400)
 def bad_request(e):
-    return render_template('400.html'), 400
+    return page_cache.error_page(400), 400
 
 
 # 500 页面处理视图函数
 @main.app_errorhandler(500)
 def internal_server_error(e):
-    return render_template('500.html'), 500
+    return page_cache.error_page(500), 500
 
 
 # 403 页面处理视图函数
 @main.app_errorhandler(403)
 def forbidden(e):
-    return render_template('403.html'), 403
\ No newline at end of file
+    return page_cache.error_page(403), 403
+
+
+# 429 页面处理视图函数，Retry-After 告诉客户端需要等待的秒数
+@main.app_errorhandler(429)
+def too_many_requests(e):
+    headers = {'Retry-After': str(e.retry_after)} if getattr(e, 'retry_after', None) else {}
+    return page_cache.error_page(429), 429, headers
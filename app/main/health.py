@@ -0,0 +1,28 @@
+from flask import current_app, jsonify
+from sqlalchemy import text
+from . import main
+from .. import db
+from ..email import dispatcher
+
+
+# 存活检查：进程能处理请求即可，不访问数据库
+@main.route('/healthz')
+def healthz():
+    return jsonify(status='ok')
+
+
+# 就绪检查：数据库能执行 SELECT 1，邮件队列未满，任一项失败返回 503
+@main.route('/readyz')
+def readyz():
+    checks = {}
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = 'ok'
+    except Exception as e:
+        current_app.logger.warning('Readiness check failed: %s', e)
+        checks['database'] = 'error'
+    finally:
+        db.session.rollback()
+    checks['mail'] = 'ok' if dispatcher.ready() else 'error'
+    ready = all(v == 'ok' for v in checks.values())
+    return jsonify(status='ok' if ready else 'error', checks=checks), 200 if ready else 503
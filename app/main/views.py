@@ -1,7 +1,9 @@
 from flask import render_template
 from . import main
+from ..pagecache import cached_page
 
 
 @main.route('/')
+@cached_page
 def index():
     return render_template('index.html')
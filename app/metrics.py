@@ -0,0 +1,197 @@
+import hmac
+import random
+import time
+from bisect import bisect_left
+from threading import Lock
+from flask import Response, abort, before_render_template, current_app, g, has_app_context, \
+    request, template_rendered
+from sqlalchemy import event
+
+# 直方图的桶上限（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+
+# weight 为一次观测代表的请求数，抽样时为抽样比例的倒数
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, weight=1):
+        self.counts[bisect_left(BUCKETS, value)] += weight
+        self.sum += value * weight
+        self.count += weight
+
+
+# 请求指标：每个端点的延迟直方图、SQL 查询次数和耗时、模板渲染耗时，以及邮件入队耗时；
+# 后台任务指标：每种任务的执行耗时直方图、排队延迟和失败次数
+# 每个请求都计数；只有按 METRICS_SAMPLE_RATE 抽中的请求才会计时和统计查询，
+# 抽中的请求按抽样比例的倒数加权，输出的直方图和累计值是对全部请求的估计
+class Metrics:
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+        self.sample_rate = app.config.get('METRICS_SAMPLE_RATE', 0.1)
+        app.extensions['metrics'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_execute)
+        if app.config.get('METRICS_ENDPOINT'):
+            app.add_url_rule(app.config['METRICS_ENDPOINT'], 'metrics', self.view)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+            self.requests = {}
+            self.mail_enqueue = Histogram()
+            self.jobs = {}
+
+    # 当前请求被抽中时返回其统计数据，否则返回 None
+    @staticmethod
+    def current():
+        return g.get('_metrics') if has_app_context() else None
+
+    def _before_request(self):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            g._metrics = {'start': time.perf_counter(), 'queries': 0,
+                          'sql_time': 0.0, 'template_time': 0.0, 'template_start': [],
+                          'weight': 1 / self.sample_rate if self.sample_rate < 1 else 1}
+
+    def _after_request(self, response):
+        endpoint = request.endpoint or 'unknown'
+        stats = g.pop('_metrics', None)
+        if stats is not None:
+            self.record(endpoint, time.perf_counter() - stats['start'], stats['queries'],
+                        stats['sql_time'], stats['template_time'], stats['weight'])
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        return response
+
+    def record(self, endpoint, latency, queries, sql_time, template_time, weight=1):
+        with self._lock:
+            ep = self.endpoints.get(endpoint)
+            if ep is None:
+                ep = self.endpoints[endpoint] = {'latency': Histogram(), 'queries': 0,
+                                                 'sql_time': 0.0, 'template_time': 0.0}
+            ep['latency'].observe(latency, weight)
+            ep['queries'] += queries * weight
+            ep['sql_time'] += sql_time * weight
+            ep['template_time'] += template_time * weight
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        if stats is not None:
+            conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        if stats is not None and conn.info.get('_metrics_start'):
+            stats['queries'] += 1
+            stats['sql_time'] += time.perf_counter() - conn.info['_metrics_start'].pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = self.current()
+        if stats is not None:
+            stats['template_start'].append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = self.current()
+        if stats is not None and stats['template_start']:
+            stats['template_time'] += time.perf_counter() - stats['template_start'].pop()
+
+    # 记录邮件入队耗时，由 send_email 调用
+    def observe_mail_enqueue(self, seconds):
+        with self._lock:
+            self.mail_enqueue.observe(seconds)
+
+    # 记录一次后台任务的执行耗时和排队延迟（从 run_at 到开始执行），由 worker 调用
+    def observe_job(self, name, seconds, delay, ok):
+        with self._lock:
+            job = self.jobs.get(name)
+            if job is None:
+                job = self.jobs[name] = {'latency': Histogram(), 'delay': Histogram(), 'failed': 0}
+            job['latency'].observe(seconds)
+            job['delay'].observe(delay)
+            if not ok:
+                job['failed'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {'count': ep['latency'].count,
+                           'latency_sum': ep['latency'].sum,
+                           'queries': ep['queries'],
+                           'sql_time': ep['sql_time'],
+                           'template_time': ep['template_time']}
+                    for name, ep in self.endpoints.items()}
+
+    # 指标端点：设置了 METRICS_TOKEN 时要求 Authorization: Bearer <token>，
+    # 否则只允许本机（如同一主机上的 Prometheus 或 sidecar）访问
+    def view(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        if token:
+            expected = 'Bearer ' + token
+            if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+                abort(403)
+        elif request.remote_addr not in ('127.0.0.1', '::1'):
+            abort(403)
+        return self.export()
+
+    # 以 Prometheus 文本格式输出，由指标端点返回
+    def export(self):
+        lines = ['# TYPE flasky_requests_total counter']
+        with self._lock:
+            for name, count in sorted(self.requests.items()):
+                lines.append('flasky_requests_total{endpoint="%s"} %d' % (name, count))
+            lines.append('# TYPE flasky_request_latency_seconds histogram')
+            for name, ep in sorted(self.endpoints.items()):
+                hist = ep['latency']
+                total = 0
+                for bound, n in zip(BUCKETS, hist.counts):
+                    total += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('flasky_request_latency_seconds_bucket{endpoint="%s",le="%s"} %d'
+                                 % (name, le, round(total)))
+                lines.append('flasky_request_latency_seconds_sum{endpoint="%s"} %f' % (name, hist.sum))
+                lines.append('flasky_request_latency_seconds_count{endpoint="%s"} %d'
+                             % (name, round(hist.count)))
+            for metric, key in [('flasky_sql_queries_total', 'queries'),
+                                ('flasky_sql_seconds_total', 'sql_time'),
+                                ('flasky_template_seconds_total', 'template_time')]:
+                lines.append('# TYPE %s counter' % metric)
+                for name, ep in sorted(self.endpoints.items()):
+                    lines.append('%s{endpoint="%s"} %g' % (metric, name, ep[key]))
+            lines.append('# TYPE flasky_mail_enqueue_seconds summary')
+            lines.append('flasky_mail_enqueue_seconds_sum %f' % self.mail_enqueue.sum)
+            lines.append('flasky_mail_enqueue_seconds_count %d' % self.mail_enqueue.count)
+            lines.append('# TYPE flasky_job_seconds histogram')
+            for name, job in sorted(self.jobs.items()):
+                hist = job['latency']
+                total = 0
+                for bound, n in zip(BUCKETS, hist.counts):
+                    total += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('flasky_job_seconds_bucket{job="%s",le="%s"} %d' % (name, le, total))
+                lines.append('flasky_job_seconds_sum{job="%s"} %f' % (name, hist.sum))
+                lines.append('flasky_job_seconds_count{job="%s"} %d' % (name, hist.count))
+            lines.append('# TYPE flasky_job_delay_seconds summary')
+            for name, job in sorted(self.jobs.items()):
+                lines.append('flasky_job_delay_seconds_sum{job="%s"} %f' % (name, job['delay'].sum))
+                lines.append('flasky_job_delay_seconds_count{job="%s"} %d' % (name, job['delay'].count))
+            lines.append('# TYPE flasky_jobs_failed_total counter')
+            for name, job in sorted(self.jobs.items()):
+                lines.append('flasky_jobs_failed_total{job="%s"} %d' % (name, job['failed']))
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
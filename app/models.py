@@ -1,8 +1,14 @@
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, timezone
 from flask_login import UserMixin, login_required, AnonymousUserMixin
-from itsdangerous import URLSafeTimedSerializer as Serializer
 from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 from . import db, login_manager
+from .cache import user_cache
+from .passwords import PasswordHasherBusy, hasher
+from .replicas import primary_reads
+from .tokens import tokens
 
 # 权限常量，若想为一个用户角色赋予权限，使其能够关注其他用户，
 # 并在文章中发表评论，则权限值为 FOLLOW + COMMENT = 3
@@ -14,12 +20,17 @@ class Permission:
     ADMIN = 16
 
 
+# 数据库中保存不带时区的 UTC 时间
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class Role(db.Model):
     __tablename__ = 'roles'  # 指定表名
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), unique=True)  # unique 表示表内任意两个name不能重复
     default = db.Column(db.Boolean, default=False, index=True)  # default 表示默认角色
-    permissions = db.Column(db.Integer)  # 角色的权限
+    permissions = db.Column(db.Integer, index=True)  # 角色的权限
     users = db.relationship('User', backref='role', lazy='dynamic')
     
     # 定义 __init__ 方法，在创建 Role 实例时，自动为其添加默认权限
@@ -43,6 +54,12 @@ class Role(db.Model):
             role.reset_permissions()
             for perm in roles[r]:
                 role.add_permission(perm)
+            role.default = (role.name == default_role)
+            db.session.add(role)
+        db.session.commit()
+        # 角色权限可能已改变，缓存中的用户都带有旧的角色信息
+        user_cache.clear()
+        role_registry.reload()
 
     def add_permission(self, perm):
         if not self.has_permission(perm):
@@ -61,6 +78,125 @@ class Role(db.Model):
     
     def __repr__(self):
         return '<Role %r>' % self.name
+
+
+_ROLE_CACHED_COLUMNS = ('id', 'name', 'default', 'permissions')
+
+
+# 缓存版本号计数器，保存在数据库中，所有进程共享（见 UserCache.role_version）
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def get(name):
+        with primary_reads(db.session):
+            return db.session.scalar(db.select(CacheVersion.version)
+                                     .where(CacheVersion.name == name)) or 0
+
+    # 在 connection 当前的事务中加一，与引起变化的修改一起提交
+    @staticmethod
+    def bump(connection, name):
+        table = CacheVersion.__table__
+        result = connection.execute(table.update().where(table.c.name == name)
+                                    .values(version=table.c.version + 1))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, version=1))
+
+
+def _changed(obj, *attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+# 新增或删除角色、角色的名称/权限/默认标记变化、用户的角色变化时，在同一个事务中增加角色版本号。
+# 其他进程读到新版本号时，新的角色数据一定已经提交，不会把旧数据缓存到新版本号下
+@event.listens_for(db.session, 'before_flush')
+def _bump_role_version(session, flush_context, instances):
+    changed = any(isinstance(obj, Role) for obj in session.new) or \
+        any(isinstance(obj, Role) for obj in session.deleted) or \
+        any(isinstance(obj, Role) and _changed(obj, 'name', 'default', 'permissions') or
+            isinstance(obj, User) and _changed(obj, 'role_id', 'role') for obj in session.dirty)
+    if changed:
+        CacheVersion.bump(session.connection(), 'roles')
+        session.info['role_version_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _role_version_committed(session):
+    if session.info.pop('role_version_changed', False):
+        user_cache.role_version_changed()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _role_version_rolled_back(session):
+    session.info.pop('role_version_changed', None)
+
+
+# 修改用户后不立即删除缓存条目：提交之前其他请求仍可能读到旧数据并重新写入缓存，
+# 因此先记下用户 id，事务提交之后再删除；回滚时丢弃
+def invalidate_users_on_commit(ids):
+    db.session.info.setdefault('invalidate_users', set()).update(ids)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_users_committed(session):
+    for user_id in session.info.pop('invalidate_users', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _invalidate_users_rolled_back(session):
+    session.info.pop('invalidate_users', None)
+
+
+# 应用级的角色注册表：所有角色只查询一次，创建用户时直接从这里取默认角色和管理员角色
+# 角色版本号（见 CacheVersion）变化后自动重新加载，insert_roles 也会主动刷新
+class RoleRegistry:
+    def _state(self):
+        return current_app.extensions.setdefault('role_registry', {'version': None, 'roles': None})
+
+    def _roles(self):
+        state = self._state()
+        version = user_cache.role_version
+        if state['roles'] is None or state['version'] != version:
+            with primary_reads(db.session):
+                state['roles'] = [{c: getattr(r, c) for c in _ROLE_CACHED_COLUMNS}
+                                  for r in Role.query.all()]
+            state['version'] = version
+        return state['roles']
+
+    def reload(self):
+        self._state()['roles'] = None
+
+    # 预热时调用，提前加载全部角色
+    def preload(self):
+        return len(self._roles())
+
+    # 返回当前会话中的角色对象：会话中已有则直接使用，否则由缓存的数据构造，不查询数据库
+    @staticmethod
+    def _attach(data):
+        if data is None:
+            return None
+        role = db.session.identity_map.get(db.session.identity_key(Role, data['id']))
+        if role is None:
+            role = _detached(Role, data)
+            db.session.add(role)
+        return role
+
+    def get(self, name):
+        return self._attach(next((r for r in self._roles() if r['name'] == name), None))
+
+    def default(self):
+        return self._attach(next((r for r in self._roles() if r['default']), None))
+
+    def administrator(self):
+        return self._attach(next((r for r in self._roles()
+                                  if r['permissions'] & Permission.ADMIN), None))
+
+
+role_registry = RoleRegistry()
     
 
 class User(UserMixin, db.Model):
@@ -68,20 +204,21 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(64), unique=True, index=True)
     username = db.Column(db.String(64), unique=True, index=True)  # index=True在创建表时自动在该列上创建索引，这对于涉及按用户名搜索用户或根据用户名列进行筛选的查询非常有用。
-    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
-    password_hash = db.Column(db.String(128))  # 数据库中存的不能是明文密码，得是经过哈希的散列值
+    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), index=True)  # Role.users 按该列查询
+    password_hash = db.Column(db.String(256))  # 数据库中存的不能是明文密码，得是经过哈希的散列值
     confirmed = db.Column(db.Boolean, default=False)  # 确认邮件，默认值为 False
+    member_since = db.Column(db.DateTime(), default=utcnow)  # 注册时间，用于清理长期未确认的用户
 
     # 定义 __init__ 方法，在创建 User 实例时，自动为其添加默认角色，若用户的 email 与 FLASKY_ADMIN 相同，则自动赋予管理员角色
     def __init__(self, **kwargs):
         # 调用父类的 __init__ 方法，以便为实例设置属性
         super(User, self).__init__(**kwargs)
-        # 如果用户的 email 与 FLASKY_ADMIN 相同，则自动赋予管理员角色
-        if self.email == current_app.config['FLASKY_ADMIN']:
-            self.role = Role.query.filter_by(permissions=Permission.ADMIN).first()
+        # 如果用户的 email 与 FLASKY_ADMIN 相同，则自动赋予管理员角色（未配置 FLASKY_ADMIN 时跳过）
+        if self.email is not None and self.email == current_app.config['FLASKY_ADMIN']:
+            self.role = role_registry.administrator()
         # 如果没有指定角色，则赋予默认角色
         if self.role is None:
-            self.role = Role.query.filter_by(default=True).first()
+            self.role = role_registry.default()
     
     # 被 @property 装饰器修饰后，可以直接像访问属性一样使用(User.password)，而不需要显式调用方法
     @property 
@@ -90,66 +227,73 @@ class User(UserMixin, db.Model):
     
     @password.setter  # 用于定义 password 属性的 setter 方法，允许给 password 属性赋值，以更新用户密码
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
     
     def verify_password(self, password):  # 验证密码是否正确
-        return check_password_hash(self.password_hash, password)
+        if not hasher.verify(self.password_hash, password):
+            return False
+        # 密码正确但哈希参数已过时，用当前配置重新计算，由调用方提交
+        if hasher.needs_rehash(self.password_hash):
+            try:
+                self.password = password
+            except PasswordHasherBusy:
+                # 哈希任务排队过多时跳过这次升级，不影响登录，下次验证时再重新计算
+                return True
+            db.session.add(self)
+        return True
         
     def generate_confirmation_token(self, expiration=3600):  # 生成确认邮件的 token
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
-        return s.dumps({'confirm': self.id}).decode('utf-8')
+        return tokens.generate('confirm', {'confirm': self.id}, expiration)
     
     def confirm(self, token):  # 验证 token 并确认用户
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token.encode('utf-8'))
-        except:
-            return False
-        if data.get('confirm') != self.id:
+        data = tokens.verify('confirm', token)
+        if data is None or data.get('confirm') != self.id:
             return False
         # 如果 token 有效，则将 confirmed 字段设置为 True
         self.confirmed = True
         db.session.add(self)
+        invalidate_users_on_commit([self.id])
         return True
     
+    # 令牌绑定当前的密码哈希，密码重置（或修改）后同一令牌失效
     def generate_reset_token(self, expiration=3600):  # 生成重置密码的 token
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
-        return s.dumps({'reset': self.id}).decode('utf-8')
+        return tokens.generate('reset', {'reset': self.id,
+                                         'pw': tokens.fingerprint(self.password_hash)}, expiration)
     
     # 使用 @staticmethod 装饰器定义的类方法，不需要实例化类就可以调用，可以直接通过类名调用，如 User.reset_password(token, new_password)
     @staticmethod
     def reset_password(token, new_password):  # 验证 token 并重置密码
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token.encode('utf-8'))
-        except:
+        data = tokens.verify('reset', token)
+        if data is None:
             return False
-        user = User.query.get(data.get('reset'))  # 根据 token 找到用户
-        if user is None:
+        user = db.session.get(User, data.get('reset'))  # 根据 token 找到用户
+        if user is None or data.get('pw') != tokens.fingerprint(user.password_hash):
             return False
         user.password = new_password
         db.session.add(user)
+        invalidate_users_on_commit([user.id])
         return True
     
+    # 令牌绑定当前的邮箱，修改完成后同一令牌失效
     def generate_email_change_token(self, new_email, expiration=3600):  # 生成修改邮箱的 token
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
-        return s.dumps({'change_email': self.id, 'new_email': new_email}).decode('utf-8')
+        return tokens.generate('change_email', {'change_email': self.id, 'new_email': new_email,
+                                                'email': tokens.fingerprint(self.email)},
+                               expiration)
     
     def change_email(self, token):  # 验证 token 并修改邮箱
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token.encode('utf-8'))
-        except:
-            return False
-        if data.get('change_email') != self.id:
+        data = tokens.verify('change_email', token)
+        if data is None or data.get('change_email') != self.id or \
+                data.get('email') != tokens.fingerprint(self.email):
             return False
         new_email = data.get('new_email')
         if new_email is None:
             return False
-        if self.query.filter_by(email=new_email).first() is not None:
+        # 只查询 id，可以直接由 email 索引得到结果，不需要读取整行
+        if db.session.query(User.id).filter_by(email=new_email).first() is not None:
             return False
         self.email = new_email
         db.session.add(self)
+        invalidate_users_on_commit([self.id])
         return True
     
     def can(self, perm):  # 检查用户是否具有某种权限，即参数 perm 是否在用户的角色的权限列表中
@@ -162,6 +306,29 @@ class User(UserMixin, db.Model):
         return '<User %r>' % self.username
 
 
+# 后台任务：由 flask worker 按 run_at 顺序认领执行，失败后按退避时间重新排队，
+# 超过 max_attempts 次后标记为 failed。key 不为空时唯一，用于定时任务去重
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, default='{}')  # JSON 格式的参数
+    key = db.Column(db.String(128), unique=True)
+    status = db.Column(db.String(16), default='queued')  # queued、running、done、failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_at = db.Column(db.DateTime(), default=utcnow)
+    created_at = db.Column(db.DateTime(), default=utcnow)
+    started_at = db.Column(db.DateTime())
+    finished_at = db.Column(db.DateTime())
+    locked_by = db.Column(db.String(64))
+    error = db.Column(db.Text)
+
+    def __repr__(self):
+        return '<Job %r %s>' % (self.name, self.status)
+
+
 # 自定义匿名用户类，用于未登录的用户
 class AnonymousUser(AnonymousUserMixin):
     def can(self, permissions):
@@ -178,4 +345,47 @@ login_manager.anonymous_user = AnonymousUser
 # 因此，在视图函数中，可以用 current_user 来获取当前登录的用户，并检查其权限。
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
\ No newline at end of file
+    user_id = int(user_id)
+    # 先读取版本号再加载用户，缓存条目的版本号不会比其中的数据新
+    version = user_cache.role_version
+    data = user_cache.get(user_id)
+    if data is not None and data.get('role_version') == version:
+        return _restore_user(data)
+    with primary_reads(db.session):
+        user = db.session.get(User, user_id, options=[db.joinedload(User.role)])
+    if user is not None:
+        user_cache.set(user_id, _snapshot_user(user, version))
+    return user
+
+
+# 用户缓存中不保存 password_hash，需要验证密码时再从数据库按需加载
+_USER_CACHED_COLUMNS = ('id', 'email', 'username', 'role_id', 'confirmed')
+
+
+# 把用户及其角色转换成只包含列数据的字典，便于放入缓存
+def _snapshot_user(user, role_version):
+    data = {c: getattr(user, c) for c in _USER_CACHED_COLUMNS}
+    data['role_version'] = role_version
+    role = user.role
+    data['role'] = None if role is None else \
+        {c: getattr(role, c) for c in _ROLE_CACHED_COLUMNS}
+    return data
+
+
+def _detached(model, values):
+    obj = model.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(obj, key, value)
+    make_transient_to_detached(obj)
+    return obj
+
+
+# 根据缓存的字典重建用户对象，merge(load=False) 会把它放入当前会话而不查询数据库
+def _restore_user(data):
+    data = dict(data)
+    role = data.pop('role')
+    data.pop('role_version')
+    user = _detached(User, data)
+    set_committed_value(user, 'role',
+                        None if role is None else _detached(Role, role))
+    return db.session.merge(user, load=False)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, render_template, request, session
+from flask_login import current_user
+from .cache import LocalCache
+
+# 启动时预先渲染的错误页面
+ERROR_PAGES = (400, 403, 404, 429, 500)
+
+
+# 匿名用户页面缓存：匿名用户看到的页面内容相同，渲染结果按端点、参数和语言缓存（LRU + TTL），
+# 响应带有强 ETag 和 Last-Modified，客户端条件请求命中时直接返回 304。
+# 错误页面在启动时渲染一次，404 等大量出现时不再经过 base.html 和 Flask-Bootstrap 渲染。
+# 页面中 url_for 生成的链接与挂载路径有关，缓存和错误页面都按 request.script_root 区分
+class PageCache:
+    def __init__(self, app=None):
+        self.cache = None
+        self.enabled = False
+        self.error_pages = {}
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        self.cache = LocalCache(maxsize=app.config.get('PAGE_CACHE_SIZE', 256),
+                                ttl=app.config.get('PAGE_CACHE_TTL', 300))
+        self.languages = app.config.get('PAGE_CACHE_LANGUAGES', ['en'])
+        self.error_pages = {}
+        self.hits = 0
+        self.misses = 0
+        app.extensions['page_cache'] = self
+
+    # 渲染错误页面，需要在蓝本注册之后调用（模板中会用到 url_for）；
+    # 挂载路径为 APPLICATION_ROOT，其他挂载路径的错误页面在第一次出现时渲染并保存
+    def prerender_errors(self, app, codes=ERROR_PAGES):
+        if not self.enabled:
+            return
+        with app.test_request_context('/'):
+            for code in codes:
+                self.error_pages[(code, request.script_root)] = render_template('%d.html' % code)
+
+    # 当前请求看到的是否为匿名用户的页面：会话中有待显示的闪现消息时页面内容不同
+    @staticmethod
+    def anonymous():
+        return '_flashes' not in session and current_user.is_anonymous
+
+    def cacheable(self):
+        return self.enabled and request.method in ('GET', 'HEAD') and self.anonymous()
+
+    def key(self):
+        return (request.script_root, request.endpoint,
+                tuple(sorted((request.view_args or {}).items())),
+                tuple(sorted(request.args.items(multi=True))),
+                request.accept_languages.best_match(self.languages))
+
+    # 由缓存条目构造响应，客户端的 ETag 或修改时间与缓存一致时返回 304
+    @staticmethod
+    def respond(entry):
+        body, content_type, etag, last_modified = entry
+        response = current_app.response_class(body, content_type=content_type)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+    # 只缓存状态码为 200 且没有修改会话（不会设置 cookie）的响应
+    def store(self, key, response):
+        if response.status_code != 200 or response.direct_passthrough or session.modified:
+            return response
+        body = response.get_data()
+        entry = (body, response.content_type, hashlib.sha256(body).hexdigest(),
+                 datetime.now(timezone.utc).replace(microsecond=0))
+        self.cache.set(key, entry)
+        return self.respond(entry)
+
+    # 错误页面：匿名用户使用预先渲染的内容，其他情况正常渲染
+    def error_page(self, code):
+        if not self.enabled or code not in ERROR_PAGES or not self.anonymous():
+            return render_template('%d.html' % code)
+        key = (code, request.script_root)
+        body = self.error_pages.get(key)
+        if body is None:
+            body = self.error_pages[key] = render_template('%d.html' % code)
+        return body
+
+    # 页面模板或数据变化时调用
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+
+page_cache = PageCache()
+
+
+# 缓存装饰器：只对匿名用户的 GET/HEAD 请求生效，登录用户照常执行视图函数
+def cached_page(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not page_cache.cacheable():
+            return current_app.ensure_sync(f)(*args, **kwargs)
+        key = page_cache.key()
+        entry = page_cache.cache.get(key)
+        if entry is not None:
+            page_cache.hits += 1
+            return page_cache.respond(entry)
+        page_cache.misses += 1
+        response = make_response(current_app.ensure_sync(f)(*args, **kwargs))
+        return page_cache.store(key, response)
+    return decorated_function
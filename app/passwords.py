@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# 等待哈希的任务过多时抛出，调用方应快速拒绝请求而不是继续排队
+class PasswordHasherBusy(Exception):
+    pass
+
+
+# 密码哈希：算法和参数可配置，计算放到有界的线程池或进程池中执行，
+# 同时等待的任务数有上限，登录高峰时不会占满所有 worker
+class PasswordHasher:
+    def __init__(self, app=None):
+        self._executor = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.shutdown()
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.salt_length = app.config.get('PASSWORD_SALT_LENGTH', 16)
+        # workers 为 0 时在当前线程中直接计算
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.executor_type = app.config.get('PASSWORD_HASH_EXECUTOR', 'thread')
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 32)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 5.0)
+        self._slots = BoundedSemaphore(self.workers + self.max_pending)
+        self._prefix = None
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.executor_type == 'process':
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='password-hash')
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    # 异步视图使用：在线程中等待哈希结果，不阻塞事件循环，排队上限同样生效
+    async def hash_async(self, password):
+        return await asyncio.to_thread(self.hash, password)
+
+    async def verify_async(self, pwhash, password):
+        return await asyncio.to_thread(self.verify, pwhash, password)
+
+    # 已保存的哈希使用的算法、参数或盐长度与当前配置不同时需要重新计算
+    def needs_rehash(self, pwhash):
+        if self._prefix is None:
+            # 把 'scrypt' 这类简写展开成 'scrypt:32768:8:1'，只需计算一次
+            self._prefix = generate_password_hash('', self.method, 1).split('$')[0]
+        parts = pwhash.split('$')
+        return len(parts) != 3 or parts[0] != self._prefix or len(parts[1]) != self.salt_length
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,136 @@
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from flask import current_app, request, session
+from werkzeug.exceptions import TooManyRequests
+
+
+# 进程内计数器存储：每个窗口的计数只占一个条目，过期或超出容量时按 LRU 淘汰
+# 多 worker 部署可换成共享存储（如 Redis 的 INCR + EXPIRE），只需实现 incr 和 get
+class LocalRateLimitStore:
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def incr(self, key, expires):
+        now = time.time()
+        with self._lock:
+            count, exp = self._data.get(key, (0, expires))
+            if exp < now:
+                count, exp = 0, expires
+            self._data[key] = (count + 1, exp)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return count + 1
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+        if item is None or item[1] < time.time():
+            return 0
+        return item[0]
+
+    def __len__(self):
+        return len(self._data)
+
+
+# 滑动窗口限流：只保存当前和上一个固定窗口的计数，
+# 按上一个窗口在滑动窗口中所占的比例加权估算请求数
+class RateLimiter:
+    def __init__(self, app=None):
+        self.store = None
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        store = app.config.get('RATELIMIT_STORAGE')
+        # 配置项可以是存储实例，也可以是返回存储实例的工厂函数
+        if callable(store):
+            store = store(app)
+        self.store = store or LocalRateLimitStore(app.config.get('RATELIMIT_MAX_KEYS', 100000))
+        app.extensions['rate_limiter'] = self
+
+    def _estimate(self, key, period, record):
+        now = time.time()
+        window = int(now // period)
+        elapsed = now - window * period
+        previous = self.store.get('%s:%d' % (key, window - 1))
+        if record:
+            current = self.store.incr('%s:%d' % (key, window), (window + 2) * period)
+        else:
+            current = self.store.get('%s:%d' % (key, window))
+        return previous * (period - elapsed) / period + current, int(period - elapsed) + 1
+
+    # 记录一次请求，返回是否允许；不允许时返回还需等待的秒数
+    def hit(self, key, limit, period):
+        estimate, retry_after = self._estimate(key, period, True)
+        if estimate > limit:
+            return False, retry_after
+        return True, 0
+
+    # 只检查不计数：已记录的次数达到 limit 时不允许（用于只统计失败次数的限制）
+    def check(self, key, limit, period):
+        estimate, retry_after = self._estimate(key, period, False)
+        if estimate >= limit:
+            return False, retry_after
+        return True, 0
+
+
+limiter = RateLimiter()
+
+
+# 部署在反向代理之后时需设置 FLASKY_PROXY_FIX，由 ProxyFix 从 X-Forwarded-For 中取出客户端地址，
+# 否则所有请求的 remote_addr 都是代理的地址
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+
+# 限流装饰器：在视图（包括 login_required）之前执行，超出限制直接返回 429，
+# 不会做任何密码哈希或数据库查询。limits 配置为 [(次数, 秒数), ...]，
+# 分别作用于客户端 IP 和 account 函数返回的账户标识。
+# failures_only 为 True 时账户只统计失败次数（由视图调用 record_failure 记录），
+# 账户的主人登录成功不计数，其他人也不能只靠发送请求把账户锁住
+def rate_limit(scope, account=None, methods=None, failures_only=False):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if limiter.enabled and (methods is None or request.method in methods):
+                limits = current_app.config['RATELIMIT_LIMITS'].get(scope, {})
+                keys = [('ip', client_ip())]
+                if account is not None:
+                    keys.append(('account', account()))
+                for kind, value in keys:
+                    if value is None or kind not in limits:
+                        continue
+                    count, period = limits[kind]
+                    check = limiter.check if kind == 'account' and failures_only else limiter.hit
+                    allowed, retry_after = check('%s:%s:%s' % (scope, kind, value), count, period)
+                    if not allowed:
+                        raise TooManyRequests(retry_after=retry_after)
+            # 同时支持同步和异步视图
+            return current_app.ensure_sync(f)(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# 记录一次失败（如密码错误），计入 failures_only 的账户限制
+def record_failure(scope, value):
+    limits = current_app.config['RATELIMIT_LIMITS'].get(scope, {})
+    if limiter.enabled and value is not None and 'account' in limits:
+        count, period = limits['account']
+        limiter.hit('%s:account:%s' % (scope, value), count, period)
+
+
+# 常用的账户标识：表单中的邮箱地址，或会话中已登录用户的 ID
+def form_email():
+    email = request.form.get('email')
+    return email.strip().lower() if email else None
+
+
+def session_user():
+    return session.get('_user_id')
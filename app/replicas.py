@@ -0,0 +1,65 @@
+import random
+import time
+from contextlib import contextmanager
+from flask import current_app, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, UpdateBase
+
+
+# 读写分离的会话：SQLALCHEMY_REPLICAS 中列出的绑定（在 SQLALCHEMY_BINDS 中配置）作为只读副本，
+# 只读查询随机发往一个副本，刷新、INSERT/UPDATE/DELETE、SELECT ... FOR UPDATE 和文本 SQL 发往主库。
+# 读己之写：会话写入过数据后（包括提交之后，例如刷新过期的对象）的读取都使用主库；
+# 提交后 SQLALCHEMY_REPLICA_STICKY 秒内同一用户的后续请求（记录在 Flask 会话中）也使用主库，避开复制延迟；
+# 写入结果会被其他用户读到并缓存的查询在 primary_reads() 中执行
+class RoutingSession(Session):
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._wrote = False
+        self._committed = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # 会话绑定到某个连接时（测试中加入外部事务）所有语句都使用该连接
+        if bind is None and self.bind is not None:
+            return self.bind
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_app_context():
+            return engine
+        replicas = current_app.config.get('SQLALCHEMY_REPLICAS')
+        if not replicas or engine is not self._db.engines.get(None):
+            return engine
+        if self._flushing or isinstance(clause, UpdateBase) or \
+                (isinstance(clause, Select) and clause._for_update_arg is not None):
+            self._wrote = True
+            return engine
+        if not isinstance(clause, Select) or self._wrote or self._committed or \
+                self.info.get('primary_reads') or self._sticky():
+            return engine
+        return self._db.engines[random.choice(replicas)]
+
+    @staticmethod
+    def _sticky():
+        return has_request_context() and time.time() < session.get('_primary_until', 0)
+
+    def commit(self):
+        super().commit()
+        if self._wrote:
+            self._wrote = False
+            self._committed = True
+            if has_request_context() and current_app.config.get('SQLALCHEMY_REPLICA_STICKY'):
+                session['_primary_until'] = \
+                    time.time() + current_app.config['SQLALCHEMY_REPLICA_STICKY']
+
+    def rollback(self):
+        super().rollback()
+        self._wrote = False
+
+
+# with 块中的只读查询也使用主库。用于填充所有请求共用的缓存（用户缓存、角色注册表、角色版本号）
+# 和加载当前用户：这些数据可能刚由其他用户（如管理员）修改，不能读取落后的副本
+@contextmanager
+def primary_reads(session):
+    session.info['primary_reads'] = session.info.get('primary_reads', 0) + 1
+    try:
+        yield
+    finally:
+        session.info['primary_reads'] -= 1
@@ -0,0 +1,145 @@
+import pickle
+import secrets
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from .cache import LocalCache
+
+
+# 服务器端会话：cookie 中只保存随机生成的会话 ID，会话内容在第一次访问时才从存储中读取，
+# 从不读写 session 的请求不会访问存储，也不需要验证签名。
+# 登录用户发生变化（登录、退出、切换账户）或调用 clear() 时，保存会话时换用新的 ID，
+# 旧 ID 从存储中删除，防止会话固定攻击
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, sid=None, loader=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(on_update=on_update)
+        self.sid = sid
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+        self._loader = loader
+        self._user_id = None
+
+    @property
+    def loaded(self):
+        return self._loader is None
+
+    def _load(self):
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            data = loader()
+            if data is None:
+                # 会话已过期或 ID 无效，保存时生成新的 ID，不沿用客户端提供的 ID
+                self.sid = None
+            else:
+                dict.update(self, data)
+                self._user_id = data.get('_user_id')
+        self.accessed = True
+
+    # 保存时是否需要换用新的会话 ID
+    def needs_new_sid(self):
+        return self.rotate or self.get('_user_id') != self._user_id
+
+    def clear(self):
+        self._load()
+        self.rotate = True
+        CallbackDict.clear(self)
+
+
+# 读写会话内容的方法都先加载数据
+def _loads_first(name):
+    method = getattr(CallbackDict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._load()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ('__getitem__', '__setitem__', '__delitem__', '__contains__', '__iter__',
+              '__len__', '__eq__', '__repr__', 'get', 'keys', 'values', 'items', 'copy',
+              'setdefault', 'pop', 'popitem', 'update'):
+    setattr(ServerSession, _name, _loads_first(_name))
+
+
+# 会话内容的二进制序列化。存储中的数据只由服务器写入，客户端只能提供会话 ID，
+# 共享存储（如 Redis）必须只对应用开放
+class PickleSerializer:
+    @staticmethod
+    def dumps(data):
+        return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        return pickle.loads(data)
+
+
+# 服务器端会话接口，通过 FLASKY_SERVER_SESSIONS 启用
+# 默认使用进程内的 LRU/TTL 存储，只适合单进程部署；多进程或多节点部署通过 SESSION_STORE
+# 设置共享存储，只要实现 get/set/delete 三个方法（值为 bytes）即可，与 USER_CACHE_BACKEND 相同
+class ServerSessionInterface(SessionInterface):
+    serializer = PickleSerializer()
+
+    def __init__(self, app):
+        store = app.config.get('SESSION_STORE')
+        # 配置项可以是存储实例，也可以是返回存储实例的工厂函数
+        if callable(store):
+            store = store(app)
+        if store is None:
+            store = LocalCache(maxsize=app.config.get('SESSION_STORE_SIZE', 10000),
+                               ttl=int(app.permanent_session_lifetime.total_seconds()))
+        self.store = store
+
+    @staticmethod
+    def _key(sid):
+        return 'session:%s' % sid
+
+    def _load(self, sid):
+        data = self.store.get(self._key(sid))
+        return None if data is None else self.serializer.loads(data)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession()
+        return ServerSession(sid, lambda: self._load(sid))
+
+    def save_session(self, app, session, response):
+        # 本次请求没有访问过会话
+        if not session.loaded:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                if session.sid is not None:
+                    self.store.delete(self._key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+        response.vary.add('Cookie')
+        if session.sid is not None and session.needs_new_sid():
+            self.store.delete(self._key(session.sid))
+            session.sid = None
+        if not self.should_set_cookie(app, session) and session.sid is not None:
+            return
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.set(self._key(session.sid), self.serializer.dumps(dict(session)))
+        # 会话 ID 不变时，只有永久会话需要刷新 cookie 的过期时间
+        if new or session.permanent:
+            response.set_cookie(name, session.sid,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
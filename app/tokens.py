@@ -0,0 +1,64 @@
+import hashlib
+import time
+from itsdangerous import BadData, URLSafeSerializer
+from .cache import LocalCache
+
+
+# 签名令牌服务：每种用途（confirm、reset、change_email）使用各自的 salt，
+# 序列化器只创建一次；SECRET_KEY_FALLBACKS 中的旧密钥仍可用于验证，便于轮换密钥
+# 签名无效或已过期的令牌记入有界的否定缓存，重放时不再计算 HMAC，也不查询数据库。
+# 令牌只能使用一次由令牌内容保证（见 fingerprint），不依赖这个可被淘汰的进程内缓存
+class TokenService:
+    def __init__(self, app=None):
+        self._serializers = {}
+        self.rejected = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.secret_keys = list(app.config.get('SECRET_KEY_FALLBACKS') or []) + \
+            [app.config['SECRET_KEY']]
+        self._serializers = {}
+        self.rejected = LocalCache(maxsize=app.config.get('TOKEN_NEGATIVE_CACHE_SIZE', 10000),
+                                   ttl=app.config.get('TOKEN_NEGATIVE_CACHE_TTL', 3600))
+        app.extensions['tokens'] = self
+
+    def serializer(self, purpose):
+        s = self._serializers.get(purpose)
+        if s is None:
+            # 最后一个密钥用于签名，所有密钥都可用于验证
+            s = self._serializers[purpose] = URLSafeSerializer(self.secret_keys, salt=purpose)
+        return s
+
+    @staticmethod
+    def _key(purpose, token):
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16,
+                               person=purpose.encode('utf-8')[:16]).digest()
+
+    # 过期时间写在令牌内容中，因此每个令牌可以有不同的有效期
+    def generate(self, purpose, data, expiration=3600):
+        data = dict(data, exp=time.time() + expiration)
+        return self.serializer(purpose).dumps(data)
+
+    # 验证成功返回令牌内容，否则返回 None
+    def verify(self, purpose, token):
+        key = self._key(purpose, token)
+        if self.rejected.get(key) is not None:
+            return None
+        try:
+            data = self.serializer(purpose).loads(token)
+        except BadData:
+            data = None
+        if not isinstance(data, dict) or data.get('exp', 0) < time.time():
+            self.rejected.set(key, True)
+            return None
+        return data
+
+    # 把令牌绑定到使用时会改变的字段（如 password_hash、email）：生成时写入字段的摘要，
+    # 使用时与数据库中的当前值比较。令牌使用后字段随事务一起提交，之后所有进程都会拒绝它
+    @staticmethod
+    def fingerprint(value):
+        return hashlib.blake2b((value or '').encode('utf-8'), digest_size=8).hexdigest()
+
+
+tokens = TokenService()
@@ -0,0 +1,98 @@
+import threading
+import time
+import weakref
+from sqlalchemy import text
+from . import db
+
+# 预热过的应用（连接池中有已建立的连接），fork worker 时处理它们的连接池（见 before_fork）
+_warmed_apps = weakref.WeakSet()
+
+
+def _pooled_engines():
+    return [engine for engine in db.engines.values()
+            if callable(getattr(engine.pool, 'size', None))]
+
+
+# 预先建立连接池中的连接，数量默认为连接池大小（SQLite 内存库等没有固定大小的连接池只建立一个）
+def open_connections(count=None):
+    for engine in db.engines.values():
+        n = count
+        if not n:
+            size = getattr(engine.pool, 'size', None)
+            n = size() if callable(size) else 1
+        connections = []
+        try:
+            for _ in range(n):
+                conn = engine.connect()
+                conn.execute(text('SELECT 1'))
+                connections.append(conn)
+        finally:
+            # 连接归还给连接池后保持打开状态
+            for conn in connections:
+                conn.close()
+
+
+# 编译所有模板（包括 Flask-Bootstrap 的模板和邮件模板），编译结果留在 Jinja 的模板缓存中
+def compile_templates(app):
+    names = app.jinja_env.list_templates(extensions=['html', 'txt'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def preload_roles():
+    from .models import role_registry
+    role_registry.preload()
+    db.session.remove()
+
+
+# 由 Web 服务器 fork worker 前后的钩子调用（见 gunicorn.conf.py 中的 pre_fork、post_fork）：
+# --preload 时主进程中预热建立的连接在 fork 之前关闭，worker 不会继承并与其他进程共用同一个
+# 数据库连接；worker 启动后在后台线程中重新建立自己的连接。
+# 不使用 os.register_at_fork，密码哈希、后台任务等进程池 fork 子进程时不受影响
+def before_fork():
+    for app in list(_warmed_apps):
+        with app.app_context():
+            for engine in _pooled_engines():
+                engine.dispose()
+
+
+def _reopen_connections(app):
+    with app.app_context():
+        try:
+            open_connections(app.config.get('FLASKY_WARMUP_CONNECTIONS'))
+        except Exception as e:
+            app.logger.warning('Warm-up step connections failed: %s', e)
+
+
+def after_fork():
+    for app in list(_warmed_apps):
+        if 'connections' not in app.config.get('FLASKY_WARMUP_STEPS',
+                                               ('connections', 'templates', 'roles')):
+            continue
+        threading.Thread(target=_reopen_connections, args=(app,), daemon=True).start()
+
+
+# 预热：新 worker 处理第一个请求前完成建立数据库连接、编译模板和加载角色，
+# 首个请求的延迟与稳定状态一致。某一步失败只记录警告，不影响应用启动（例如数据库尚未迁移）。
+# 配合 gunicorn --preload 使用时需要 gunicorn.conf.py 中的钩子，预热建立的连接由每个 worker 重新建立
+def warm_up(app):
+    steps = [('connections', lambda: open_connections(app.config.get('FLASKY_WARMUP_CONNECTIONS'))),
+             ('templates', lambda: compile_templates(app)),
+             ('roles', preload_roles)]
+    timings = {}
+    with app.app_context():
+        for name, step in steps:
+            if name not in app.config.get('FLASKY_WARMUP_STEPS', ('connections', 'templates', 'roles')):
+                continue
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                app.logger.warning('Warm-up step %s failed: %s', name, e)
+                continue
+            timings[name] = time.perf_counter() - start
+    _warmed_apps.add(app)
+    app.logger.info('Warm-up finished: %s', ', '.join(
+        '%s %.1f ms' % (name, t * 1000) for name, t in timings.items()))
+    return timings
@@ -0,0 +1,23 @@
+# 对比同步视图与异步视图（FLASKY_ASYNC_VIEWS）在多线程 WSGI 服务器上的认证流程吞吐量
+# 运行方式：python -m benchmarks.async_views [用户数] [并发数] [哈希方法]
+import sys
+from benchmarks import auth_flow
+
+
+def run(users=40, concurrency=8, hash_method='pbkdf2:sha256:100000'):
+    results = []
+    for name, async_views in [('sync', False), ('async', True)]:
+        with auth_flow.bench_app('sqlite', hash_method, FLASKY_ASYNC_VIEWS=async_views,
+                                 PASSWORD_HASH_WORKERS=4) as app:
+            results.append((name, auth_flow.run(app, users, concurrency, server=True)))
+    return results
+
+
+if __name__ == '__main__':
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    hash_method = sys.argv[3] if len(sys.argv) > 3 else 'pbkdf2:sha256:100000'
+    print('%-6s %10s %10s %10s %7s' % ('views', 'req/sec', 'p50 (ms)', 'p99 (ms)', 'errors'))
+    for name, r in run(users, concurrency, hash_method):
+        print('%-6s %10.1f %10.1f %10.1f %7d' % (name, r['req_per_sec'], r['p50_ms'],
+                                                  r['p99_ms'], r['errors']))
@@ -0,0 +1,204 @@
+# 认证流程压测：每个虚拟用户依次执行 注册 → 登录 → 确认账户 → 修改密码 → 退出，
+# 可以通过 Flask 测试客户端运行，也可以启动真实的 WSGI 服务器并发访问，
+# 输出每秒请求数、p50/p99 延迟和每个请求的 SQL 查询数，并可与基线 JSON 比较
+# 一般通过 flask bench 命令运行
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from http.cookiejar import CookieJar
+from config import config, TestingConfig
+
+STEPS = ['register', 'login', 'confirm', 'change_password', 'logout']
+
+
+# 压测使用的应用：关闭 CSRF 和限流，数据库为内存或临时 SQLite 文件。
+# 配置只在创建应用时注册到 config 中，退出 with 块时关闭连接并删除临时目录
+@contextmanager
+def bench_app(db, hash_method=None, **extra):
+    from app import create_app, db as database
+    overrides = {'WTF_CSRF_ENABLED': False, 'RATELIMIT_ENABLED': False,
+                 'METRICS_SAMPLE_RATE': 1.0}
+    overrides.update(extra)
+    tmpdir = None
+    if db == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='flasky-bench-')
+        overrides['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.sqlite')
+    else:
+        overrides['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    if hash_method:
+        overrides['PASSWORD_HASH_METHOD'] = hash_method
+    config['bench'] = type('BenchConfig', (TestingConfig,), overrides)
+    try:
+        app = create_app('bench')
+    finally:
+        del config['bench']
+    try:
+        yield app
+    finally:
+        with app.app_context():
+            database.session.remove()
+            database.engine.dispose()
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+# 测试客户端：直接调用 WSGI 应用，不经过网络
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        return self.client.open(path, method=method, data=data).status_code
+
+
+# 压测时不输出每个请求的访问日志
+def quiet_handler():
+    from werkzeug.serving import WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+    return QuietHandler
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# 真实 HTTP 客户端：每个虚拟用户有自己的 cookie，不跟随重定向
+class HTTPSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def run_user(app, session, i, latencies, errors):
+    from app.models import User
+    email = 'bench%d@example.com' % i
+    password = 'cat%d' % i
+
+    def step(name, method, path, data=None):
+        start = time.perf_counter()
+        status = session.request(method, path, data)
+        latencies[name].append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append((name, status))
+
+    step('register', 'POST', '/auth/register',
+         {'email': email, 'username': 'bench%d' % i, 'password': password, 'password2': password})
+    step('login', 'POST', '/auth/login', {'email': email, 'password': password})
+    with app.app_context():
+        user = User.query.filter_by(email=email).first()
+        token = user.generate_confirmation_token() if user is not None else 'missing'
+    step('confirm', 'GET', '/auth/confirm/' + token)
+    step('change_password', 'POST', '/auth/change-password',
+         {'old_password': password, 'password': password + 'x', 'password2': password + 'x'})
+    step('logout', 'GET', '/auth/logout')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(app, users=50, concurrency=1, server=False):
+    from app import db
+    from app.metrics import metrics
+    from app.models import Role
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+    metrics.sample_rate = 1.0
+    metrics.reset()
+    httpd = None
+    if server:
+        from werkzeug.serving import make_server
+        httpd = make_server('127.0.0.1', 0, app, threaded=True,
+                            request_handler=quiet_handler())
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base_url = 'http://127.0.0.1:%d' % httpd.server_port
+
+    latencies = {name: [] for name in STEPS}
+    errors = []
+    next_user = iter(range(users))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                i = next(next_user, None)
+            if i is None:
+                return
+            session = HTTPSession(base_url) if server else TestClientSession(app)
+            run_user(app, session, i, latencies, errors)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if httpd is not None:
+        httpd.shutdown()
+
+    all_latencies = [v for values in latencies.values() for v in values]
+    snapshot = metrics.snapshot()
+    requests = sum(ep['count'] for ep in snapshot.values())
+    queries = sum(ep['queries'] for ep in snapshot.values())
+    return {
+        'requests': len(all_latencies),
+        'errors': len(errors),
+        'req_per_sec': len(all_latencies) / elapsed,
+        'p50_ms': percentile(all_latencies, 50) * 1000,
+        'p99_ms': percentile(all_latencies, 99) * 1000,
+        'queries_per_request': queries / requests if requests else 0.0,
+        'steps': {name: {'p50_ms': percentile(values, 50) * 1000,
+                         'p99_ms': percentile(values, 99) * 1000}
+                  for name, values in latencies.items()},
+    }
+
+
+# 与基线比较，返回回归项列表：吞吐量下降或 p99 上升超过容差，或每请求查询数增加
+def compare(result, baseline, tolerance=0.2):
+    regressions = []
+    if result['req_per_sec'] < baseline['req_per_sec'] * (1 - tolerance):
+        regressions.append('req_per_sec %.1f < baseline %.1f'
+                           % (result['req_per_sec'], baseline['req_per_sec']))
+    if result['p99_ms'] > baseline['p99_ms'] * (1 + tolerance):
+        regressions.append('p99_ms %.1f > baseline %.1f' % (result['p99_ms'], baseline['p99_ms']))
+    if result['queries_per_request'] > baseline['queries_per_request'] + 0.01:
+        regressions.append('queries_per_request %.2f > baseline %.2f'
+                           % (result['queries_per_request'], baseline['queries_per_request']))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, result):
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
@@ -0,0 +1,52 @@
+# 测量各配置下创建应用实例的冷启动时间、第一个请求的延迟和进程内存峰值（RSS）
+# 每次都在新的 Python 进程中执行，模拟 worker 启动
+# 运行方式：python -m benchmarks.cold_start [重复次数]
+import os
+import subprocess
+import sys
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+SCRIPT = '''
+import resource, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app(sys.argv[1])
+elapsed = time.perf_counter() - start
+client = app.test_client()
+start = time.perf_counter()
+client.get('/auth/login')
+first = time.perf_counter() - start
+print(elapsed, first, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+      'alembic' in sys.modules)
+'''
+
+
+def measure(config_name, repeat=5, warmup=None):
+    times, firsts, rss = [], [], []
+    alembic_loaded = False
+    env = dict(os.environ)
+    if warmup is not None:
+        env['FLASKY_WARMUP'] = 'true' if warmup else 'false'
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', SCRIPT, config_name],
+                                      cwd=basedir, env=env)
+        elapsed, first, maxrss, loaded = out.decode().split()
+        times.append(float(elapsed))
+        firsts.append(float(first))
+        rss.append(int(maxrss))
+        alembic_loaded = loaded == 'True'
+    times.sort()
+    firsts.sort()
+    return times[len(times) // 2], firsts[len(firsts) // 2], max(rss), alembic_loaded
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print('%-12s %7s %14s %19s %12s %8s' % ('config', 'warm-up', 'startup (ms)',
+                                             'first request (ms)', 'RSS (KiB)', 'alembic'))
+    for name, warmup in [('development', False), ('development', True),
+                         ('production', False), ('production', True)]:
+        elapsed, first, rss, loaded = measure(name, repeat, warmup)
+        print('%-12s %7s %14.1f %19.1f %12d %8s' % (name, warmup, elapsed * 1000,
+                                                     first * 1000, rss, loaded))
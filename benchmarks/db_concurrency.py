@@ -0,0 +1,69 @@
+# SQLite 并发读写测试：比较默认设置与 SQLITE_PRAGMAS 调优后（WAL 等）的读写吞吐量
+# 运行方式：python -m benchmarks.db_concurrency [秒数] [读线程数]
+import os
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from app.database import _set_pragmas
+from config import sqlite_pragmas
+
+
+def run(pragmas, seconds=3.0, readers=4):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine('sqlite:///' + os.path.join(tmp, 'bench.sqlite'),
+                               connect_args={'timeout': 5})
+        if pragmas:
+            event.listen(engine, 'connect', _set_pragmas(pragmas))
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR(64))'))
+            conn.execute(text('INSERT INTO users (email) VALUES (:e)'),
+                         [{'e': 'user%d@example.com' % i} for i in range(1000)])
+        counts = {'read': 0, 'write': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def reader():
+            n = 0
+            with engine.connect() as conn:
+                while time.perf_counter() < deadline:
+                    conn.execute(text('SELECT email FROM users WHERE id = :id'),
+                                 {'id': n % 1000 + 1}).first()
+                    conn.rollback()
+                    n += 1
+            with lock:
+                counts['read'] += n
+
+        def writer():
+            n = errors = 0
+            while time.perf_counter() < deadline:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text('INSERT INTO users (email) VALUES (:e)'),
+                                     {'e': 'new%d@example.com' % n})
+                    n += 1
+                except OperationalError:
+                    errors += 1
+            with lock:
+                counts['write'] += n
+                counts['errors'] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        engine.dispose()
+    return {k: v / seconds if k != 'errors' else v for k, v in counts.items()}
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print('%-10s %12s %12s %8s' % ('profile', 'reads/sec', 'writes/sec', 'errors'))
+    for name, pragmas in [('default', {}), ('tuned', sqlite_pragmas())]:
+        r = run(pragmas, seconds, readers)
+        print('%-10s %12.0f %12.0f %8d' % (name, r['read'], r['write'], r['errors']))
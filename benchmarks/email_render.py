@@ -0,0 +1,40 @@
+# 对比邮件模板的两种渲染方式的单封邮件耗时：
+# 原来的 render_template（需要请求上下文）与缓存编译模板的 EmailTemplates.render
+# 运行方式：python -m benchmarks.email_render [次数]
+import sys
+import timeit
+from types import SimpleNamespace
+from flask import render_template
+from app import create_app
+from app.email import EmailTemplates
+
+TEMPLATES = ['auth/email/confirm', 'auth/email/reset_password', 'auth/email/change_email']
+
+
+def run(number=2000):
+    app = create_app('testing')
+    templates = EmailTemplates(app)
+    user = SimpleNamespace(id=1, username='john', email='john@example.com')
+    token = 'x' * 120
+    results = []
+    with app.test_request_context(base_url='http://localhost/'):
+        for name in TEMPLATES:
+            def before():
+                render_template(name + '.txt', user=user, token=token)
+                render_template(name + '.html', user=user, token=token)
+
+            def after():
+                templates.render(name, 'http://localhost/', user=user, token=token)
+            before()
+            after()
+            t_before = timeit.timeit(before, number=number) / number
+            t_after = timeit.timeit(after, number=number) / number
+            results.append((name, t_before, t_after))
+    return results
+
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print('%-30s %12s %12s %8s' % ('template', 'before (us)', 'after (us)', 'speedup'))
+    for name, t_before, t_after in run(number):
+        print('%-30s %12.1f %12.1f %7.2fx' % (name, t_before * 1e6, t_after * 1e6, t_before / t_after))
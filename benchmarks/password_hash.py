@@ -0,0 +1,33 @@
+# 测量不同密码哈希设置下每秒可计算的哈希数，用于选择 PASSWORD_HASH_METHOD
+# 运行方式：python -m benchmarks.password_hash [方法 ...]
+import sys
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+
+METHODS = [
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:100000',
+]
+
+
+def run(methods=METHODS, seconds=1.0):
+    results = []
+    for method in methods:
+        pwhash = generate_password_hash('cat', method)
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            check_password_hash(pwhash, 'cat')
+            count += 1
+        results.append((method, count / (time.perf_counter() - start)))
+    return results
+
+
+if __name__ == '__main__':
+    methods = sys.argv[1:] or METHODS
+    print('%-24s %12s' % ('method', 'hashes/sec'))
+    for method, rate in run(methods):
+        print('%-24s %12.1f' % (method, rate))
@@ -0,0 +1,61 @@
+# 比较签名 cookie 会话和服务器端会话：每个请求携带的 cookie 字节数，
+# 以及会话的加载和保存耗时（只读、修改、完全不访问会话三种请求）
+# 运行方式：python -m benchmarks.sessions [次数]
+import hashlib
+import sys
+import time
+from flask.sessions import SecureCookieSessionInterface
+from app import create_app
+from app.sessions import ServerSessionInterface
+
+# 登录用户的典型会话内容：Flask-Login 的字段、CSRF 令牌、权限掩码和一条闪现消息
+SESSION = {
+    '_user_id': '1024',
+    '_fresh': True,
+    '_id': hashlib.sha512(b'127.0.0.1|Mozilla/5.0').hexdigest(),
+    'csrf_token': hashlib.sha1(b'csrf').hexdigest(),
+    '_perms': [1024, 7, time.time_ns()],
+    '_flashes': [('message', 'You have confirmed your account. Thanks!')],
+}
+
+
+def make_cookie(app, interface):
+    session = interface.open_session(app, app.request_class({}))
+    session.update(SESSION)
+    response = app.response_class()
+    interface.save_session(app, session, response)
+    return response.headers['Set-Cookie'].split(';')[0]
+
+
+def per_request(app, interface, cookie, access, number):
+    request = app.request_class({'HTTP_COOKIE': cookie})
+    start = time.perf_counter()
+    for _ in range(number):
+        request.__dict__.pop('cookies', None)  # 每次重新解析 cookie
+        session = interface.open_session(app, request)
+        access(session)
+        interface.save_session(app, session, app.response_class())
+    return (time.perf_counter() - start) / number
+
+
+def run(number=2000):
+    app = create_app('testing')
+    results = []
+    for name, interface in [('signed cookie', SecureCookieSessionInterface()),
+                            ('server-side', ServerSessionInterface(app))]:
+        cookie = make_cookie(app, interface)
+        baseline = per_request(app, interface, cookie, lambda s: None, number)
+        read = per_request(app, interface, cookie, lambda s: s.get('_user_id'), number)
+        write = per_request(app, interface, cookie,
+                            lambda s: s.__setitem__('_fresh', False), number)
+        results.append((name, len(cookie), baseline, read, write))
+    return results
+
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print('%-14s %14s %16s %12s %12s' % ('session', 'cookie bytes', 'untouched (us)',
+                                         'read (us)', 'write (us)'))
+    for name, size, baseline, read, write in run(number):
+        print('%-14s %14d %16.1f %12.1f %12.1f' % (name, size, baseline * 1e6,
+                                                   read * 1e6, write * 1e6))
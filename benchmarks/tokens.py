@@ -0,0 +1,39 @@
+# 测量每秒可验证的令牌数：每次新建序列化器（原来的做法）、复用缓存的序列化器，
+# 以及否定缓存直接拒绝无效令牌的情况
+# 运行方式：python -m benchmarks.tokens [秒数]
+import sys
+import time
+from itsdangerous import URLSafeTimedSerializer
+from app import create_app
+from app.tokens import TokenService
+
+
+def rate(func, seconds):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def run(seconds=1.0):
+    app = create_app('testing')
+    secret = app.config['SECRET_KEY']
+    service = TokenService(app)
+    old_token = URLSafeTimedSerializer(secret).dumps({'confirm': 1})
+    token = service.generate('confirm', {'confirm': 1})
+    invalid = service.generate('confirm', {'confirm': 2}) + 'a'
+    service.verify('confirm', invalid)
+    return [
+        ('new serializer per call', rate(lambda: URLSafeTimedSerializer(secret).loads(old_token), seconds)),
+        ('cached serializer', rate(lambda: service.verify('confirm', token), seconds)),
+        ('invalid token (negative cache)', rate(lambda: service.verify('confirm', invalid), seconds)),
+    ]
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print('%-32s %14s' % ('case', 'tokens/sec'))
+    for name, r in run(seconds):
+        print('%-32s %14.0f' % (name, r))
@@ -1,10 +1,47 @@
 import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+# 数据库引擎参数：SQLite 只设置等待锁的超时时间，服务器型数据库（MySQL、PostgreSQL 等）
+# 配置连接池大小、溢出数、取用前检测和回收时间，均可通过环境变量覆盖
+def engine_options(uri):
+    if uri.startswith('sqlite'):
+        return {'connect_args': {'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')) / 1000}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1'],
+    }
+
+
+# 每次建立 SQLite 连接时执行的 PRAGMA：WAL 模式允许读写并发，
+# synchronous=NORMAL 在 WAL 下仍然安全，并启用内存映射和更大的页缓存
+def sqlite_pragmas():
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-65536')),  # 负数单位为 KiB
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+
+# 只读副本：环境变量中逗号分隔的数据库 URL，依次命名为 replica1、replica2……
+def replica_binds(urls):
+    return {'replica%d' % (i + 1): url.strip()
+            for i, url in enumerate((urls or '').split(',')) if url.strip()}
+
 # 开发过程中可使用这些设置的默认值，但在生产服务器中应该通过环境变量设定各个值
 # 基类 Config 定义各个配置通用的属性
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard to guess string'
+    # 轮换密钥时把旧密钥放在这里（逗号分隔），旧密钥签名的令牌仍然有效
+    SECRET_KEY_FALLBACKS = [k for k in os.environ.get('SECRET_KEY_FALLBACKS', '').split(',') if k]
+    # 签名无效或已过期令牌的否定缓存，容量和保留时间（秒）
+    TOKEN_NEGATIVE_CACHE_SIZE = int(os.environ.get('TOKEN_NEGATIVE_CACHE_SIZE', '10000'))
+    TOKEN_NEGATIVE_CACHE_TTL = int(os.environ.get('TOKEN_NEGATIVE_CACHE_TTL', '3600'))
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', '587'))
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in \
@@ -14,7 +51,106 @@ class Config:
     FLASKY_MAIL_SUBJECT_PREFIX = '[Flasky]'
     FLASKY_MAIL_SENDER = 'Flasky Admin <flasky@example.com>'
     FLASKY_ADMIN = os.environ.get('FLASKY_ADMIN')
+    # 后台邮件分发器：线程数、队列长度，以及队列满时的策略（block/drop/spill）
+    MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', '2'))
+    MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE', '100'))
+    MAIL_QUEUE_POLICY = os.environ.get('MAIL_QUEUE_POLICY', 'block')
+    MAIL_QUEUE_TIMEOUT = float(os.environ.get('MAIL_QUEUE_TIMEOUT', '1.0'))
+    MAIL_SPILL_DIR = os.environ.get('MAIL_SPILL_DIR') or os.path.join(basedir, 'mail-spill')
+    MAIL_MAX_RETRIES = int(os.environ.get('MAIL_MAX_RETRIES', '3'))
+    MAIL_RETRY_BACKOFF = float(os.environ.get('MAIL_RETRY_BACKOFF', '0.5'))
+    MAIL_IDLE_TIMEOUT = float(os.environ.get('MAIL_IDLE_TIMEOUT', '30'))
+    # 在后台邮件线程中渲染邮件模板；没有请求上下文时邮件链接使用 FLASKY_MAIL_BASE_URL
+    MAIL_RENDER_IN_WORKER = os.environ.get('MAIL_RENDER_IN_WORKER', 'true').lower() in \
+        ['true', 'on', '1']
+    FLASKY_MAIL_BASE_URL = os.environ.get('FLASKY_MAIL_BASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 读写分离：SQLALCHEMY_REPLICAS 为 SQLALCHEMY_BINDS 中作为只读副本的绑定，
+    # 写入提交后 SQLALCHEMY_REPLICA_STICKY 秒内的读取仍使用主库
+    SQLALCHEMY_BINDS = {}
+    SQLALCHEMY_REPLICAS = []
+    SQLALCHEMY_REPLICA_STICKY = int(os.environ.get('SQLALCHEMY_REPLICA_STICKY', '5'))
+    # 密码哈希算法及参数（werkzeug 格式，如 scrypt:32768:8:1、pbkdf2:sha256:600000），
+    # 已保存的哈希参数过时时会在登录成功后自动重新计算
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', '16'))
+    # 哈希计算的线程/进程池大小（0 表示在请求线程中计算）及最大排队数
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '0'))
+    PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '5.0'))
+    # load_user 的用户/角色缓存，USER_CACHE_BACKEND 可设置为多进程共享的缓存后端
+    USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'true').lower() in \
+        ['true', 'on', '1']
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '60'))
+    USER_CACHE_BACKEND = None
+    # 进程内缓存角色版本号的秒数，其他进程修改角色后最多经过这么久生效
+    USER_CACHE_VERSION_TTL = float(os.environ.get('USER_CACHE_VERSION_TTL', '1'))
+    # permission_required 直接使用会话中保存的角色权限掩码，不再查询 roles 表
+    FLASKY_SESSION_PERMISSIONS = os.environ.get('FLASKY_SESSION_PERMISSIONS', 'true').lower() in \
+        ['true', 'on', '1']
+    # 登录、重置密码、确认账户接口的限流设置，(次数, 秒数)，分别按客户端 IP 和账户计数，
+    # 登录的账户限制只统计密码错误的次数
+    # RATELIMIT_STORAGE 可设置为多 worker 共享的计数器存储
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in \
+        ['true', 'on', '1']
+    RATELIMIT_STORAGE = None
+    # 应用前面的反向代理层数，大于 0 时按 X-Forwarded-For 取客户端地址（限流按此地址计数）
+    FLASKY_PROXY_FIX = int(os.environ.get('FLASKY_PROXY_FIX', '0'))
+    RATELIMIT_LIMITS = {
+        'login': {'ip': (20, 60), 'account': (5, 60)},
+        'reset': {'ip': (10, 600), 'account': (3, 600)},
+        'confirm': {'ip': (20, 60), 'account': (5, 600)},
+    }
+    # 注册、重置密码等视图使用异步版本（需要安装 asgiref）
+    FLASKY_ASYNC_VIEWS = os.environ.get('FLASKY_ASYNC_VIEWS', 'false').lower() in \
+        ['true', 'on', '1']
+    # 健康检查端点，这些请求不加载会话中的用户
+    FLASKY_HEALTH_ENDPOINTS = ['main.healthz', 'main.readyz']
+    # 创建应用时预热：建立连接池中的连接（数量为 0 时使用连接池大小）、编译模板、加载角色
+    FLASKY_WARMUP = os.environ.get('FLASKY_WARMUP', 'false').lower() in ['true', 'on', '1']
+    FLASKY_WARMUP_CONNECTIONS = int(os.environ.get('FLASKY_WARMUP_CONNECTIONS', '0'))
+    FLASKY_WARMUP_STEPS = ('connections', 'templates', 'roles')
+    # 服务器端会话：cookie 中只保存会话 ID，SESSION_STORE 可设置为多进程共享的存储
+    FLASKY_SERVER_SESSIONS = os.environ.get('FLASKY_SERVER_SESSIONS', 'false').lower() in \
+        ['true', 'on', '1']
+    SESSION_STORE = None
+    SESSION_STORE_SIZE = int(os.environ.get('SESSION_STORE_SIZE', '10000'))
+    # 匿名用户页面缓存的条目数、过期时间（秒）和参与缓存键的语言
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', 'true').lower() in \
+        ['true', 'on', '1']
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', '256'))
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', '300'))
+    PAGE_CACHE_LANGUAGES = ['en']
+    # 模板片段缓存（如 base.html 的导航栏）的条目数和过期时间（秒）
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', 'true').lower() in \
+        ['true', 'on', '1']
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '256'))
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', '3600'))
+    # 后台任务：最大尝试次数、重试退避基数（秒）、running 状态超时后重新排队的秒数、
+    # 未确认用户和已结束任务的保留天数、分批删除的每批行数，以及定时任务（cron 表达式）
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', '3'))
+    JOBS_RETRY_BACKOFF = int(os.environ.get('JOBS_RETRY_BACKOFF', '30'))
+    JOBS_TIMEOUT = int(os.environ.get('JOBS_TIMEOUT', '600'))
+    JOBS_UNCONFIRMED_DAYS = int(os.environ.get('JOBS_UNCONFIRMED_DAYS', '7'))
+    JOBS_RETENTION_DAYS = int(os.environ.get('JOBS_RETENTION_DAYS', '7'))
+    JOBS_DELETE_BATCH = int(os.environ.get('JOBS_DELETE_BATCH', '500'))
+    JOBS_SCHEDULE = {
+        'purge_unconfirmed': {'cron': '0 3 * * *'},
+        'purge_jobs': {'cron': '30 3 * * *'},
+        'requeue_mail': {'cron': '*/5 * * * *'},
+    }
+    # 分批回填（app/backfill.py）的每批行数和批次之间暂停的秒数
+    BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', '1000'))
+    BACKFILL_PAUSE = float(os.environ.get('BACKFILL_PAUSE', '0.05'))
+    # 请求指标的抽样比例，以及输出指标的 URL（为空则不注册该端点）
+    METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.1'))
+    METRICS_ENDPOINT = os.environ.get('METRICS_ENDPOINT', '/metrics')
+    # 访问指标端点所需的令牌（Authorization: Bearer <token>），为空则只允许本机访问
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # SQLite 连接建立时执行的 PRAGMA，为空则使用 SQLite 默认设置
+    SQLITE_PRAGMAS = {}
 
     # 初始化应用程序的静态方法，用于定制自定义配置
     @staticmethod
@@ -28,6 +164,10 @@ class DevelopmentConfig(Config):
     # 定义开发环境的数据库位置，与其他环境区分开来
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_PRAGMAS = sqlite_pragmas()
+    SQLALCHEMY_BINDS = replica_binds(os.environ.get('DEV_DATABASE_REPLICA_URLS'))
+    SQLALCHEMY_REPLICAS = list(SQLALCHEMY_BINDS)
 
 
 # 测试环境的 config 子类
@@ -35,12 +175,35 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'  # 内存型数据库
+    # 测试中的密码只需要能验证，不需要抗暴力破解；依赖具体算法的测试自行设置
+    PASSWORD_HASH_METHOD = os.environ.get('TEST_PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
 
 
 # 生产环境的 config 子类
 class ProductionConfig(Config):
+    DEBUG = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_PRAGMAS = sqlite_pragmas()
+    SQLALCHEMY_BINDS = replica_binds(os.environ.get('DATABASE_REPLICA_URLS'))
+    SQLALCHEMY_REPLICAS = list(SQLALCHEMY_BINDS)
+    # 模板修改后不自动重新加载，编译结果缓存到磁盘，新进程启动时不用重新编译
+    TEMPLATES_AUTO_RELOAD = False
+    FLASKY_TEMPLATE_CACHE_DIR = os.environ.get('FLASKY_TEMPLATE_CACHE_DIR') or \
+        os.path.join(basedir, '.jinja-cache')
+    FLASKY_LAZY_MIGRATE = True
+    FLASKY_WARMUP = os.environ.get('FLASKY_WARMUP', 'true').lower() in ['true', 'on', '1']
+    # 生产环境默认不公开指标端点，需要时通过环境变量设置
+    METRICS_ENDPOINT = os.environ.get('METRICS_ENDPOINT')
+
+    @classmethod
+    def init_app(cls, app):
+        Config.init_app(app)
+        from jinja2 import FileSystemBytecodeCache
+        os.makedirs(cls.FLASKY_TEMPLATE_CACHE_DIR, exist_ok=True)
+        app.jinja_options = dict(app.jinja_options,
+                                 bytecode_cache=FileSystemBytecodeCache(cls.FLASKY_TEMPLATE_CACHE_DIR))
 
 
 # 将不同环境下的配置类映射到相应的键
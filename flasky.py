@@ -1,14 +1,12 @@
+import os
 import click
-# from flask_migrate import Migrate
 # 从 app 文件夹导入其下__init__.py 中的 create_app, db
 from app import create_app, db
 # 从 app 文件夹导入其下 model.py 中的 User 和 Role 
 from app.models import User, Role, Permission
 
-# 创建应用实例
-app = create_app()
-# app = create_app(os.getenv('FLASK_CONFIG') or 'default')
-# migrate = Migrate(app, db)
+# 创建应用实例，FLASK_CONFIG 选择配置（development、testing、production）
+app = create_app(os.getenv('FLASK_CONFIG') or 'default')
 
 
 @app.shell_context_processor
@@ -16,12 +14,309 @@ def make_shell_context():
     return dict(db=db, User=User, Role=Role, Permission=Permission)
 
 
+# 在子进程中运行一个测试模块（或测试名称），返回 (名称, 输出, 测试数, 失败数, 错误数, 耗时)
+def _run_tests(name):
+    import io
+    import time
+    import unittest
+    stream = io.StringIO()
+    start = time.perf_counter()
+    tests = unittest.TestLoader().loadTestsFromName(name)
+    result = unittest.TextTestRunner(stream=stream, verbosity=2).run(tests)
+    return (name, stream.getvalue(), result.testsRun, len(result.failures), len(result.errors),
+            time.perf_counter() - start)
+
+
+# tests 目录下的测试模块，按文件大小从大到小排列，耗时长的模块先开始，各进程的负载更均衡
+def _test_modules():
+    import glob
+    paths = sorted(glob.glob(os.path.join('tests', 'test_*.py')), key=os.path.getsize, reverse=True)
+    return ['tests.' + os.path.basename(path)[:-3] for path in paths]
+
+
 @app.cli.command()
 @click.argument('test_names', nargs=-1)
-def test(test_names):
+@click.option('--parallel', '-j', default=1, show_default=True,
+              help='Run test modules in this many worker processes.')
+def test(test_names, parallel):
+    """Run the unit tests."""
+    import sys
+    import time
     import unittest
-    if test_names:
-        tests = unittest.TestLoader().loadTestsFromNames(test_names)
+    if parallel <= 1:
+        if test_names:
+            tests = unittest.TestLoader().loadTestsFromNames(test_names)
+        else:
+            tests = unittest.TestLoader().discover('tests')
+        result = unittest.TextTestRunner(verbosity=2).run(tests)
+        sys.exit(0 if result.wasSuccessful() else 1)
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    # 每个工作进程依次领取下一个模块，模块内的测试在同一进程中按顺序执行，
+    # 各模块使用自己的应用实例和内存数据库，互不影响
+    start = time.perf_counter()
+    total = failures = errors = 0
+    with ProcessPoolExecutor(max_workers=parallel) as pool:
+        futures = [pool.submit(_run_tests, name) for name in test_names or _test_modules()]
+        for future in as_completed(futures):
+            name, output, count, failed, errored, seconds = future.result()
+            click.echo('== %s (%d tests, %.2fs)' % (name, count, seconds))
+            click.echo(output, err=True, nl=False)
+            total += count
+            failures += failed
+            errors += errored
+    click.echo('Ran %d tests in %.2fs with %d processes: %s' % (
+        total, time.perf_counter() - start, parallel,
+        'OK' if not failures and not errors else
+        'FAILED (failures=%d, errors=%d)' % (failures, errors)))
+    sys.exit(0 if not failures and not errors else 1)
+
+
+# 用测试客户端多次请求某个 URL，输出每个端点的平均耗时、SQL 查询次数和耗时、模板渲染耗时
+@app.cli.command()
+@click.argument('path', default='/')
+@click.option('--requests', '-n', 'count', default=100, show_default=True)
+@click.option('--method', default='GET', show_default=True)
+def profile(path, count, method):
+    """Profile requests to PATH with full instrumentation."""
+    from app.metrics import metrics
+    metrics.sample_rate = 1.0
+    metrics.reset()
+    client = app.test_client()
+    for _ in range(count):
+        client.open(path, method=method)
+    click.echo('%-28s %6s %10s %9s %10s %13s' % (
+        'endpoint', 'count', 'avg (ms)', 'queries', 'sql (ms)', 'template (ms)'))
+    for name, ep in sorted(metrics.snapshot().items()):
+        n = ep['count']
+        click.echo('%-28s %6d %10.2f %9.1f %10.2f %13.2f' % (
+            name, n, ep['latency_sum'] / n * 1000, ep['queries'] / n,
+            ep['sql_time'] / n * 1000, ep['template_time'] / n * 1000))
+
+
+# 认证流程压测，可与基线 JSON 比较，出现回归时以非零状态退出
+@app.cli.command()
+@click.option('--users', default=50, show_default=True, help='Number of virtual users.')
+@click.option('--concurrency', '-c', default=1, show_default=True)
+@click.option('--db', type=click.Choice(['memory', 'sqlite']), default='memory', show_default=True)
+@click.option('--server', is_flag=True, help='Run against a real threaded WSGI server.')
+@click.option('--hash-method', help='Override PASSWORD_HASH_METHOD.')
+@click.option('--baseline', type=click.Path(dir_okay=False), help='Baseline JSON to compare with.')
+@click.option('--save-baseline', is_flag=True, help='Write the result to --baseline.')
+@click.option('--tolerance', default=0.2, show_default=True)
+def bench(users, concurrency, db, server, hash_method, baseline, save_baseline, tolerance):
+    """Benchmark register, login, confirm, change-password and logout."""
+    import json
+    import sys
+    from benchmarks import auth_flow
+    # 内存数据库只有一个连接，多个线程并发会互相干扰
+    if db == 'memory' and concurrency > 1:
+        click.echo('In-memory database only supports --concurrency 1.', err=True)
+        concurrency = 1
+    with auth_flow.bench_app(db, hash_method) as bench_app:
+        result = auth_flow.run(bench_app, users, concurrency, server)
+    click.echo(json.dumps(result, indent=2, sort_keys=True))
+    if baseline and save_baseline:
+        auth_flow.save_baseline(baseline, result)
+    elif baseline:
+        regressions = auth_flow.compare(result, auth_flow.load_baseline(baseline), tolerance)
+        for line in regressions:
+            click.echo('REGRESSION: ' + line, err=True)
+        if regressions:
+            sys.exit(1)
+
+
+# 捕获测试和认证流程压测执行的查询，用 EXPLAIN 检查全表扫描，建议（并可生成迁移脚本）添加缺少的索引
+@app.cli.command('db-audit')
+@click.option('--tests/--no-tests', default=True, show_default=True,
+              help='Capture queries issued by the test suite.')
+@click.option('--bench/--no-bench', default=True, show_default=True,
+              help='Capture queries issued by the auth flow benchmark.')
+@click.option('--target', type=click.Choice(['database', 'models']), default='database',
+              show_default=True, help='Explain against the configured database or a scratch '
+                                      'database built from the models.')
+@click.option('--write-migration', is_flag=True,
+              help='Write an Alembic migration adding the proposed indexes.')
+@click.option('--verbose', '-v', is_flag=True, help='Print the plan of every statement.')
+def db_audit(tests, bench, target, write_migration, verbose):
+    """Explain captured queries and propose missing indexes."""
+    import io
+    import sys
+    import unittest
+    from sqlalchemy import create_engine, inspect
+    from app import audit
+    with audit.QueryRecorder() as recorder:
+        if tests:
+            unittest.TextTestRunner(stream=io.StringIO()).run(
+                unittest.TestLoader().discover('tests'))
+        if bench:
+            from benchmarks import auth_flow
+            with auth_flow.bench_app('memory', 'pbkdf2:sha256:1000') as bench_app:
+                auth_flow.run(bench_app, users=5)
+    if target == 'models':
+        engine = create_engine('sqlite://')
+        db.metadata.create_all(engine)
     else:
-        tests = unittest.TestLoader().discover('tests')
-    unittest.TextTestRunner(verbosity=2).run(tests)
\ No newline at end of file
+        engine = db.engine
+        if not inspect(engine).get_table_names():
+            click.echo('The database has no tables, run migrations or use --target models.',
+                       err=True)
+            sys.exit(1)
+    findings, proposals = audit.audit(engine, recorder.queries)
+    scanned = [f for f in findings if f['scans']]
+    click.echo('%d statements explained, %d with full scans.' % (len(findings), len(scanned)))
+    for f in findings if verbose else scanned:
+        click.echo('\n[%dx] %s' % (f['count'], ' '.join(f['statement'].split())))
+        for line in f['plan']:
+            click.echo('    ' + line)
+        if f['scans'] and not f['proposals']:
+            click.echo('    full scan without a filter column, an index would not help')
+    if not proposals:
+        click.echo('\nNo missing indexes.')
+        return
+    click.echo('\nProposed indexes:')
+    for table, column in proposals:
+        click.echo('    %s ON %s (%s)' % (audit.index_name(table, column), table, column))
+    if write_migration:
+        config = app.extensions['migrate'].migrate.get_config()
+        click.echo('Wrote ' + audit.write_migration(config, proposals))
+
+
+# 分批回填：flask backfill users_member_since，--dry-run 只预估耗时，中断后再次运行从检查点继续
+@app.cli.command()
+@click.argument('name')
+@click.option('--batch-size', type=int, help='Rows per batch [default: BACKFILL_BATCH_SIZE].')
+@click.option('--pause', type=float, help='Seconds between batches [default: BACKFILL_PAUSE].')
+@click.option('--dry-run', is_flag=True, help='Estimate the run time without changing data.')
+@click.option('--restart', is_flag=True, help='Ignore the saved checkpoint.')
+def backfill(name, batch_size, pause, dry_run, restart):
+    """Run a chunked, resumable data backfill."""
+    import sys
+    from app.backfill import BACKFILLS
+    job = BACKFILLS.get(name)
+    if job is None:
+        click.echo('Unknown backfill %r, choose from: %s' % (name, ', '.join(sorted(BACKFILLS))),
+                   err=True)
+        sys.exit(1)
+    if dry_run:
+        estimate = job.estimate(db.engine, batch_size, pause)
+        click.echo('%d rows in %d batches, %.1f ms per batch, about %.1f s' % (
+            estimate['rows'], estimate['batches'], estimate['batch_seconds'] * 1000,
+            estimate['seconds']))
+        return
+
+    def progress(rows, batches):
+        click.echo('batch %d: %d rows' % (batches, rows))
+    result = job.run(db.engine, batch_size, pause, restart, progress)
+    if result['resumed_from'] is not None:
+        click.echo('Resumed after key %r.' % result['resumed_from'])
+    click.echo('%d rows in %d batches, %.1f s' % (result['rows'], result['batches'],
+                                                   result['seconds']))
+
+
+# 第一个迁移创建的 roles 和 users 表
+INITIAL_REVISION = '477b7d88b72c'
+
+
+# 部署时升级数据库并插入角色。db.create_all() 创建的数据库没有 alembic_version 表，
+# 直接升级会重复建表：结构与当前模型一致时标记为最新版本，只有最初的 roles 和 users 表时
+# 标记为第一个迁移后再升级，其他情况需要手动执行 flask db stamp <版本>
+@app.cli.command()
+def deploy():
+    """Upgrade the database and insert the roles."""
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from flask_migrate import stamp, upgrade
+    from sqlalchemy import inspect
+    with db.engine.connect() as conn:
+        context = MigrationContext.configure(conn)
+        tables = set(inspect(conn).get_table_names())
+        revision = None
+        if context.get_current_revision() is None and tables:
+            if not compare_metadata(context, db.metadata):
+                revision = 'head'
+            elif tables == {'roles', 'users'}:
+                revision = INITIAL_REVISION
+            else:
+                raise click.ClickException(
+                    'The database was not created by migrations and does not match any revision; '
+                    'run "flask db stamp <revision>" for the schema it has, then upgrade.')
+    if revision is not None:
+        click.echo('Stamping the database as %s.' % revision)
+        stamp(revision=revision)
+    upgrade()
+    Role.insert_roles()
+
+
+# 重新发送溢出到磁盘（MAIL_SPILL_DIR）的邮件，全部发送完后退出
+@app.cli.command('mail-requeue')
+def mail_requeue():
+    """Resend mail spilled to MAIL_SPILL_DIR."""
+    from app.email import dispatcher
+    total = 0
+    while True:
+        count = dispatcher.requeue_spilled()
+        dispatcher.join()
+        if not count:
+            break
+        total += count
+    click.echo('Requeued %d messages.' % total)
+
+
+# 后台任务 worker：flask worker -p 4，--once 执行完到期任务后退出（可由系统的 cron 调用）
+@app.cli.command()
+@click.option('--processes', '-p', default=2, show_default=True,
+              help='Worker processes, 0 runs jobs in this process.')
+@click.option('--batch-size', default=10, show_default=True, help='Jobs claimed per batch.')
+@click.option('--poll-interval', default=1.0, show_default=True)
+@click.option('--once', is_flag=True, help='Run the jobs that are due and exit.')
+@click.option('--schedule/--no-schedule', default=True, show_default=True,
+              help='Enqueue the cron jobs in JOBS_SCHEDULE.')
+def worker(processes, batch_size, poll_interval, once, schedule):
+    """Run background jobs."""
+    import json
+    from app.jobs import Worker
+    stats = Worker(app, os.getenv('FLASK_CONFIG') or 'default', processes, batch_size,
+                   poll_interval, schedule).run(once)
+    click.echo(json.dumps(stats, indent=2, sort_keys=True))
+
+
+# 用户批量导入/导出：flask users import users.csv，flask users export users.jsonl
+@app.cli.group()
+def users():
+    """Bulk import and export users."""
+
+
+def _file_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+
+def _report(rows, rate):
+    click.echo('\r%d rows, %.0f rows/sec' % (rows, rate), nl=False, err=True)
+
+
+@users.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']))
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--processes', type=int, help='Password hashing processes.')
+def import_users(path, fmt, batch_size, processes):
+    """Import users from a CSV or JSONL file."""
+    from app.bulk_users import import_users
+    with open(path, newline='', encoding='utf-8') as f:
+        progress = import_users(f, _file_format(path, fmt), batch_size, processes, _report)
+    click.echo('\nImported %d users.' % progress.rows, err=True)
+
+
+@users.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']))
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--with-hashes', is_flag=True, help='Include password hashes.')
+def export_users(path, fmt, batch_size, with_hashes):
+    """Export users to a CSV or JSONL file."""
+    from app.bulk_users import export_users
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        progress = export_users(f, _file_format(path, fmt), batch_size, with_hashes, _report)
+    click.echo('\nExported %d users.' % progress.rows, err=True)
\ No newline at end of file
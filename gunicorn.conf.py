@@ -0,0 +1,12 @@
+# gunicorn 启动时自动读取当前目录下的 gunicorn.conf.py。
+# 使用 --preload 时应用在主进程中创建并预热（FLASKY_WARMUP），fork worker 之前关闭预热建立的
+# 数据库连接，每个 worker 启动后重新建立自己的连接
+from app.warmup import after_fork, before_fork
+
+
+def pre_fork(server, worker):
+    before_fork()
+
+
+def post_fork(server, worker):
+    after_fork()
@@ -65,7 +65,9 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        render_as_batch=url.startswith('sqlite'),
+        transaction_per_migration=True
     )
 
     with context.begin_transaction():
@@ -96,7 +98,11 @@ def run_migrations_online():
 
     connectable = get_engine()
 
+    # SQLite 的 ALTER TABLE 只支持少数操作，批处理模式下 alembic 通过复制表完成修改；
+    # 每个迁移单独一个事务，迁移中的分批回填（app/backfill.py）提交时不会带上其他迁移
     with connectable.connect() as connection:
+        conf_args.setdefault('render_as_batch', connection.dialect.name == 'sqlite')
+        conf_args.setdefault('transaction_per_migration', True)
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
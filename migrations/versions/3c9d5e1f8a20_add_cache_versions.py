@@ -0,0 +1,30 @@
+"""add cache_versions
+
+Revision ID: 3c9d5e1f8a20
+Revises: 8e3f6a2d7c15
+Create Date: 2026-10-19 09:12:44.530981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d5e1f8a20'
+down_revision = '8e3f6a2d7c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_versions = op.create_table('cache_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # 预先插入计数器，并发的第一次修改只需要 UPDATE
+    op.bulk_insert(cache_versions, [{'name': 'roles', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('cache_versions')
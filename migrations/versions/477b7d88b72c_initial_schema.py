@@ -0,0 +1,49 @@
+"""initial schema: roles and users
+
+Revision ID: 477b7d88b72c
+Revises: 
+Create Date: 2026-10-18 20:30:41.508129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '477b7d88b72c'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# 最初的 roles 和 users 表，之后的结构变更都在后续的迁移中
+def upgrade():
+    op.create_table('roles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=64), nullable=True),
+    sa.Column('default', sa.Boolean(), nullable=True),
+    sa.Column('permissions', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index('ix_roles_default', 'roles', ['default'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=64), nullable=True),
+    sa.Column('username', sa.String(length=64), nullable=True),
+    sa.Column('role_id', sa.Integer(), nullable=True),
+    sa.Column('password_hash', sa.String(length=128), nullable=True),
+    sa.Column('confirmed', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_users_username', table_name='users')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_table('users')
+    op.drop_index('ix_roles_default', table_name='roles')
+    op.drop_table('roles')
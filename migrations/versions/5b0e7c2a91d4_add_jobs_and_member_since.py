@@ -0,0 +1,44 @@
+"""add jobs table and users.member_since
+
+Revision ID: 5b0e7c2a91d4
+Revises: d339fc96748f
+Create Date: 2026-10-18 21:05:12.418236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e7c2a91d4'
+down_revision = 'd339fc96748f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('key', sa.String(length=128), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('max_attempts', sa.Integer(), nullable=True),
+    sa.Column('run_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_by', sa.String(length=64), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_jobs_status_run_at', 'jobs', ['status', 'run_at'], unique=False)
+    op.add_column('users', sa.Column('member_since', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('users', 'member_since')
+    op.drop_index('ix_jobs_status_run_at', table_name='jobs')
+    op.drop_table('jobs')
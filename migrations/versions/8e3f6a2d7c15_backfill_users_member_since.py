@@ -0,0 +1,36 @@
+"""backfill users.member_since and add backfill_checkpoints
+
+Revision ID: 8e3f6a2d7c15
+Revises: 5b0e7c2a91d4
+Create Date: 2026-10-18 22:14:37.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.backfill import run_in_migration
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3f6a2d7c15'
+down_revision = '5b0e7c2a91d4'
+branch_labels = None
+depends_on = None
+
+
+# 回填进度表此前由回填自动创建，已经存在时跳过
+def upgrade():
+    if op.get_context().as_sql or not sa.inspect(op.get_bind()).has_table('backfill_checkpoints'):
+        op.create_table('backfill_checkpoints',
+        sa.Column('name', sa.String(length=128), nullable=False),
+        sa.Column('last_key', sa.Integer(), nullable=True),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('done', sa.Boolean(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+        )
+    run_in_migration('users_member_since')
+
+
+def downgrade():
+    # 回填的数据与注册时写入的数据无法区分，保留
+    op.drop_table('backfill_checkpoints')
@@ -0,0 +1,33 @@
+"""widen users.password_hash to 256 characters
+
+Revision ID: a41f7b3e6d58
+Revises: 3c9d5e1f8a20
+Create Date: 2026-10-19 09:48:06.214570
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f7b3e6d58'
+down_revision = '3c9d5e1f8a20'
+branch_labels = None
+depends_on = None
+
+
+# scrypt 等算法的哈希超过 128 个字符；SQLite 上以批处理模式复制表完成修改
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=128),
+               type_=sa.String(length=256),
+               existing_nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=256),
+               type_=sa.String(length=128),
+               existing_nullable=True)
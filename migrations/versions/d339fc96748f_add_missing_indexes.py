@@ -0,0 +1,26 @@
+"""add missing indexes
+
+Revision ID: d339fc96748f
+Revises: 477b7d88b72c
+Create Date: 2026-10-18 20:42:59.782747
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd339fc96748f'
+down_revision = '477b7d88b72c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_roles_permissions', 'roles', ['permissions'], unique=False, if_not_exists=True)
+    op.create_index('ix_users_role_id', 'users', ['role_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_users_role_id', table_name='users', if_exists=True)
+    op.drop_index('ix_roles_permissions', table_name='roles', if_exists=True)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from config import config, TestingConfig
+from app.cache import user_cache
+from app.models import role_registry
+
+
+# pysqlite 默认在第一条写语句前才开始事务，并且会自行提交，SAVEPOINT 无法正常工作；
+# 关闭驱动的事务处理，由 SQLAlchemy 显式发出 BEGIN
+def _enable_sqlite_savepoints(engine):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+
+# 用临时配置创建测试应用：关闭 CSRF 和限流，数据库为内存或临时 SQLite 文件。
+# 配置只在创建应用时注册到 config 中，测试结束（tearDown 之后）关闭连接并删除临时目录
+def create_test_app(test, db_type='memory', hash_method='pbkdf2:sha256:1000', **overrides):
+    options = {'WTF_CSRF_ENABLED': False, 'RATELIMIT_ENABLED': False,
+               'PASSWORD_HASH_METHOD': hash_method, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'}
+    if db_type == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='flasky-test-')
+        test.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        options['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmpdir, 'test.sqlite')
+    options.update(overrides)
+    name = 'test-%x' % id(test)
+    config[name] = type('TestConfig', (TestingConfig,), options)
+    try:
+        app = create_app(name)
+    finally:
+        del config[name]
+
+    def dispose():
+        with app.app_context():
+            db.engine.dispose()
+    test.addCleanup(dispose)
+    return app
+
+
+# 事务型测试基类：每个测试类只创建一次应用和数据库表，create_fixtures() 中的数据也只创建一次。
+# 每个测试在一个外层事务中执行，测试中的 commit 只释放保存点，测试结束时回滚整个事务，
+# 数据库回到测试开始前的状态
+class TransactionalTestCase(unittest.TestCase):
+    config_name = 'testing'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(cls.config_name)
+        with cls.app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                _enable_sqlite_savepoints(db.engine)
+                # 丢弃已经建立的连接，之后的连接都经过上面的设置
+                db.engine.dispose()
+            db.create_all()
+            cls.create_fixtures()
+            db.session.remove()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    # 子类在这里创建所有测试共用的数据（已提交，不会被回滚）
+    @classmethod
+    def create_fixtures(cls):
+        pass
+
+    def setUp(self):
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self._session_options = db.session.session_factory.kw.copy()
+        db.session.configure(bind=self.connection, join_transaction_mode='create_savepoint')
+        # 进程内的缓存不随事务回滚，每个测试开始时清空
+        user_cache.clear()
+        role_registry.reload()
+
+    def tearDown(self):
+        db.session.remove()
+        db.session.session_factory.kw = self._session_options
+        self.transaction.rollback()
+        self.connection.close()
+        self.app_context.pop()
@@ -0,0 +1,38 @@
+import unittest
+from app import db
+from app.models import User, Role
+from tests.base import create_test_app
+
+
+class AsyncViewsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app(self, FLASKY_ASYNC_VIEWS=True, PASSWORD_HASH_WORKERS=2)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_async_views_installed(self):
+        import inspect
+        self.assertTrue(inspect.iscoroutinefunction(self.app.view_functions['auth.register']))
+
+    def test_register_and_change_email(self):
+        response = self.client.post('/auth/register', data={
+            'email': 'john@example.com', 'username': 'john',
+            'password': 'cat', 'password2': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        u = User.query.filter_by(email='john@example.com').first()
+        self.assertTrue(u.verify_password('cat'))
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        response = self.client.post('/auth/change-email', data={
+            'email': 'susan@example.com', 'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post('/auth/change-email', data={
+            'email': 'susan@example.com', 'password': 'dog'})
+        self.assertIn(b'Invalid email or password.', response.data)
@@ -0,0 +1,29 @@
+import unittest
+from app import db
+from app.models import User
+from benchmarks import auth_flow
+from tests.base import create_test_app
+
+
+class AuthFlowBenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app(self, METRICS_SAMPLE_RATE=1.0)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_flow_completes(self):
+        result = auth_flow.run(self.app, users=2)
+        self.assertEqual(result['requests'], 2 * len(auth_flow.STEPS))
+        self.assertEqual(result['errors'], 0)
+        with self.app.app_context():
+            self.assertTrue(all(u.confirmed for u in User.query.all()))
+
+    def test_compare(self):
+        baseline = {'req_per_sec': 100, 'p99_ms': 10, 'queries_per_request': 2}
+        self.assertEqual(auth_flow.compare(
+            {'req_per_sec': 90, 'p99_ms': 11, 'queries_per_request': 2}, baseline), [])
+        self.assertEqual(len(auth_flow.compare(
+            {'req_per_sec': 70, 'p99_ms': 20, 'queries_per_request': 3}, baseline)), 3)
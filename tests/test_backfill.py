@@ -0,0 +1,71 @@
+import unittest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from app import create_app, db
+from app.backfill import BACKFILLS, BackfillInterrupted, run_in_migration
+from app.models import User
+
+
+class BackfillTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for i in range(10):
+            db.session.add(User(email='user%d@example.com' % i, password='cat'))
+        db.session.commit()
+        # 模拟添加 member_since 列之前注册的用户
+        db.session.execute(sa.update(User).where(User.id % 4 != 0).values(member_since=None))
+        db.session.commit()
+        self.backfill = BACKFILLS['users_member_since']
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def missing(self):
+        return db.session.scalar(sa.select(sa.func.count()).where(User.member_since.is_(None)))
+
+    def test_run_in_batches(self):
+        self.assertEqual(self.missing(), 8)
+        result = self.backfill.run(db.engine, batch_size=3, pause=0)
+        self.assertEqual(result['rows'], 8)
+        self.assertEqual(result['batches'], 3)
+        self.assertEqual(self.missing(), 0)
+        # 已完成的回填不再执行
+        self.assertEqual(self.backfill.run(db.engine)['batches'], 0)
+
+    def test_resume_from_checkpoint(self):
+        def stop(rows, batches):
+            return batches < 2
+        with self.assertRaises(BackfillInterrupted):
+            self.backfill.run(db.engine, batch_size=3, pause=0, progress=stop)
+        with db.engine.connect() as conn:
+            state = self.backfill.checkpoint(conn)
+        self.assertEqual(state.rows, 6)
+        self.assertFalse(state.done)
+        self.assertEqual(self.missing(), 2)
+        result = self.backfill.run(db.engine, batch_size=3, pause=0)
+        self.assertEqual(result['resumed_from'], state.last_key)
+        self.assertEqual(result['rows'], 2)
+        self.assertEqual(self.missing(), 0)
+
+    def test_estimate_does_not_change_data(self):
+        estimate = self.backfill.estimate(db.engine, batch_size=3, pause=0.5)
+        self.assertEqual(estimate['rows'], 8)
+        self.assertEqual(estimate['batches'], 3)
+        self.assertGreaterEqual(estimate['seconds'], 1.0)
+        self.assertEqual(self.missing(), 8)
+
+    # 迁移中的回填先提交此前的结构变更，每批单独提交
+    def test_run_in_migration(self):
+        db.session.remove()
+        with db.engine.connect() as conn:
+            context = MigrationContext.configure(conn, opts={'transaction_per_migration': True})
+            with context.begin_transaction(), Operations.context(context):
+                result = run_in_migration('users_member_since', batch_size=5, pause=0)
+        self.assertEqual(result['batches'], 2)
+        self.assertEqual(self.missing(), 0)
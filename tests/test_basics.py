@@ -1,28 +1,22 @@
-import unittest
 from flask import current_app
-from app import create_app, db
+from app import db
+from app.models import User
+from tests.base import TransactionalTestCase
 
 
-class BasicsTestCase(unittest.TestCase):
-    # 测试起始
-    def setUp(self):
-        self.app = create_app('testing')
-        # 创建上下文
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        # 建立测试数据库
-        db.create_all()
-
-    # 测试结束
-    def tearDown(self):
-        # 删除测试数据库
-        db.session.remove()
-        db.drop_all()
-        # 关闭上下文
-        self.app_context.pop()
-        
+# 应用和测试数据库由 TransactionalTestCase 在测试类开始时创建、结束时删除
+class BasicsTestCase(TransactionalTestCase):
     def test_app_exists(self):
         self.assertFalse(current_app is None)
 
     def test_app_is_testing(self):
-        self.assertTrue(current_app.config['TESTING'])
\ No newline at end of file
+        self.assertTrue(current_app.config['TESTING'])
+
+    # 测试中提交的数据在测试结束时回滚
+    def test_commits_are_rolled_back(self):
+        db.session.add(User(email='john@example.com', password='cat'))
+        db.session.commit()
+        self.assertEqual(User.query.count(), 1)
+        self.tearDown()
+        self.setUp()
+        self.assertEqual(User.query.count(), 0)
@@ -0,0 +1,47 @@
+import io
+import unittest
+from app import create_app, db
+from app.bulk_users import import_users, export_users
+from app.models import User, Role, Permission
+
+
+class BulkUsersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([Role(name='User', default=True, permissions=Permission.FOLLOW),
+                            Role(name='Moderator', permissions=Permission.MODERATE)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_import_export_roundtrip(self):
+        f = io.StringIO('email,username,password,role,confirmed\n'
+                        'john@example.com,john,cat,,true\n'
+                        'susan@example.com,susan,dog,Moderator,false\n'
+                        'david@example.com,david,horse,,0\n')
+        progress = import_users(f, 'csv', batch_size=2, processes=2)
+        self.assertEqual(progress.rows, 3)
+        john = User.query.filter_by(username='john').first()
+        self.assertTrue(john.confirmed)
+        self.assertEqual(john.role.name, 'User')
+        self.assertTrue(john.verify_password('cat'))
+        self.assertEqual(User.query.filter_by(username='susan').first().role.name, 'Moderator')
+
+        out = io.StringIO()
+        self.assertEqual(export_users(out, 'jsonl', batch_size=2).rows, 3)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('"role": "Moderator"', lines[1])
+
+        db.session.execute(User.__table__.delete())
+        db.session.commit()
+        out.seek(0)
+        with self.assertRaises(ValueError):
+            import_users(out, 'jsonl', processes=1)
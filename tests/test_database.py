@@ -0,0 +1,29 @@
+import os
+import tempfile
+import unittest
+from sqlalchemy import text
+from app import create_app, db
+from app.database import configure_engines
+from config import sqlite_pragmas
+
+
+class DatabaseConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = create_app('testing')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sqlite_pragmas_applied_on_connect(self):
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + os.path.join(self.tmp.name, 'test.sqlite')
+        self.app.config['SQLITE_PRAGMAS'] = sqlite_pragmas()
+        self.app.extensions.pop('sqlalchemy')
+        db.init_app(self.app)
+        configure_engines(self.app)
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                self.assertEqual(conn.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+                self.assertEqual(conn.execute(text('PRAGMA synchronous')).scalar(), 1)
+            db.engine.dispose()
@@ -0,0 +1,51 @@
+import unittest
+from sqlalchemy import text
+from app import create_app, db
+from app.audit import QueryRecorder, audit, full_scans, migration_ops
+from app.models import User, Role, Permission
+
+
+class DbAuditTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_models_index_filter_columns(self):
+        with QueryRecorder() as recorder:
+            Role.query.filter_by(permissions=Permission.FOLLOW).all()
+            Role.query.filter_by(name='User').first().users.all()
+        findings, proposals = audit(db.engine, recorder.queries)
+        self.assertEqual(len(findings), 3)
+        self.assertEqual(proposals, [])
+
+    def test_missing_indexes_proposed(self):
+        db.session.execute(text('DROP INDEX ix_roles_permissions'))
+        db.session.execute(text('DROP INDEX ix_users_role_id'))
+        db.session.commit()
+        with QueryRecorder() as recorder:
+            Role.query.filter_by(permissions=Permission.FOLLOW).all()
+            Role.query.filter_by(name='User').first().users.all()
+            Role.query.all()
+        findings, proposals = audit(db.engine, recorder.queries)
+        self.assertEqual(proposals, [('roles', 'permissions'), ('users', 'role_id')])
+        # 没有过滤条件的全表扫描不建议索引
+        self.assertEqual(findings[-1]['scans'], ['roles'])
+        self.assertEqual(findings[-1]['proposals'], [])
+        upgrades, downgrades = migration_ops(proposals)
+        self.assertIn("op.create_index('ix_users_role_id', 'users', ['role_id']", upgrades)
+        self.assertIn("op.drop_index('ix_roles_permissions'", downgrades)
+
+    def test_full_scans(self):
+        self.assertEqual(full_scans(['SCAN users', 'SEARCH roles USING INTEGER PRIMARY KEY (rowid=?)',
+                                     'SCAN users USING INDEX ix_users_email', 'SCAN CONSTANT ROW']),
+                         ['users'])
+        self.assertEqual(full_scans(['Seq Scan on users  (cost=0.00..1.01 rows=1 width=4)']),
+                         ['users'])
@@ -0,0 +1,105 @@
+import unittest
+from flask import g, session
+from flask_login import login_user
+from sqlalchemy import event
+from werkzeug.exceptions import Forbidden
+from app import create_app, db
+from app.decorators import permission_required, user_can
+from app.cache import user_cache
+from app.models import CacheVersion, User, Role, Permission
+
+
+class SessionPermissionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_SESSION_PERMISSIONS'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.role = Role(name='Moderator', permissions=Permission.MODERATE)
+        self.user = User(email='john@example.com', password='cat', role=self.role)
+        db.session.add_all([self.role, self.user])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_mask_checked_without_queries(self):
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertTrue(user_can(Permission.MODERATE))
+            self.assertIn('_perms', session)
+            statements = []
+
+            def before_execute(conn, cursor, statement, *args):
+                statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', before_execute)
+            try:
+                self.assertTrue(user_can(Permission.MODERATE))
+                self.assertFalse(user_can(Permission.ADMIN))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', before_execute)
+            self.assertEqual(statements, [])
+
+    def test_role_change_refreshes_mask(self):
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertFalse(user_can(Permission.ADMIN))
+            self.role.add_permission(Permission.ADMIN)
+            db.session.commit()
+            self.assertTrue(user_can(Permission.ADMIN))
+            self.role.reset_permissions()
+            db.session.commit()
+            self.assertFalse(user_can(Permission.MODERATE))
+
+    # 版本号在提交时才变化，回滚的修改不影响会话中的掩码
+    def test_role_version_bumped_on_commit(self):
+        version = CacheVersion.get('roles')
+        self.role.add_permission(Permission.ADMIN)
+        db.session.rollback()
+        self.assertEqual(user_cache.role_version, version)
+        self.role.add_permission(Permission.ADMIN)
+        db.session.commit()
+        self.assertEqual(user_cache.role_version, version + 1)
+
+    # 修改用户的角色同样使会话中的掩码失效
+    def test_role_reassignment_refreshes_mask(self):
+        admin = Role(name='Administrator', permissions=Permission.ADMIN)
+        db.session.add(admin)
+        db.session.commit()
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertFalse(user_can(Permission.ADMIN))
+            self.user.role = admin
+            db.session.commit()
+            self.assertTrue(user_can(Permission.ADMIN))
+
+    def test_permission_required(self):
+        view = permission_required(Permission.ADMIN)(lambda: 'ok')
+        with self.app.test_request_context():
+            login_user(self.user)
+            with self.assertRaises(Forbidden):
+                view()
+            self.role.add_permission(Permission.ADMIN)
+            db.session.commit()
+            self.assertEqual(view(), 'ok')
+
+    # 用户被删除后，旧的会话 cookie 中的掩码不再有效
+    def test_deleted_user_mask_ignored(self):
+        self.role.add_permission(Permission.ADMIN)
+        db.session.commit()
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertTrue(user_can(Permission.ADMIN))
+            saved = dict(session)
+            # 测试中两个请求共用同一个应用上下文（以及 g 中保存的当前用户）
+            g.pop('_login_user')
+        user_id = self.user.id
+        db.session.delete(self.user)
+        db.session.commit()
+        user_cache.invalidate(user_id)
+        with self.app.test_request_context():
+            session.update(saved)
+            self.assertFalse(user_can(Permission.ADMIN))
@@ -0,0 +1,163 @@
+import os
+import socketserver
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from flask_mail import Message
+from app import create_app, db
+from app.email import EmailTemplates, MailDispatcher, mail_base_url, snapshot_context
+from app.models import User
+
+
+# 本地 SMTP 替身，只实现发送邮件所需的最少命令，并记录收到的邮件和连接数
+class SMTPSink(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip().upper()
+            if cmd.startswith('EHLO'):
+                self.reply('250 sink')
+            elif cmd == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b'.\r\n', b''):
+                        break
+                    data.append(line)
+                self.server.messages.append(b''.join(data))
+                self.reply('250 queued')
+            elif cmd == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class MailDispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sink = SMTPSink()
+        threading.Thread(target=self.sink.serve_forever, daemon=True).start()
+        self.app = create_app('testing')
+        self.app.config.update(MAIL_WORKERS=1, MAIL_QUEUE_SIZE=10)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        state = self.app.extensions['mail']
+        state.suppress = False
+        state.use_tls = False
+        state.server = '127.0.0.1'
+        state.port = self.sink.server_address[1]
+        self.dispatcher = MailDispatcher(self.app)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+        self.sink.shutdown()
+        self.sink.server_close()
+        self.app_context.pop()
+
+    def message(self, i=0):
+        return Message('hello %d' % i, sender='flasky@example.com',
+                       recipients=['john@example.com'], body='body')
+
+    def test_connection_reused(self):
+        for i in range(5):
+            self.assertTrue(self.dispatcher.submit(self.message(i)))
+        self.dispatcher.join()
+        self.assertEqual(len(self.sink.messages), 5)
+        self.assertEqual(self.sink.connections, 1)
+        stats = self.dispatcher.stats()
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_retry_after_connection_failure(self):
+        self.dispatcher.backoff = 0
+        self.app.extensions['mail'].port = 1
+        self.dispatcher.max_retries = 1
+        self.dispatcher.submit(self.message())
+        self.dispatcher.join()
+        stats = self.dispatcher.stats()
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['retries'], 1)
+
+    def test_drop_and_spill_when_full(self):
+        self.dispatcher.shutdown()
+        self.app.config.update(MAIL_QUEUE_SIZE=1, MAIL_QUEUE_POLICY='drop')
+        d = MailDispatcher(self.app)
+        d._start = lambda: None
+        self.assertTrue(d.submit(self.message()))
+        self.assertFalse(d.submit(self.message()))
+        self.assertEqual(d.stats()['dropped'], 1)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            d.policy = 'spill'
+            d.spill_dir = spill_dir
+            self.assertFalse(d.submit(self.message()))
+            self.assertEqual(d.stats()['spilled'], 1)
+            d._queue.get_nowait()
+            self.assertEqual(d.requeue_spilled(), 1)
+            self.assertEqual(d.stats()['queue_depth'], 1)
+
+    # 溢出到磁盘的邮件在分发器启动时重新发送
+    def test_spilled_mail_sent_on_start(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            self.dispatcher.spill_dir = spill_dir
+            self.dispatcher._spill(self.message(1))
+            self.assertTrue(self.dispatcher.submit(self.message(2)))
+            self.dispatcher.join()
+            self.assertEqual(len(self.sink.messages), 2)
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    # 排队的邮件只带模板用到的属性，不包含密码哈希
+    def test_snapshot_context_excludes_password_hash(self):
+        db.create_all()
+        try:
+            user = User(email='john@example.com', username='john', password='cat')
+            context = snapshot_context({'user': user, 'token': 'abc'})
+        finally:
+            db.session.remove()
+            db.drop_all()
+        self.assertEqual(context['user'].username, 'john')
+        self.assertEqual(context['token'], 'abc')
+        self.assertFalse(hasattr(context['user'], 'password_hash'))
+
+    # 应用挂载在子路径下时，邮件中的链接包含该路径
+    def test_base_url_keeps_script_root(self):
+        with self.app.test_request_context('/', base_url='http://example.com/flasky/'):
+            self.assertEqual(mail_base_url(self.app), 'http://example.com/flasky/')
+
+    def test_render_without_request_context(self):
+        templates = EmailTemplates(self.app)
+        user = SimpleNamespace(username='john')
+        body, html = templates.render('auth/email/confirm', 'https://example.com/',
+                                      user=user, token='abc')
+        self.assertIn('Dear john', body)
+        self.assertIn('https://example.com/auth/confirm/abc', body)
+        self.assertIn('href="https://example.com/auth/confirm/abc"', html)
+        self.assertIs(templates.get('auth/email/confirm.txt'),
+                      templates.get('auth/email/confirm.txt'))
+
+    def test_render_in_worker(self):
+        msg = self.message()
+        msg.pending_render = ('auth/email/reset_password', 'http://localhost/',
+                              dict(user=SimpleNamespace(username='john'), token='abc'))
+        self.dispatcher.submit(msg)
+        self.dispatcher.join()
+        self.assertIn(b'/auth/reset/abc', self.sink.messages[0])
@@ -0,0 +1,50 @@
+import unittest
+from flask import render_template_string
+from app import create_app, db
+from app.fragments import fragment_cache
+from app.models import User, Role
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cache_tag(self):
+        template = "{% cache 'greeting', n % 2 %}{{ n }}{% endcache %}"
+        with self.app.test_request_context():
+            self.assertEqual(render_template_string(template, n=1), '1')
+            self.assertEqual(render_template_string(template, n=3), '1')
+            self.assertEqual(render_template_string(template, n=2), '2')
+            fragment_cache.invalidate('greeting')
+            self.assertEqual(render_template_string(template, n=3), '3')
+
+    def test_escaping(self):
+        template = "{% cache 'escape' %}{{ s }}{% endcache %}"
+        with self.app.test_request_context():
+            render_template_string(template, s='<b>')
+            self.assertEqual(render_template_string(template, s='<b>'), '&lt;b&gt;')
+
+    def test_navbar_per_permission_class(self):
+        for name in ['john', 'susan']:
+            u = User(email=name + '@example.com', username=name, password='cat', confirmed=True)
+            db.session.add(u)
+        db.session.commit()
+        for name in ['john', 'susan']:
+            client = self.app.test_client()
+            client.post('/auth/login', data={'email': name + '@example.com', 'password': 'cat'})
+            response = client.get('/')
+            self.assertIn(b'Log Out', response.data)
+            self.assertIn(('Hello, %s!' % name).encode(), response.data)
+        # 匿名用户的导航栏在错误页面预渲染时已缓存，两个用户共用一个条目
+        self.assertEqual(fragment_cache.misses, 2)
+        self.assertGreaterEqual(fragment_cache.hits, 3)
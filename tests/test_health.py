@@ -0,0 +1,71 @@
+import os
+import unittest
+from app import create_app, db
+from app.email import dispatcher
+from app.models import Role
+from app.warmup import _reopen_connections, before_fork, warm_up
+from tests.base import create_test_app
+
+
+class HealthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_healthz(self):
+        response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'ok')
+
+    def test_readyz(self):
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['checks'], {'database': 'ok', 'mail': 'ok'})
+
+    def test_readyz_mail_queue_full(self):
+        for _ in range(dispatcher._queue.maxsize):
+            dispatcher._queue.put_nowait(None)
+        try:
+            response = self.client.get('/readyz')
+        finally:
+            while not dispatcher._queue.empty():
+                dispatcher._queue.get_nowait()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['checks']['mail'], 'error')
+
+    def test_warm_up(self):
+        Role.insert_roles()
+        self.app.jinja_env.cache.clear()
+        timings = warm_up(self.app)
+        self.assertEqual(sorted(timings), ['connections', 'roles', 'templates'])
+        self.assertIn('auth/login.html', [name for _, name in self.app.jinja_env.cache.keys()])
+        self.assertIsNotNone(self.app.extensions['role_registry']['roles'])
+
+    # fork worker 之前关闭预热建立的连接，worker 重新建立自己的连接
+    def test_warm_up_connections_closed_before_fork(self):
+        app = create_test_app(self, 'sqlite', FLASKY_WARMUP_CONNECTIONS=2)
+        with app.app_context():
+            db.create_all()
+            pool = db.engine.pool
+        warm_up(app)
+        self.assertEqual(pool.checkedin(), 2)
+        # 其他 fork（如进程池的子进程）不影响主进程的连接池
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(pool.checkedin(), 2)
+        before_fork()
+        with app.app_context():
+            pool = db.engine.pool
+        self.assertEqual(pool.checkedin(), 0)
+        _reopen_connections(app)
+        self.assertEqual(pool.checkedin(), 2)
@@ -0,0 +1,65 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.cache import user_cache
+from app.models import User, Role
+
+
+class HotPathsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['FLASKY_HEALTH_ENDPOINTS'] = ['ping']
+        self.app.add_url_rule('/ping', 'ping', lambda: 'ok')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.engine = db.engine
+        # 请求不在测试的应用上下文中执行，g 不会在请求之间共享
+        self.app_context.pop()
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        # 清空用户缓存，加载用户一定会查询数据库
+        user_cache.clear()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_queries(self, path):
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(self.engine, 'before_cursor_execute', before_execute)
+        self.app_context.pop()
+        try:
+            response = self.client.get(path)
+            response.close()
+        finally:
+            self.app_context.push()
+            event.remove(self.engine, 'before_cursor_execute', before_execute)
+        return response, len(statements)
+
+    def test_no_queries_for_static_health_and_errors(self):
+        response, queries = self.count_queries('/static/favicon.ico')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+        response, queries = self.count_queries('/ping')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+        response, queries = self.count_queries('/wp-login.php')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(queries, 0)
+
+    def test_unconfirmed_redirect_on_pages(self):
+        response, queries = self.count_queries('/')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith('/auth/unconfirmed'))
+        self.assertGreater(queries, 0)
@@ -0,0 +1,161 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.jobs import TASKS, Worker, claim, cron_next, enqueue, finish, requeue_stale, task
+from app.metrics import metrics
+from app.models import Job, User, Role, utcnow
+
+calls = []
+
+
+@task('test_record')
+def record(value):
+    calls.append(value)
+
+
+@task('test_fail')
+def fail():
+    raise RuntimeError('boom')
+
+
+@task('test_noop')
+def noop():
+    pass
+
+
+# 模拟被杀死的 worker 子进程
+@task('test_crash')
+def crash():
+    os._exit(1)
+
+
+class JobsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        metrics.reset()
+        del calls[:]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def worker(self, **kwargs):
+        return Worker(self.app, 'testing', processes=0, schedule=False, **kwargs)
+
+    def test_run_jobs(self):
+        for i in range(5):
+            enqueue('test_record', {'value': i})
+        enqueue('test_record', {'value': 99}, run_at=utcnow() + timedelta(hours=1))
+        stats = self.worker(batch_size=2).run(once=True)
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+        self.assertEqual(stats['executed'], 5)
+        self.assertEqual(Job.query.filter_by(status='done').count(), 5)
+        self.assertEqual(Job.query.filter_by(status='queued').count(), 1)
+        self.assertEqual(metrics.jobs['test_record']['latency'].count, 5)
+        self.assertIn('flasky_job_seconds_count{job="test_record"} 5',
+                      metrics.export().get_data(as_text=True))
+
+    def test_retry_then_fail(self):
+        self.app.config['JOBS_RETRY_BACKOFF'] = 0
+        job = enqueue('test_fail', max_attempts=2)
+        stats = self.worker().run(once=True)
+        job = db.session.get(Job, job.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('boom', job.error)
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(metrics.jobs['test_fail']['failed'], 2)
+
+    def test_claim_once(self):
+        for i in range(3):
+            enqueue('test_record', {'value': i})
+        first = claim('a', 2)
+        second = claim('b', 2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(claim('c', 2), [])
+        # 认领后超时的任务重新排队
+        db.session.query(Job).update({'started_at': utcnow() - timedelta(hours=1)})
+        db.session.commit()
+        self.assertEqual(requeue_stale(600), 3)
+        self.assertEqual(len(claim('d', 10)), 3)
+
+    def test_stale_job_out_of_attempts_failed(self):
+        job = enqueue('test_record', {'value': 1}, max_attempts=1)
+        claim('a', 1)
+        db.session.query(Job).update({'started_at': utcnow() - timedelta(hours=1)})
+        db.session.commit()
+        self.assertEqual(requeue_stale(600), 1)
+        job = db.session.get(Job, job.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('TimeoutError', job.error)
+        self.assertEqual(claim('b', 1), [])
+
+    # 超时后被重新认领的任务，原来的 worker 不能再记录结果
+    def test_finish_requires_claim_token(self):
+        job = enqueue('test_record', {'value': 1})
+        token = claim('a', 1)[0][-1]
+        db.session.query(Job).update({'started_at': utcnow() - timedelta(hours=1)})
+        db.session.commit()
+        requeue_stale(600)
+        new_token = claim('b', 1)[0][-1]
+        self.assertFalse(finish(job.id, None, token))
+        job = db.session.get(Job, job.id)
+        self.assertEqual((job.status, job.locked_by), ('running', new_token))
+        self.assertTrue(finish(job.id, None, new_token))
+        self.assertEqual(db.session.get(Job, job.id).status, 'done')
+
+    def test_broken_pool_restarted(self):
+        crashed = enqueue('test_crash', max_attempts=1)
+        done = enqueue('test_noop')
+        worker = Worker(self.app, 'testing', processes=1, batch_size=1, schedule=False)
+        stats = worker.run(once=True)
+        self.assertEqual(stats['executed'], 2)
+        crashed = db.session.get(Job, crashed.id)
+        self.assertEqual(crashed.status, 'failed')
+        self.assertIn('BrokenProcessPool', crashed.error)
+        self.assertEqual(db.session.get(Job, done.id).status, 'done')
+
+    def test_schedule_dedup(self):
+        self.app.config['JOBS_SCHEDULE'] = {'test_record': {'cron': '* * * * *',
+                                                            'args': {'value': 1}}}
+        workers = [Worker(self.app, 'testing', processes=0) for _ in range(2)]
+        past = utcnow() - timedelta(minutes=3)
+        for w in workers:
+            w._next_runs['test_record'] = cron_next('* * * * *', past)
+            w.schedule_due()
+        self.assertEqual(Job.query.filter_by(name='test_record').count(), 3)
+
+    def test_cron_next(self):
+        t = datetime(2024, 1, 31, 23, 59, 30)
+        self.assertEqual(cron_next('*/15 * * * *', t), datetime(2024, 2, 1, 0, 0))
+        self.assertEqual(cron_next('0 3 * * *', t), datetime(2024, 2, 1, 3, 0))
+        self.assertEqual(cron_next('30 9 * * 1-5', datetime(2024, 2, 2, 10, 0)),
+                         datetime(2024, 2, 5, 9, 30))
+        self.assertEqual(cron_next('0 0 29 2 *', t), datetime(2024, 2, 29, 0, 0))
+
+    def test_purge_unconfirmed(self):
+        old = utcnow() - timedelta(days=30)
+        users = [User(email='u%d@example.com' % i, username='u%d' % i, password_hash='x',
+                      confirmed=i % 2 == 0, member_since=old) for i in range(10)]
+        users.append(User(email='new@example.com', username='new', password_hash='x'))
+        db.session.add_all(users)
+        db.session.commit()
+        self.assertEqual(TASKS['purge_unconfirmed'](batch_size=2), 5)
+        self.assertEqual(User.query.count(), 6)
+        self.assertEqual(User.query.filter_by(confirmed=False).count(), 1)
+
+    def test_purge_jobs(self):
+        enqueue('test_record', {'value': 1})
+        self.worker().run(once=True)
+        db.session.query(Job).update({'finished_at': utcnow() - timedelta(days=30)})
+        db.session.commit()
+        enqueue('test_record', {'value': 2})
+        self.assertEqual(TASKS['purge_jobs'](), 1)
+        self.assertEqual(Job.query.count(), 1)
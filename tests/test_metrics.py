@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+from app import create_app, db
+from app.metrics import metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        metrics.sample_rate = 1.0
+        metrics.reset()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_request_instrumented(self):
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        ep = metrics.snapshot()['auth.login']
+        self.assertEqual(ep['count'], 1)
+        self.assertGreater(ep['template_time'], 0)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'flasky_request_latency_seconds_count{endpoint="auth.login"} 1',
+                      response.data)
+
+    def test_sampling_off(self):
+        metrics.sample_rate = 0.0
+        self.client.get('/')
+        self.assertEqual(metrics.snapshot(), {})
+
+    # 每个请求都计数，抽中的请求按抽样比例的倒数加权
+    def test_sampled_counts_scaled(self):
+        metrics.sample_rate = 0.5
+        with mock.patch('random.random', side_effect=[0.1, 0.9, 0.1, 0.9]):
+            for _ in range(4):
+                self.client.get('/auth/login')
+        data = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('flasky_requests_total{endpoint="auth.login"} 4', data)
+        self.assertIn('flasky_request_latency_seconds_count{endpoint="auth.login"} 4', data)
+
+    def test_endpoint_protected(self):
+        response = self.client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(response.status_code, 403)
+        self.app.config['METRICS_TOKEN'] = 'secret'
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'},
+                                   headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,24 @@
+import os
+import unittest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import inspect
+from app import db
+from tests.base import create_test_app
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+class MigrationsTestCase(unittest.TestCase):
+    # 空数据库上依次执行所有迁移，得到的结构与模型一致（autogenerate 不会生成任何操作）
+    def test_upgrade_empty_database(self):
+        app = create_test_app(self, 'sqlite', FLASKY_LAZY_MIGRATE=False)
+        with app.app_context():
+            upgrade(directory=MIGRATIONS)
+            with db.engine.connect() as conn:
+                self.assertEqual(compare_metadata(MigrationContext.configure(conn), db.metadata),
+                                 [])
+            downgrade(directory=MIGRATIONS, revision='base')
+            self.assertEqual(set(inspect(db.engine).get_table_names()) & set(db.metadata.tables),
+                             set())
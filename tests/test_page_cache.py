@@ -0,0 +1,82 @@
+import unittest
+from flask import template_rendered
+from app import create_app, db
+from app.models import User, Role
+from app.pagecache import page_cache
+
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.rendered = []
+        template_rendered.connect(self._record, self.app)
+
+    def tearDown(self):
+        template_rendered.disconnect(self._record, self.app)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _record(self, sender, template, context, **extra):
+        self.rendered.append(template.name)
+
+    def test_anonymous_index_cached(self):
+        response = self.client.get('/')
+        etag = response.headers['ETag']
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertIn(b'Stranger', response.data)
+        self.assertEqual(self.rendered, ['index.html'])
+        self.assertEqual(page_cache.hits, 1)
+
+        # 条件请求
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_authenticated_not_cached(self):
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        self.client.get('/')
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        response = self.client.get('/')
+        self.assertIn(b'Hello, john!', response.data)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_flashed_message_not_cached(self):
+        self.client.get('/')
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('message', 'You have been logged out.')]
+        response = self.client.get('/')
+        self.assertIn(b'You have been logged out.', response.data)
+        response = self.client.get('/')
+        self.assertNotIn(b'You have been logged out.', response.data)
+
+    def test_error_pages_prerendered(self):
+        self.assertEqual(sorted(code for code, _ in page_cache.error_pages),
+                         [400, 403, 404, 429, 500])
+        response = self.client.get('/no-such-page')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(b'Page Not Found', response.data)
+        self.assertEqual(self.rendered, [])
+
+    # 挂载在其他路径下时，错误页面和缓存的页面中的链接带有该路径
+    def test_script_root(self):
+        self.client.get('/')
+        response = self.client.get('/no-such-page')
+        self.assertNotIn(b'/flasky/', response.data)
+        for _ in range(2):
+            response = self.client.get('/no-such-page', base_url='http://localhost/flasky')
+            self.assertEqual(response.status_code, 404)
+            self.assertIn(b'href="/flasky/"', response.data)
+            response = self.client.get('/', base_url='http://localhost/flasky')
+            self.assertIn(b'href="/flasky/"', response.data)
+        self.assertNotIn(b'/flasky/', self.client.get('/').data)
@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+from app import create_app, db
+from app.models import User
+from app.passwords import PasswordHasher, PasswordHasherBusy, hasher
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_configured_method(self):
+        hasher = PasswordHasher(self.app)
+        pwhash = hasher.hash('cat')
+        self.assertTrue(pwhash.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(hasher.verify(pwhash, 'cat'))
+        self.assertFalse(hasher.needs_rehash(pwhash))
+
+    def test_pool(self):
+        self.app.config['PASSWORD_HASH_WORKERS'] = 2
+        hasher = PasswordHasher(self.app)
+        try:
+            self.assertTrue(hasher.verify(hasher.hash('cat'), 'cat'))
+        finally:
+            hasher.shutdown()
+
+    def test_busy(self):
+        self.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=0,
+                               PASSWORD_HASH_TIMEOUT=0.01)
+        hasher = PasswordHasher(self.app)
+        hasher._slots.acquire()
+        with self.assertRaises(PasswordHasherBusy):
+            hasher.hash('cat')
+
+    # 用另一种哈希参数创建用户，当前配置下它的哈希已经过时
+    def add_user_with_outdated_hash(self):
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        hasher.init_app(self.app)
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        hasher.init_app(self.app)
+        self.assertTrue(hasher.needs_rehash(u.password_hash))
+        return u
+
+    def test_rehash_on_login(self):
+        u = self.add_user_with_outdated_hash()
+        old_hash = u.password_hash
+        self.assertFalse(u.verify_password('dog'))
+        self.assertEqual(u.password_hash, old_hash)
+        self.assertTrue(u.verify_password('cat'))
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(u.verify_password('cat'))
+
+    # 重新计算哈希时排队过多，登录仍然成功，只是跳过升级
+    def test_rehash_skipped_when_busy(self):
+        u = self.add_user_with_outdated_hash()
+        old_hash = u.password_hash
+        with mock.patch.object(hasher, 'hash', side_effect=PasswordHasherBusy):
+            self.assertTrue(u.verify_password('cat'))
+        self.assertEqual(u.password_hash, old_hash)
+        self.assertNotIn(u, db.session.dirty)
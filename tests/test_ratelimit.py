@@ -0,0 +1,91 @@
+import unittest
+from unittest import mock
+from app import create_app, db
+from app.models import User
+from config import config
+from app.ratelimit import LocalRateLimitStore, RateLimiter
+
+
+class RateLimitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['RATELIMIT_LIMITS'] = {'login': {'ip': (5, 60), 'account': (2, 60)}}
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_store_eviction(self):
+        store = LocalRateLimitStore(maxsize=2)
+        for key in 'abc':
+            store.incr(key, expires=2e9)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get('a'), 0)
+        self.assertEqual(store.incr('c', expires=2e9), 2)
+
+    def test_sliding_window(self):
+        limiter = RateLimiter(self.app)
+        with mock.patch('time.time', return_value=1000.0):
+            for _ in range(3):
+                self.assertTrue(limiter.hit('k', 3, 10)[0])
+            self.assertFalse(limiter.hit('k', 3, 10)[0])
+        # 下一个窗口过半时，上一个窗口的 4 次请求按一半计入
+        with mock.patch('time.time', return_value=1015.0):
+            self.assertTrue(limiter.hit('k', 3, 10)[0])
+            self.assertFalse(limiter.hit('k', 3, 10)[0])
+
+    def login(self, email, ip='127.0.0.1'):
+        return self.client.post('/auth/login', data={'email': email, 'password': 'cat'},
+                           environ_base={'REMOTE_ADDR': ip})
+
+    def test_login_limited_by_account_and_ip(self):
+        self.assertEqual(self.login('john@example.com').status_code, 200)
+        self.assertEqual(self.login('john@example.com').status_code, 200)
+        response = self.login('John@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(self.login('susan@example.com').status_code, 200)
+        self.assertEqual(self.login('david@example.com').status_code, 200)
+        self.assertEqual(self.login('mary@example.com').status_code, 429)
+        self.assertEqual(self.client.get('/auth/login').status_code, 200)
+
+    # 登录的账户限制只统计密码错误：主人正常登录不受影响，从多个地址猜测密码仍受限制
+    def test_login_account_counts_failures(self):
+        db.session.add(User(email='john@example.com', password='cat', confirmed=True))
+        db.session.commit()
+        for _ in range(3):
+            self.assertEqual(self.login('john@example.com', ip='10.0.0.1').status_code, 302)
+            self.client.get('/auth/logout')
+        for ip in ('10.0.0.2', '10.0.0.3'):
+            response = self.client.post('/auth/login', environ_base={'REMOTE_ADDR': ip},
+                                        data={'email': 'john@example.com', 'password': 'dog'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.login('john@example.com', ip='10.0.0.4').status_code, 429)
+
+    # 重置密码邮件按账户计数，与请求来自哪个地址无关
+    def test_reset_limited_per_account(self):
+        self.app.config['RATELIMIT_LIMITS'] = {'reset': {'ip': (10, 60), 'account': (2, 60)}}
+        for i, expected in enumerate([302, 302, 429]):
+            response = self.client.post('/auth/reset', data={'email': 'john@example.com'},
+                                        environ_base={'REMOTE_ADDR': '10.0.0.%d' % i})
+            self.assertEqual(response.status_code, expected)
+
+    def test_proxy_fix(self):
+        with mock.patch.object(config['testing'], 'FLASKY_PROXY_FIX', 1):
+            app = create_app('testing')
+        app.config['RATELIMIT_LIMITS'] = {'login': {'ip': (1, 60)}}
+        client = app.test_client()
+        # 所有请求都来自代理的地址，按 X-Forwarded-For 中的客户端地址分别计数
+        for ip in ('10.0.0.1', '10.0.0.2'):
+            response = client.post('/auth/login', data={'email': 'john@example.com'},
+                                   headers={'X-Forwarded-For': ip})
+            self.assertEqual(response.status_code, 200)
+        response = client.post('/auth/login', data={'email': 'john@example.com'},
+                               headers={'X-Forwarded-For': '10.0.0.1'})
+        self.assertEqual(response.status_code, 429)
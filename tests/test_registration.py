@@ -0,0 +1,81 @@
+import threading
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from app import db
+from app.models import User, Role
+from app.passwords import PasswordHasherBusy, hasher
+from tests.base import create_test_app
+
+
+class RegistrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app(self, 'sqlite')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        # 让角色注册表提前加载，不计入注册请求的查询数
+        User(email='warmup@example.com')
+        db.session.rollback()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, client, email, username):
+        return client.post('/auth/register', data={
+            'email': email, 'username': username, 'password': 'cat', 'password2': 'cat'})
+
+    def test_register_query_count(self):
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', before_execute)
+        try:
+            response = self.register(self.app.test_client(), 'john@example.com', 'john')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_execute)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sum(1 for s in statements if s.startswith('SELECT')
+                             and 'FROM users' in s and 'WHERE users.email' in s), 1)
+        self.assertLessEqual(len(statements), 3)
+
+    # 哈希任务排队过多时快速返回 503，不创建用户
+    def test_register_busy(self):
+        with mock.patch.object(hasher, 'hash', side_effect=PasswordHasherBusy):
+            response = self.register(self.app.test_client(), 'john@example.com', 'john')
+        self.assertEqual(response.status_code, 503)
+        db.session.remove()
+        self.assertIsNone(User.query.filter_by(email='john@example.com').first())
+
+    def test_duplicate_fields(self):
+        client = self.app.test_client()
+        self.register(client, 'john@example.com', 'john')
+        response = self.register(client, 'john@example.com', 'john')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Email already registered.', response.data)
+        self.assertIn(b'Username already in use.', response.data)
+
+    # 多个线程同时用相同的用户名注册，只能有一个成功，其余返回字段错误而不是 500
+    def test_concurrent_signups(self):
+        statuses = []
+        barrier = threading.Barrier(8)
+
+        def signup(i):
+            with self.app.app_context():
+                client = self.app.test_client()
+                barrier.wait()
+                response = self.register(client, 'user%d@example.com' % i, 'same')
+                statuses.append(response.status_code)
+                db.session.remove()
+        threads = [threading.Thread(target=signup, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(statuses.count(302), 1)
+        self.assertEqual(statuses.count(200), 7)
+        self.assertEqual(User.query.filter_by(username='same').count(), 1)
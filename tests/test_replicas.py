@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.cache import user_cache
+from app.models import CacheVersion, User, Role, load_user
+from config import config, TestingConfig
+
+
+# 主库和只读副本是两个 SQLite 文件，副本的数据只有在复制（复制文件）后才会更新
+class ReplicaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.primary = os.path.join(self.dir, 'primary.sqlite')
+        self.replica = os.path.join(self.dir, 'replica.sqlite')
+        config['replica-test'] = type('ReplicaTestConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + self.primary,
+            'SQLALCHEMY_BINDS': {'replica': 'sqlite:///' + self.replica},
+            'SQLALCHEMY_REPLICAS': ['replica'],
+            'WTF_CSRF_ENABLED': False,
+            'USER_CACHE_ENABLED': False,
+        })
+        self.app = create_app('replica-test')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.replicate()
+        Role.insert_roles()
+        self.replicate()
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        del config['replica-test']
+        # Flask-SQLAlchemy 为每个绑定创建的 MetaData 保存在全局的 db 上，其他测试的 drop_all 会用到
+        db.metadatas.pop('replica', None)
+        user_cache.clear()
+        shutil.rmtree(self.dir)
+
+    def replicate(self):
+        db.session.remove()
+        db.engines['replica'].dispose()
+        shutil.copy(self.primary, self.replica)
+
+    def add_user(self, email='john@example.com'):
+        u = User(email=email, username=email.split('@')[0], password='cat')
+        db.session.add(u)
+        db.session.commit()
+        return u
+
+    def test_reads_use_replica(self):
+        self.add_user()
+        db.session.remove()
+        self.assertIsNone(User.query.filter_by(email='john@example.com').first())
+        self.replicate()
+        self.assertIsNotNone(User.query.filter_by(email='john@example.com').first())
+
+    def test_read_your_writes(self):
+        u = self.add_user()
+        # 同一会话提交后仍从主库读取
+        self.assertIsNotNone(User.query.filter_by(email='john@example.com').first())
+        self.assertEqual(db.session.get(User, u.id).email, 'john@example.com')
+
+    def test_pending_writes_use_primary(self):
+        db.session.add(User(email='susan@example.com', username='susan', password='cat'))
+        self.assertIsNotNone(User.query.filter_by(email='susan@example.com').first())
+        db.session.rollback()
+
+    def test_writes_use_primary(self):
+        self.add_user()
+        self.replicate()
+        u = User.query.filter_by(email='john@example.com').first()
+        u.confirmed = True
+        db.session.add(u)
+        db.session.commit()
+        db.session.remove()
+        self.app.config['SQLALCHEMY_REPLICA_STICKY'] = 0
+        self.assertFalse(User.query.filter_by(email='john@example.com').first().confirmed)
+        self.replicate()
+        self.assertTrue(User.query.filter_by(email='john@example.com').first().confirmed)
+
+    # 管理员修改了其他用户的角色，该用户的请求没有粘滞，加载用户和角色版本号仍使用主库
+    def test_user_loading_uses_primary(self):
+        user_id = self.add_user().id
+        self.replicate()
+        version = CacheVersion.get('roles')
+        admin = Role.query.filter_by(name='Administrator').first()
+        db.session.get(User, user_id).role = admin
+        db.session.commit()
+        db.session.remove()
+        self.assertEqual(load_user(str(user_id)).role.name, 'Administrator')
+        self.assertGreater(CacheVersion.get('roles'), version)
+        # 其他只读查询仍然读取副本
+        db.session.remove()
+        self.assertEqual(User.query.filter_by(id=user_id).first().role.name, 'User')
+
+    # 注册后立即登录，请求不在测试的应用上下文中执行，每个请求使用新的数据库会话
+    def register_and_login(self):
+        db.session.remove()
+        self.app_context.pop()
+        try:
+            client = self.app.test_client()
+            response = client.post('/auth/register', data={
+                'email': 'john@example.com', 'username': 'john',
+                'password': 'cat', 'password2': 'cat'})
+            self.assertEqual(response.status_code, 302)
+            return client.post('/auth/login', data={
+                'email': 'john@example.com', 'password': 'cat'})
+        finally:
+            self.app_context.push()
+
+    def test_sticky_across_requests(self):
+        # 副本中还没有新用户，登录查询在粘滞时间内使用主库
+        response = self.register_and_login()
+        self.assertEqual(response.status_code, 302)
+
+    def test_no_sticky_reads_replica(self):
+        self.app.config['SQLALCHEMY_REPLICA_STICKY'] = 0
+        response = self.register_and_login()
+        self.assertIn(b'Invalid email or password.', response.data)
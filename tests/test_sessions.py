@@ -0,0 +1,93 @@
+import unittest
+from app import create_app, db
+from app.cache import LocalCache
+from app.models import User, Role
+from app.sessions import ServerSessionInterface
+
+
+# 记录存储访问次数
+class CountingStore(LocalCache):
+    def __init__(self):
+        super().__init__(maxsize=100, ttl=60)
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return super().get(key)
+
+
+class ServerSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = CountingStore()
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['SESSION_STORE'] = self.store
+        self.app.session_interface = ServerSessionInterface(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        self.app_context.pop()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app_context.push()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        return self.client.post('/auth/login', data={'email': 'john@example.com',
+                                                     'password': 'cat'})
+
+    def test_login_logout(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 302)
+        sid = self.client.get_cookie('session').value
+        self.assertEqual(len(sid), 43)
+        self.assertIn('session:' + sid, self.store._data)
+        response = self.client.get('/')
+        self.assertIn(b'Hello, john!', response.data)
+        # 会话 ID 不变时不再发送 cookie
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.client.get('/auth/logout', follow_redirects=True)
+        response = self.client.get('/')
+        self.assertIn(b'Stranger', response.data)
+
+    def test_no_cookie_no_store_access(self):
+        self.client.get('/static/favicon.ico').close()
+        self.client.get('/healthz')
+        self.assertEqual(self.store.gets, 0)
+        self.assertIsNone(self.client.get_cookie('session'))
+
+    def test_unknown_sid_replaced(self):
+        self.client.set_cookie('session', 'forged')
+        self.login()
+        sid = self.client.get_cookie('session').value
+        self.assertNotEqual(sid, 'forged')
+        self.assertNotIn('session:forged', self.store._data)
+
+    # 登录前的会话 ID（可能由攻击者设置）在登录后失效
+    def test_sid_rotated_on_login(self):
+        interface = self.app.session_interface
+        self.store.set('session:fixed', interface.serializer.dumps({'next': '/'}))
+        self.client.set_cookie('session', 'fixed')
+        self.login()
+        sid = self.client.get_cookie('session').value
+        self.assertNotEqual(sid, 'fixed')
+        self.assertNotIn('session:fixed', self.store._data)
+        attacker = self.app.test_client()
+        attacker.set_cookie('session', 'fixed')
+        self.assertIn(b'Stranger', attacker.get('/').data)
+        self.assertIn(b'Hello, john!', self.client.get('/').data)
+
+    def test_sid_rotated_on_logout(self):
+        self.login()
+        sid = self.client.get_cookie('session').value
+        self.client.get('/auth/logout')
+        self.assertNotIn('session:' + sid, self.store._data)
+        cookie = self.client.get_cookie('session')
+        self.assertTrue(cookie is None or cookie.value != sid)
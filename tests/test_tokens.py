@@ -0,0 +1,72 @@
+import unittest
+from app import create_app, db
+from app.models import User, Role
+from app.tokens import TokenService, tokens
+
+
+class TokenServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_purposes_are_separate(self):
+        s = TokenService(self.app)
+        token = s.generate('reset', {'reset': 1})
+        self.assertIsNone(s.verify('confirm', token))
+        self.assertEqual(s.verify('reset', token)['reset'], 1)
+
+    def test_key_rotation(self):
+        old = TokenService(self.app)
+        token = old.generate('confirm', {'confirm': 1})
+        self.app.config['SECRET_KEY_FALLBACKS'] = [self.app.config['SECRET_KEY']]
+        self.app.config['SECRET_KEY'] = 'new secret'
+        new = TokenService(self.app)
+        self.assertEqual(new.verify('confirm', token)['confirm'], 1)
+        self.assertIsNone(old.verify('confirm', new.generate('confirm', {'confirm': 1})))
+
+    def test_bad_token_cached(self):
+        s = TokenService(self.app)
+        token = s.generate('confirm', {'confirm': 1}) + 'a'
+        self.assertIsNone(s.verify('confirm', token))
+        s._serializers['confirm'] = None
+        self.assertIsNone(s.verify('confirm', token))
+
+    def test_reset_token_replay_rejected(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        token = u.generate_reset_token()
+        self.assertTrue(User.reset_password(token, 'dog'))
+        self.assertFalse(User.reset_password(token, 'horse'))
+        self.assertTrue(u.verify_password('dog'))
+
+    # 令牌绑定在密码哈希上，清空否定缓存（或在另一个进程中）后重放仍被拒绝
+    def test_reset_token_replay_rejected_in_other_process(self):
+        u = User(password='cat')
+        db.session.add(u)
+        db.session.commit()
+        token = u.generate_reset_token()
+        self.assertTrue(User.reset_password(token, 'dog'))
+        db.session.commit()
+        tokens.rejected.clear()
+        self.assertFalse(User.reset_password(token, 'horse'))
+        self.assertTrue(u.verify_password('dog'))
+
+    def test_email_change_token_replay_rejected(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        token = u.generate_email_change_token('susan@example.org')
+        self.assertTrue(u.change_email(token))
+        db.session.commit()
+        tokens.rejected.clear()
+        self.assertFalse(u.change_email(token))
+        self.assertEqual(u.email, 'susan@example.org')
@@ -0,0 +1,121 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.cache import LocalCache, user_cache
+from app.models import CacheVersion, User, Role, Permission, load_user
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 统计执行的 SQL 语句数量
+    def count_queries(self, func):
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', before_execute)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_execute)
+        return result, len(statements)
+
+    def add_user(self):
+        r = Role(name='User', permissions=Permission.FOLLOW)
+        u = User(email='john@example.com', username='john', password='cat', role=r)
+        db.session.add_all([r, u])
+        db.session.commit()
+        user_id = u.id
+        db.session.remove()
+        return user_id
+
+    def test_local_cache_lru(self):
+        c = LocalCache(maxsize=2, ttl=60)
+        c.set('a', 1)
+        c.set('b', 2)
+        c.get('a')
+        c.set('c', 3)
+        self.assertEqual(c.get('a'), 1)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.get('c'), 3)
+
+    def test_local_cache_ttl(self):
+        c = LocalCache(maxsize=2, ttl=-1)
+        c.set('a', 1)
+        self.assertIsNone(c.get('a'))
+
+    def test_cached_load_user_runs_no_queries(self):
+        user_id = self.add_user()
+        # 角色版本号在进程内缓存 USER_CACHE_VERSION_TTL 秒，不计入
+        user_cache.role_version
+        u, n = self.count_queries(lambda: load_user(str(user_id)))
+        self.assertEqual(n, 1)
+        self.assertTrue(u.can(Permission.FOLLOW))
+        db.session.remove()
+        u, n = self.count_queries(lambda: load_user(str(user_id)))
+        self.assertEqual(n, 0)
+        self.assertEqual(u.username, 'john')
+        self.assertTrue(u.can(Permission.FOLLOW))
+        self.assertFalse(u.can(Permission.ADMIN))
+        self.assertEqual(user_cache.hit_ratio, 0.5)
+
+    def test_password_hash_loaded_on_demand(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        db.session.remove()
+        u = load_user(str(user_id))
+        self.assertTrue(u.verify_password('cat'))
+
+    def test_invalidate(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        user_cache.invalidate(user_id)
+        db.session.remove()
+        u, n = self.count_queries(lambda: load_user(str(user_id)))
+        self.assertEqual(n, 1)
+
+    # 提交之前缓存条目保留，提交之后才删除；回滚时不删除
+    def test_invalidate_after_commit(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        u = db.session.get(User, user_id)
+        token = u.generate_email_change_token('susan@example.org')
+        self.assertTrue(u.change_email(token))
+        self.assertIsNotNone(user_cache.get(user_id))
+        db.session.rollback()
+        self.assertIsNotNone(user_cache.get(user_id))
+        u = db.session.get(User, user_id)
+        self.assertTrue(u.change_email(token))
+        db.session.commit()
+        self.assertIsNone(user_cache.get(user_id))
+
+    # 其他进程修改角色后，本进程在版本号缓存过期后不再使用旧的缓存条目
+    def test_role_change_in_another_process(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(CacheVersion.__table__.update().values(version=CacheVersion.version + 1))
+            conn.execute(Role.__table__.update().values(permissions=Permission.ADMIN))
+        self.assertTrue(load_user(str(user_id)).can(Permission.FOLLOW))
+        db.session.remove()
+        user_cache._version_expires = 0
+        u = load_user(str(user_id))
+        self.assertTrue(u.can(Permission.ADMIN))
+        self.assertFalse(u.can(Permission.FOLLOW))
+
+    def test_insert_roles_clears_cache(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        Role.insert_roles()
+        self.assertEqual(len(user_cache.backend), 0)
@@ -1,20 +1,14 @@
-import unittest
 import time
-from app import create_app, db
+from sqlalchemy import event
+from app import db
 from app.models import User, Permission, Role, AnonymousUser
+from tests.base import TransactionalTestCase
 
 
-class UserModelTestCase(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app('testing')
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
+class UserModelTestCase(TransactionalTestCase):
+    @classmethod
+    def create_fixtures(cls):
+        Role.insert_roles()
 
     # 测试密码设置
     def test_password_setter(self):
@@ -139,4 +133,29 @@ class UserModelTestCase(unittest.TestCase):
         self.assertFalse(u.can(Permission.COMMENT)) 
         self.assertFalse(u.can(Permission.WRITE))
         self.assertFalse(u.can(Permission.MODERATE))
-        self.assertFalse(u.can(Permission.ADMIN))
\ No newline at end of file
+        self.assertFalse(u.can(Permission.ADMIN))
+
+    # 创建多个用户时，角色只在第一次时查询
+    def test_role_lookup_query_count(self):
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            # 测试事务的保存点，以及每 USER_CACHE_VERSION_TTL 秒一次的角色版本号读取不计入
+            if not statement.startswith('SAVEPOINT') and 'cache_versions' not in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', before_execute)
+        try:
+            users = [User(email='user%d@example.com' % i, password='cat') for i in range(10)]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_execute)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(all(u.role.name == 'User' for u in users))
+
+    def test_role_registry_follows_insert_roles(self):
+        self.assertTrue(User(password='cat').can(Permission.WRITE))
+        r = Role.query.filter_by(name='User').first()
+        r.remove_permission(Permission.WRITE)
+        db.session.commit()
+        self.assertFalse(User(password='cat').can(Permission.WRITE))
+        Role.insert_roles()
+        self.assertTrue(User(password='cat').can(Permission.WRITE))